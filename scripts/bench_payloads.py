@@ -0,0 +1,146 @@
+"""Benchmark: recuperação tolerante de JSON (utils.payloads).
+
+Uso:
+    PYTHONPATH=src python scripts/bench_payloads.py [--mb 2] [--repeat 3]
+
+Compara a implementação atual (passada única) com a legada (varredura a partir de cada
+abertura, O(n²)) em entradas patológicas e confere que ambas recuperam o mesmo objeto. A
+legada só roda até --legacy-max-mb para não travar o benchmark. Os casos de regressão ficam
+em tests/test_payloads.py.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from batch_openai.utils import payloads as pl  # noqa: E402
+
+
+# -------- implementação legada (referência) --------
+
+def legacy_normalize_chars(text):
+    text = text.replace("“", '"').replace("”", '"').replace("„", '"').replace("‟", '"')
+    text = text.replace("‘", "'").replace("’", "'")
+    return "".join(ch for ch in text if ch >= " " or ch in "\t\n\r")
+
+
+def legacy_sanitize(text):
+    s = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    s = re.sub(r"(^|\s)//.*$", "", s, flags=re.M)
+    s = re.sub(r"^\s*#.*$", "", s, flags=re.M)
+    s = re.sub(r",\s*([}\]])", r"\1", s)
+    res, in_str, esc = [], False, False
+    for ch in s:
+        if in_str:
+            res.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            res.append(ch)
+            in_str = True
+        elif ch != "*":
+            res.append(ch)
+    return "".join(res)
+
+
+def legacy_blocks(txt):
+    blocks = []
+    for opener, closer in (("{", "}"), ("[", "]")):
+        i = txt.find(opener)
+        while i != -1:
+            depth, in_str, esc = 0, False, False
+            for j in range(i, len(txt)):
+                ch = txt[j]
+                if in_str:
+                    if esc:
+                        esc = False
+                    elif ch == "\\":
+                        esc = True
+                    elif ch == '"':
+                        in_str = False
+                elif ch == '"':
+                    in_str = True
+                elif ch == opener:
+                    depth += 1
+                elif ch == closer:
+                    depth -= 1
+                    if depth == 0:
+                        blocks.append(txt[i : j + 1])
+                        break
+            i = txt.find(opener, i + 1)
+    return blocks
+
+
+def legacy_decode(raw):
+    text = legacy_normalize_chars(pl._decode_bytes(raw))
+    payload = pl._json_loads_loose(text)
+    if payload is None:
+        payload = pl._json_loads_loose(legacy_sanitize(text))
+    if payload is None:
+        for block in legacy_blocks(text):
+            payload = pl._json_loads_loose(block)
+            if payload is not None:
+                break
+    if payload is None:
+        raise ValueError("conteúdo inválido: não é JSON")
+    return payload
+
+
+# -------- entradas patológicas --------
+
+def pathological_inputs(target_bytes):
+    """Entradas que degradam a versão legada: muitas aberturas sem fechamento e lixo entre blocos."""
+    n = target_bytes // 2
+    yield "aberturas", "{[" * n
+    unit = '{"k": "v", "n": [1, 2, 3], '
+    yield "objeto-truncado", "{" + unit * (target_bytes // len(unit))
+    item = '{"name": "dep", "node_lines": 10, "content": "If x Then Call Y()"}, // comentário\n'
+    body = item * (target_bytes // len(item))
+    yield "comentarios+virgulas", '/* gerado */ {"deps": [\n' + body + "],\n}"
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            result = fn()
+        except ValueError as e:
+            result = e
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=2.0)
+    ap.add_argument("--legacy-max-mb", type=float, default=0.01,
+                    help="tamanho máximo em que a versão legada também é medida")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    for size_mb in sorted({args.legacy_max_mb, args.mb}):
+        target = int(size_mb * 1024 * 1024)
+        for label, text in pathological_inputs(target):
+            raw = text.encode("utf-8")
+            t_new, r_new = _time(lambda: pl.decode_payload_bytes(raw), args.repeat)
+            line = f"{label:22s} {len(raw) / 1e6:7.2f} MB | atual {t_new * 1000:9.1f} ms"
+            if size_mb <= args.legacy_max_mb:
+                t_old, r_old = _time(lambda: legacy_decode(raw), 1)
+                same = (json.dumps(r_old, sort_keys=True, default=str) == json.dumps(r_new, sort_keys=True, default=str)
+                        if not isinstance(r_new, Exception) else isinstance(r_old, Exception))
+                line += f" | legado {t_old * 1000:9.1f} ms | speedup {t_old / t_new:8.1f}x | mesmo resultado: {same}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
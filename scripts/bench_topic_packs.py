@@ -0,0 +1,131 @@
+"""Benchmark: build_topic_packs (scanner de passada única) vs. extração legada (várias passadas).
+
+Uso:
+    PYTHONPATH=src python scripts/bench_topic_packs.py [--mb 10] [--repeat 3]
+
+Gera dois códigos sintéticos VB6 de ~N MB: "denso" (controle/chamadas em quase toda linha,
+caso comum em que os limites enchem cedo) e "esparso" (poucas linhas relevantes, força a
+varredura completa).
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from batch_openai.tools import input_builder as ib  # noqa: E402
+
+
+# -------- implementação legada (referência) --------
+
+def _legacy_first_n_lines(text, n):
+    return "\n".join(text.splitlines()[:n])
+
+
+def _legacy_skeleton(text, max_lines=200):
+    lines = []
+    for ln in text.splitlines():
+        if any(kw in ln for kw in ("if", "else", "for", "foreach", "while", "switch", "case", "return")):
+            lines.append(ln)
+        if len(lines) >= max_lines:
+            break
+    return "\n".join(lines[:max_lines])
+
+
+def _legacy_rules(text, max_rules=20):
+    patt = re.compile(r"\b(if|validate|valida|erro|error|throw|return)\b", re.IGNORECASE)
+    rules = []
+    for ln in text.splitlines():
+        if patt.search(ln):
+            rules.append(f"- {ln.strip()}")
+        if len(rules) >= max_rules:
+            break
+    return "\n".join(rules)
+
+
+def _legacy_sequence(text, max_lines=180):
+    patt = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*\.)?[A-Za-z_][A-Za-z0-9_]*\s*\(")
+    calls = []
+    for ln in text.splitlines():
+        if patt.search(ln):
+            calls.append(ln.strip())
+        if len(calls) >= max_lines:
+            break
+    return "\n".join(calls)
+
+
+def legacy_packs(content):
+    rules_txt = _legacy_rules(content, 20)
+    return {
+        "resumo": _legacy_first_n_lines(content, 120) or content,
+        "fluxo_execucao": _legacy_skeleton(content, 200) or _legacy_first_n_lines(content, 200),
+        "regras_negocio": _legacy_first_n_lines(content, 200),
+        "diagram_activity": _legacy_skeleton(content, 150) or _legacy_first_n_lines(content, 150),
+        "diagram_sequence": _legacy_sequence(content, 180),
+        "rules": rules_txt,
+    }
+
+
+# -------- entradas sintéticas --------
+
+def make_dense(target_bytes):
+    block = (
+        "Private Sub Processa{i}(ByVal id As Long)\n"
+        "    If id = 0 Then\n"
+        "        Err.Raise 5, , \"id invalido\"\n"
+        "    End If\n"
+        "    total = CalculaTotal(id)\n"
+        "    For j = 1 To total\n"
+        "        Call GravaItem(j)\n"
+        "    Next\n"
+        "End Sub\n"
+    )
+    parts, size, i = [], 0, 0
+    while size < target_bytes:
+        b = block.format(i=i)
+        parts.append(b)
+        size += len(b)
+        i += 1
+    return "".join(parts)
+
+
+def make_sparse(target_bytes):
+    filler = "    Dim valor_{i} As String ' variavel auxiliar sem logica\n"
+    parts, size, i = [], 0, 0
+    while size < target_bytes:
+        b = filler.format(i=i)
+        if i % 5000 == 0:
+            b += "    If valor_1 = \"\" Then Call Valida(valor_1)\n"
+        parts.append(b)
+        size += len(b)
+        i += 1
+    return "".join(parts)
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=10.0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    target = int(args.mb * 1024 * 1024)
+
+    for label, content in (("denso", make_dense(target)), ("esparso", make_sparse(target))):
+        t_old = _time(lambda: legacy_packs(content), args.repeat)
+        t_new = _time(lambda: ib.build_topic_packs("bench", content, [], code_language="vb"), args.repeat)
+        print(f"{label:8s} {len(content) / 1e6:6.1f} MB | legado {t_old * 1000:9.1f} ms | "
+              f"passada única {t_new * 1000:9.1f} ms | speedup {t_old / t_new:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,37 @@
 from __future__ import annotations
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from .web.routers.batches import router as batches_router
+from .services.jobs import get_job_manager
+from .services.openai_client import close_clients
+from .services.poller import get_poller
+from .services.registry import get_registry
+from .services.scheduler import get_scheduler
+from .web.routers.batches import resume_jobs, router as batches_router
+from .web.routers.jobs import router as jobs_router
 from .web.routers.preview import router as preview_router
 
 
-app = FastAPI(title="Batch OpenAI API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # batches ainda em andamento voltam a ocupar o orçamento do scheduler; jobs interrompidos por
+    # restart/crash continuam de onde pararam (registro SQLite)
+    await get_scheduler().restore()
+    await resume_jobs()
+    yield
+    # cancela jobs em andamento, esvazia a fila do scheduler, para o poller, descarrega as escritas do registro
+    # e encerra o pool de conexões compartilhado com a OpenAI
+    await get_job_manager().shutdown()
+    await get_scheduler().shutdown()
+    await get_poller().shutdown()
+    await asyncio.to_thread(get_registry().flush)  # grava o que ainda está na fila de escrita
+    await close_clients()
+
+
+app = FastAPI(title="Batch OpenAI API", version="1.0.0", lifespan=lifespan)
 app.include_router(batches_router)
+app.include_router(jobs_router)
 app.include_router(preview_router)
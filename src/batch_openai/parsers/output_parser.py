@@ -1,11 +1,188 @@
 import json
+import re
 import sys
 from typing import Optional, Iterable, Dict, Any, List
 
-from ..utils.files import ensure_output_dir
+from ..services.result_store import get_store
+from ..tools.input_builder import COMBINED_TOPIC, DEFAULT_TOPICS
+from ..utils.files import ensure_output_dir, read_jsonl, safe_name
+from ..utils.usage import add_usage
 from pathlib import Path
 from collections import defaultdict
 
+# Delimitadores das partes de uma resposta combinada (prompts/06-doc-combined.md)
+_COMBINED_MARKER = re.compile(r"^[ \t]*<<<(" + "|".join(DEFAULT_TOPICS) + r")>>>[ \t]*$", re.MULTILINE)
+
+
+def split_combined(text: str) -> Dict[str, str]:
+    """Separa a resposta do tópico `combined` em {tópico: conteúdo} pelos delimitadores `<<<tópico>>>`."""
+    parts: Dict[str, str] = {}
+    marks = list(_COMBINED_MARKER.finditer(text or ""))
+    for i, m in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        body = text[m.end():end].strip()
+        if body and m.group(1) not in parts:
+            parts[m.group(1)] = body
+    return parts
+
+
+def combined_gaps(topic: Optional[str], content: str) -> List[str]:
+    """Tópicos sem delimitador numa resposta `combined` (todos, se não há nenhum); [] nos demais tópicos."""
+    if topic != COMBINED_TOPIC:
+        return []
+    parts = split_combined(content)
+    return [t for t in DEFAULT_TOPICS if t not in parts]
+
+
+def response_content(obj: Dict[str, Any]) -> Optional[str]:
+    """Conteúdo de uma linha de output.jsonl/errors.jsonl; None se a requisição falhou ou veio vazia."""
+    if obj.get("error"):
+        return None
+    resp = obj.get("response") or {}
+    if resp.get("status_code", 200) != 200:
+        return None
+    choices = (resp.get("body") or {}).get("choices") or []
+    message = choices[0].get("message") if choices and isinstance(choices[0], dict) else None
+    return (message or {}).get("content") or None
+
+
+def response_error(obj: Dict[str, Any]) -> str:
+    """Mensagem de erro de uma linha que falhou (erro do batch, erro HTTP ou resposta vazia)."""
+    err = obj.get("error")
+    if isinstance(err, dict) and (err.get("message") or err.get("code")):
+        return str(err.get("message") or err.get("code"))
+    if err:
+        return str(err)
+    resp = obj.get("response") or {}
+    body_err = (resp.get("body") or {}).get("error")
+    if isinstance(body_err, dict) and body_err.get("message"):
+        return str(body_err["message"])
+    status = resp.get("status_code", 200)
+    return f"status_code={status}" if status != 200 else "resposta sem conteúdo"
+
+
+def is_retryable(obj: Dict[str, Any]) -> bool:
+    """Falhas que vale reenviar: erro do batch (expirado/cancelado), 408/409/429, 5xx ou resposta vazia.
+
+    Demais 4xx (requisição inválida) falhariam de novo e não entram no retry.
+    """
+    status = (obj.get("response") or {}).get("status_code")
+    return not (status and 400 <= status < 500 and status not in (408, 409, 429))
+
+
+def retry_batch_ids(batch_id: str) -> List[str]:
+    """Batches de retry já criados para `batch_id` (outputs/<batch_id>/retries.json), em ordem."""
+    path = ensure_output_dir(batch_id) / "retries.json"
+    try:
+        return list(json.loads(path.read_text(encoding="utf-8")).get("retries") or [])
+    except (OSError, ValueError):
+        return []
+
+
+def add_retry_batch(batch_id: str, retry_id: str) -> None:
+    ids = retry_batch_ids(batch_id)
+    if retry_id not in ids:
+        ids.append(retry_id)
+    (ensure_output_dir(batch_id) / "retries.json").write_text(
+        json.dumps({"retries": ids}, indent=2), encoding="utf-8"
+    )
+
+
+def shard_batch_ids(batch_id: str) -> List[str]:
+    """Batches dos demais shards do mesmo manifest (outputs/<batch_id>/shards.json), em ordem."""
+    path = ensure_output_dir(batch_id) / "shards.json"
+    try:
+        return list(json.loads(path.read_text(encoding="utf-8")).get("shards") or [])
+    except (OSError, ValueError):
+        return []
+
+
+def set_shard_batches(batch_id: str, shard_ids: List[str]) -> None:
+    """Registra no primeiro shard os batches dos demais, para o parse juntar tudo no mesmo docs/."""
+    ids = [sid for sid in dict.fromkeys(shard_ids) if sid != batch_id]
+    (ensure_output_dir(batch_id) / "shards.json").write_text(
+        json.dumps({"shards": ids}, indent=2), encoding="utf-8"
+    )
+
+
+def _iter_result_lines(batch_id: str) -> Iterable[Dict[str, Any]]:
+    """Linhas de output.jsonl e errors.jsonl do batch e dos seus retries, nessa ordem."""
+    for bid in [batch_id, *retry_batch_ids(batch_id)]:
+        out_dir = ensure_output_dir(bid)
+        for name in ("output.jsonl", "errors.jsonl"):
+            path = out_dir / name
+            if not path.exists():
+                continue
+            with path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        obj = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Linha inválida ignorada: {line[:120]}", file=sys.stderr)
+                        continue
+                    if isinstance(obj, dict):
+                        obj["_source"] = name
+                        yield obj
+
+
+def _input_custom_ids(input_path: Path) -> Iterable[tuple]:
+    """(custom_id, linha bruta) de cada requisição de um input.jsonl."""
+    with input_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                cid = json.loads(line).get("custom_id")
+            except (ValueError, AttributeError):
+                continue
+            if cid:
+                yield cid, line if line.endswith("\n") else line + "\n"
+
+
+def build_retry_input(batch_id: str, attempt: int) -> Optional[Dict[str, Any]]:
+    """Monta outputs/<batch_id>/retry-NNN.jsonl com as requisições ainda sem resultado.
+
+    Entram as que faltam no output (batch expirado/cancelado), as que falharam com erro
+    reenviável (`is_retryable`) e respostas combinadas sem algum tópico (`combined_gaps`),
+    considerando o batch original e os retries anteriores.
+    O índice correspondente (retry-NNN.index.jsonl) acompanha, para o submit copiá-lo.
+    Retorna {path, requests} ou None se não há o que reenviar.
+    """
+    out_dir = ensure_output_dir(batch_id)
+    input_path = out_dir / "input.jsonl"
+    if not input_path.exists():
+        return None
+    succeeded: set = set()
+    last_failure: Dict[str, Dict[str, Any]] = {}
+    for obj in _iter_result_lines(batch_id):
+        cid = obj.get("custom_id")
+        content = response_content(obj)
+        if content is None:
+            last_failure[cid] = obj
+        elif not combined_gaps(_extract_meta_from_custom_id(cid).get("topic"), content):
+            # resposta combinada sem algum tópico fica de fora: entra no retry como as que faltam
+            succeeded.add(cid)
+    index = {r.get("custom_id"): r for r in read_jsonl(out_dir / "input.index.jsonl")}
+    retry_path = out_dir / f"retry-{attempt:03d}.jsonl"
+    index_path = out_dir / f"retry-{attempt:03d}.index.jsonl"
+    count = 0
+    with retry_path.open("w", encoding="utf-8") as fh, index_path.open("w", encoding="utf-8") as ifh:
+        for cid, line in _input_custom_ids(input_path):
+            if cid in succeeded or (cid in last_failure and not is_retryable(last_failure[cid])):
+                continue
+            fh.write(line)
+            if cid in index:
+                ifh.write(json.dumps(index[cid], ensure_ascii=False) + "\n")
+            count += 1
+    if count == 0:
+        retry_path.unlink()
+        index_path.unlink()
+        return None
+    return {"path": str(retry_path), "requests": count}
+
 
 def _extract_meta_from_custom_id(custom_id: str) -> Dict[str, Any]:
     meta: Dict[str, Any] = {"custom_id": custom_id}
@@ -36,18 +213,29 @@ def _extract_meta_from_custom_id(custom_id: str) -> Dict[str, Any]:
     return meta
 
 
-def parse(batch_id: str, *, force: bool = False, only: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+def parse(batch_id: str, *, force: bool = False, only: Optional[Iterable[str]] = None,
+          use_store: bool = True) -> Dict[str, Any]:
     """
     Converte output.jsonl em arquivos Markdown em outputs/<batch_id>/docs.
 
+    Lê também errors.jsonl e as saídas dos batches de retry (retries.json), na ordem: uma
+    requisição que falhou no original e deu certo num retry entra no mesmo docs/. Os demais
+    shards do mesmo manifest (shards.json) entram igualmente, com seus retries, índices e
+    input.jsonl, para que segmentos e final.md de um processo fiquem numa só árvore. Falhas não
+    geram arquivo (ficam como `failed` no índice) e requisições de input.jsonl sem nenhuma
+    linha de resultado ficam como `missing`, assim como cada tópico ausente de uma resposta
+    combinada (os presentes são gravados).
+
     - force: quando False, não reescreve arquivos já existentes (idempotente).
     - only: iterável de custom_ids a processar; quando None, processa todos.
+    - use_store: grava saídas bem-sucedidas no result store e incorpora os segmentos marcados
+      como `cached` em input.index.jsonl (modo incremental), compondo docs/ e final.md completos.
 
     Retorna resumo com contagens e caminho da pasta.
     """
     out_dir = ensure_output_dir(batch_id)
     output_path = out_dir / "output.jsonl"
-    if not output_path.exists():
+    if not output_path.exists() and not (out_dir / "errors.jsonl").exists():
         print(f"ERRO: {output_path} não existe.", file=sys.stderr)
         sys.exit(3)
 
@@ -57,79 +245,174 @@ def parse(batch_id: str, *, force: bool = False, only: Optional[Iterable[str]] =
     selected: Optional[set[str]] = set(only) if only else None
     processed = 0
     skipped = 0
+    from_store = 0
+    succeeded: set = set()
+    failures: Dict[str, str] = {}
+    # custom_id -> (meta, conteúdo, tópicos ausentes) das respostas combinadas incompletas
+    partial: Dict[str, tuple] = {}
     items_index = []
+    store = get_store() if use_store else None
+    # índice do builder (custom_id -> modelo/hash/cached); ausente em batches antigos
+    shards = [batch_id, *shard_batch_ids(batch_id)]
+    input_index = {r.get("custom_id"): r for sid in shards
+                   for r in read_jsonl(ensure_output_dir(sid) / "input.index.jsonl")}
+    # uso de tokens por rota do builder (tools/routing.py) e por tópico (inclui cached_tokens do prompt cache)
+    usage_by_route: Dict[str, Dict[str, Any]] = {}
+    usage_by_topic: Dict[str, Dict[str, Any]] = {}
 
     # Para montagem do final.md por processo
     proc_topic_segments: Dict[str, Dict[str, Dict[int, Path]]] = defaultdict(lambda: defaultdict(dict))
 
-    with output_path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError:
-                print(f"Linha inválida ignorada: {line[:120]}", file=sys.stderr)
-                continue
+    def _write_segment(cid: str, meta: Dict[str, Any], content: str, status: str) -> bool:
+        """Grava docs/<proc>/<topic>/seg-XXX.(md|puml); retorna False se já existia (skipped)."""
+        proc = meta.get("proc") or "_proc"
+        topic = meta.get("topic") or "_topic"
+        seg = int(meta.get("seg") or 0)
+        is_puml = topic in ("diagram_activity", "diagram_sequence")
+        proc_dir = docs_dir / safe_name(proc, "_proc") / safe_name(topic, "_topic")
+        proc_dir.mkdir(parents=True, exist_ok=True)
+        ext = ".puml" if is_puml else ".md"
+        target = proc_dir / f"seg-{seg:03d}{ext}"
+        # registrar para merge do final.md mesmo se skipped
+        proc_topic_segments[proc][topic][seg] = target
+        written = not (target.exists() and not force)
+        if written:
+            target.write_text(content, encoding="utf-8")
+        items_index.append({
+            "custom_id": cid,
+            "file": str(target),
+            "status": status if written else "skipped",
+            **{k: meta.get(k) for k in ("proc", "topic", "seg", "hash", "lang", "code")},
+        })
+        return written
 
-            cid = obj.get("custom_id", "sem_custom_id")
-            if selected is not None and cid not in selected:
-                continue
+    def _write_result(cid: str, meta: Dict[str, Any], content: str, status: str) -> bool:
+        """Como _write_segment; respostas combinadas viram um segmento por tópico encontrado."""
+        if meta.get("topic") != COMBINED_TOPIC:
+            return _write_segment(cid, meta, content, status)
+        parts = split_combined(content)
+        if not parts:
+            # sem delimitadores: preserva a resposta bruta em docs/<proc>/combined/
+            return _write_segment(cid, meta, content, status)
+        results = [_write_segment(cid, {**meta, "topic": topic}, body, status) for topic, body in parts.items()]
+        return any(results)
 
-            resp = obj.get("response", {})
-            body = resp.get("body", {})
-            choices = body.get("choices", [])
-            content = (
-                choices[0]["message"]["content"] if choices and "message" in choices[0] else "(Sem conteúdo)"
-            )
+    for obj in (line for sid in shards for line in _iter_result_lines(sid)):
+        cid = obj.get("custom_id", "sem_custom_id")
+        if selected is not None and cid not in selected:
+            continue
 
-            meta = _extract_meta_from_custom_id(cid)
+        resp = obj.get("response") or {}
+        body = resp.get("body") or {}
+        message_content = response_content(obj)
+        meta = _extract_meta_from_custom_id(cid)
+        rec = input_index.get(cid) or {}
+        if obj.get("_source") == "output.jsonl":
+            usage = body.get("usage") or {}
+            route = add_usage(usage_by_route, rec.get("route") or "default", usage)
+            models = route.setdefault("models", [])
+            if rec.get("model") and rec["model"] not in models:
+                models.append(rec["model"])
+            add_usage(usage_by_topic, meta.get("topic") or "_topic", usage)
 
-            # Novo formato: salvar em docs/<proc>/<topic>/seg-XXX.(md|puml)
-            if meta.get("format") == "v1" and meta.get("proc") and meta.get("topic") is not None:
-                proc = meta.get("proc") or "_proc"
-                topic = meta.get("topic") or "_topic"
-                seg = int(meta.get("seg") or 0)
-                is_puml = topic in ("diagram_activity", "diagram_sequence")
-                proc_dir = docs_dir / proc / topic
-                proc_dir.mkdir(parents=True, exist_ok=True)
-                ext = ".puml" if is_puml else ".md"
-                target = proc_dir / f"seg-{seg:03d}{ext}"
-                if target.exists() and not force:
-                    skipped += 1
-                    items_index.append({
-                        "custom_id": cid,
-                        "file": str(target),
-                        "status": "skipped",
-                        **{k: meta.get(k) for k in ("proc", "topic", "seg", "hash", "lang", "code")},
-                    })
-                    # registrar para merge do final.md mesmo se skipped
-                    proc_topic_segments[proc][topic][seg] = target
-                    continue
+        if message_content is None:
+            # falha: sem arquivo; vale a última mensagem, a menos que um retry tenha dado certo
+            if cid not in succeeded:
+                failures[cid] = response_error(obj)
+            continue
+        if cid in succeeded:
+            continue
+        gaps = combined_gaps(meta.get("topic"), message_content) if meta.get("format") == "v1" else []
+        if gaps:
+            # combinada sem algum tópico: guarda a mais completa e espera um retry que a complete
+            if cid not in partial or len(gaps) <= len(partial[cid][2]):
+                partial[cid] = (meta, message_content, gaps)
+            continue
+        succeeded.add(cid)
+        failures.pop(cid, None)
+        partial.pop(cid, None)
 
-                target.write_text(content, encoding="utf-8")
+        # Novo formato: salvar em docs/<proc>/<topic>/seg-XXX.(md|puml)
+        if meta.get("format") == "v1" and meta.get("proc") and meta.get("topic") is not None:
+            if _write_result(cid, meta, message_content, "ok"):
                 processed += 1
-                items_index.append({
-                    "custom_id": cid,
-                    "file": str(target),
-                    "status": "ok",
-                    **{k: meta.get(k) for k in ("proc", "topic", "seg", "hash", "lang", "code")},
-                })
-                proc_topic_segments[proc][topic][seg] = target
-                continue
+            else:
+                skipped += 1
+            model = rec.get("model")
+            if store is not None and model:
+                store.put(model, meta["topic"], meta.get("hash") or "", meta.get("lang") or "",
+                          int(meta.get("seg") or 0), message_content, cfg=rec.get("cfg") or "",
+                          custom_id=cid, batch_id=batch_id)
+            continue
+
+        # Formatos desconhecidos são ignorados (legacy removido)
+        skipped += 1
+        items_index.append({
+            "custom_id": cid,
+            "file": None,
+            "status": "ignored",
+        })
 
-            # Formatos desconhecidos são ignorados (legacy removido)
+    # combinadas que nenhum retry completou: grava os tópicos presentes (sem ir ao result store,
+    # para serem refeitas no modo incremental) e lista cada tópico ausente como `missing`
+    missing_topics = 0
+    for cid, (meta, content, gaps) in partial.items():
+        succeeded.add(cid)
+        failures.pop(cid, None)
+        if _write_result(cid, meta, content, "ok"):
+            processed += 1
+        else:
             skipped += 1
+        for topic in gaps:
             items_index.append({
                 "custom_id": cid,
                 "file": None,
-                "status": "ignored",
+                "status": "missing",
+                **{k: meta.get(k) for k in ("proc", "seg", "hash", "lang", "code")},
+                "topic": topic,
             })
+        missing_topics += len(gaps)
+
+    for cid, error in failures.items():
+        meta = _extract_meta_from_custom_id(cid)
+        items_index.append({
+            "custom_id": cid,
+            "file": None,
+            "status": "failed",
+            "error": error,
+            **{k: meta.get(k) for k in ("proc", "topic", "seg", "hash", "lang", "code")},
+        })
+    # requisições enviadas sem nenhuma linha de resultado (batch expirado/cancelado)
+    missing: List[str] = []
+    for sid in shards:
+        input_path = ensure_output_dir(sid) / "input.jsonl"
+        if input_path.exists():
+            missing.extend(cid for cid, _ in _input_custom_ids(input_path)
+                           if cid not in succeeded and cid not in failures and (selected is None or cid in selected))
+    for cid in missing:
+        items_index.append({"custom_id": cid, "file": None, "status": "missing"})
+
+    # Segmentos não reenviados (modo incremental): recuperar do result store
+    if store is not None:
+        for cid, rec in input_index.items():
+            if not rec.get("cached") or (selected is not None and cid not in selected):
+                continue
+            meta = _extract_meta_from_custom_id(cid)
+            if meta.get("format") != "v1":
+                continue
+            stored = store.get(rec.get("model") or "", meta["topic"], meta.get("hash") or "",
+                               meta.get("lang") or "", int(meta.get("seg") or 0), rec.get("cfg") or "")
+            if stored is None:
+                print(f"Resultado em cache não encontrado: {cid}", file=sys.stderr)
+                continue
+            if _write_result(cid, meta, stored.get("content") or "", "cached"):
+                from_store += 1
+            else:
+                skipped += 1
 
     # Compilar final.md por processo (novo formato)
     for proc, topics in proc_topic_segments.items():
-        proc_root = docs_dir / proc
+        proc_root = docs_dir / safe_name(proc, "_proc")
         final_md = proc_root / "final.md"
         # coletar conteúdos disponíveis
         def _read_join(topic_name: str) -> Optional[str]:
@@ -177,9 +460,17 @@ def parse(batch_id: str, *, force: bool = False, only: Optional[Iterable[str]] =
         "docs_dir": str(docs_dir),
         "processed": processed,
         "skipped": skipped,
+        "from_store": from_store,
+        "failed": len(failures),
+        "missing": len(missing) + missing_topics,
+        "shard_batch_ids": shards[1:],
+        "retry_batch_ids": [rid for sid in shards for rid in retry_batch_ids(sid)],
+        "usage_by_route": usage_by_route,
+        "usage_by_topic": usage_by_topic,
         "items": items_index,
     }
     (out_dir / "index.json").write_text(json.dumps(index, indent=2, ensure_ascii=False), encoding="utf-8")
 
-    print(f"Arquivos gerados: {processed} (pasta {docs_dir}) | pulados: {skipped}")
+    print(f"Arquivos gerados: {processed} (pasta {docs_dir}) | do store: {from_store} | pulados: {skipped} "
+          f"| falhas: {len(failures)} | sem resultado: {len(missing) + missing_topics}")
     return index
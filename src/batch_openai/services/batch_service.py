@@ -1,17 +1,91 @@
+import hashlib
 import json
+import os
 import sys
 import time
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 from .openai_client import get_client
-from ..utils.files import ensure_output_dir, safe_copy_input
+from .registry import get_registry
+from ..utils.files import ensure_output_dir, safe_copy_index, safe_copy_input
+from ..utils.jsonl import load_manifest
 
 
 TERMINAL_STATES = {"completed", "failed", "cancelled", "expired"}
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Reaproveitar o file_id de um .jsonl idêntico já enviado (sha256 + tamanho, no registro local)
+UPLOAD_DEDUP = os.getenv("BATCH_UPLOAD_DEDUP", "1") not in ("0", "false", "False")
+# Um upload com expiração marcada só é reaproveitado se ainda tiver pelo menos esta folga (s)
+UPLOAD_MIN_TTL = int(os.getenv("BATCH_UPLOAD_MIN_TTL", "3600"))
 
 
-def submit(input_path: str, job_name: Optional[str], completion_window: str, *, verbose: bool = True) -> str:
+def file_sha256(path: Path, *, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _upload_valid(client: Any, file_id: str, size: int) -> bool:
+    """O arquivo ainda existe na Files API, com o mesmo tamanho, e não expira em breve?"""
+    try:
+        remote = client.files.retrieve(file_id)
+    except Exception:  # removido (404), outra organização/chave etc.: envia de novo
+        return False
+    if getattr(remote, "status", None) in ("error", "deleted"):
+        return False
+    if getattr(remote, "purpose", "batch") != "batch":
+        return False
+    remote_bytes = getattr(remote, "bytes", None)
+    if remote_bytes is not None and int(remote_bytes) != size:
+        return False
+    expires_at = getattr(remote, "expires_at", None)
+    return not expires_at or float(expires_at) > time.time() + UPLOAD_MIN_TTL
+
+
+def upload_input(client: Any, path: Path, *, dedup: Optional[bool] = None) -> Dict[str, Any]:
+    """Envia o .jsonl para a Files API (purpose=batch), reaproveitando um upload idêntico ainda válido.
+
+    Retorna {file_id, sha256, bytes, reused}. Com dedup, o conteúdo é identificado por sha256 +
+    tamanho no registro local; um file_id que não existe mais (ou expira em breve) é esquecido e
+    o arquivo é enviado de novo.
+    """
+    path = Path(path)
+    size = path.stat().st_size
+    if not (UPLOAD_DEDUP if dedup is None else dedup):
+        # Enviar o Path diretamente para preservar o nome do arquivo (.jsonl) no multipart
+        file_resp = client.files.create(file=path, purpose="batch")
+        return {"file_id": file_resp.id, "sha256": None, "bytes": size, "reused": False}
+    digest = file_sha256(path)
+    registry = get_registry()
+    cached = registry.get_upload(digest, size)
+    if cached and _upload_valid(client, cached["file_id"], size):
+        registry.record_upload(digest, size, cached["file_id"], path.name)
+        return {"file_id": cached["file_id"], "sha256": digest, "bytes": size, "reused": True}
+    if cached:
+        registry.forget_upload(digest, size)
+    file_resp = client.files.create(file=path, purpose="batch")
+    registry.record_upload(digest, size, file_resp.id, path.name)
+    return {"file_id": file_resp.id, "sha256": digest, "bytes": size, "reused": False}
+
+
+def save_batch_json(batch_id: str, data: Dict[str, Any]) -> None:
+    """Grava outputs/<batch_id>/batch.json mantendo `input_upload` (gravado no submit) nas atualizações."""
+    path = ensure_output_dir(batch_id) / "batch.json"
+    if "input_upload" not in data and path.exists():
+        try:
+            previous = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            previous = {}
+        if previous.get("input_upload"):
+            data = {**data, "input_upload": previous["input_upload"]}
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+
+
+def submit(input_path: str, job_name: Optional[str], completion_window: str, *, verbose: bool = True,
+           index_path: Optional[Path] = None, job_id: Optional[str] = None) -> str:
     p = Path(input_path)
     if not p.exists():
         print(f"ERROR: arquivo de entrada não encontrado: {input_path}", file=sys.stderr)
@@ -24,22 +98,25 @@ def submit(input_path: str, job_name: Optional[str], completion_window: str, *,
         sys.exit(1)
 
     client = get_client()
-
-    # Enviar o Path diretamente para preservar o nome do arquivo (.jsonl) no multipart
-    file_resp = client.files.create(file=p, purpose="batch")
+    upload = upload_input(client, p)
+    if verbose and upload["reused"]:
+        print(f"Arquivo já enviado antes (sha256={upload['sha256'][:12]}…): reutilizando {upload['file_id']}")
 
     metadata = {}
     if job_name:
         metadata["job_name"] = job_name
 
     batch = client.batches.create(
-        input_file_id=file_resp.id,
+        input_file_id=upload["file_id"],
         endpoint="/v1/chat/completions",
         completion_window=completion_window,
         metadata=metadata or None,
     )
 
     batch_id = batch.id
+    # registrar já: se o processo cair daqui em diante, o batch não se perde
+    get_registry().record_batch(batch_id, input_path=str(p.resolve()), input_file_id=upload["file_id"],
+                                job_id=job_id, stage="submitted")
     out_dir = ensure_output_dir(batch_id)
 
     # Serialização resiliente
@@ -54,61 +131,146 @@ def submit(input_path: str, job_name: Optional[str], completion_window: str, *,
             except Exception:
                 batch_data = {"id": getattr(batch, "id", None), "status": getattr(batch, "status", None)}
 
-    (out_dir / "batch.json").write_text(json.dumps(batch_data, indent=2, ensure_ascii=False))
+    batch_data["input_upload"] = upload
+    save_batch_json(batch_id, batch_data)
+    get_registry().record_batch(batch_id, data=batch_data)
     safe_copy_input(p, out_dir)
+    safe_copy_index(p, out_dir, index_path)
     if verbose:
         print(f"Batch criado. batch_id={batch_id}")
     return batch_id
 
 
+def manifest_shard_paths(manifest_path: str) -> List[str]:
+    """Caminhos absolutos dos shards (com requisições) de um `<input>.manifest.json`."""
+    manifest = load_manifest(Path(manifest_path))
+    return [str(Path(s["path"]).resolve()) for s in manifest.get("shards", []) if s.get("requests")]
+
+
+def manifest_submissions(manifest_path: str, job_name: Optional[str]) -> List[Dict[str, Any]]:
+    """Um item por shard (com requisições) do manifest: {path, job_name, index_path}, na ordem."""
+    manifest = load_manifest(Path(manifest_path))
+    index = manifest.get("index")
+    shards = [s for s in manifest.get("shards", []) if s.get("requests")]
+    return [
+        {
+            "path": shard["path"],
+            "job_name": job_name if len(shards) == 1 or not job_name else f"{job_name}-part-{i:03d}",
+            "index_path": Path(index) if index else None,
+        }
+        for i, shard in enumerate(shards)
+    ]
+
+
+def submit_manifest(manifest_path: str, job_name: Optional[str], completion_window: str, *,
+                    verbose: bool = True, existing: Optional[Dict[str, str]] = None) -> List[str]:
+    """Submete todos os shards listados em um `<input>.manifest.json`; retorna os batch_ids na ordem.
+
+    existing: {caminho absoluto do shard: batch_id} já criados (retomada após restart) — não reenviados.
+    """
+    existing = existing or {}
+    batch_ids: List[str] = []
+    for item in manifest_submissions(manifest_path, job_name):
+        known = existing.get(str(Path(item["path"]).resolve()))
+        if known:
+            batch_ids.append(known)
+            continue
+        batch_ids.append(submit(item["path"], item["job_name"], completion_window, verbose=verbose,
+                                index_path=item["index_path"]))
+    return batch_ids
+
+
 def wait(batch_id: str, poll_interval: int) -> None:
-    client = get_client()
+    """Aguarda o batch via `BatchPoller` (intervalo adaptativo, com `poll_interval` como piso)."""
+    import asyncio
+
+    from .openai_client import close_clients
+    from .poller import BatchPoller
+
     print(f"Aguardando batch {batch_id} terminar...")
-    last_status = None
+    last_status = [None]
+
+    def _on_update(batch_data):
+        status = batch_data.get("status")
+        if status != last_status[0]:
+            print(f"status={status}")
+            last_status[0] = status
+
+    async def _wait():
+        try:
+            return await BatchPoller().wait(batch_id, poll_interval=poll_interval, on_update=_on_update)
+        finally:
+            # o cliente assíncrono fica preso a este event loop; fechar para não vazar conexões
+            await close_clients()
+
     try:
-        while True:
-            batch = client.batches.retrieve(batch_id)
-            status = batch.status
-            if status != last_status:
-                print(f"status={status}")
-                last_status = status
-            if status in TERMINAL_STATES:
-                print(f"Status final: {status}")
-                out_dir = ensure_output_dir(batch_id)
-                try:
-                    batch_data = batch.model_dump()
-                except Exception:
-                    try:
-                        batch_data = batch.dict()
-                    except Exception:
-                        try:
-                            batch_data = json.loads(batch.json())
-                        except Exception:
-                            batch_data = {"id": getattr(batch, "id", None), "status": getattr(batch, "status", None)}
-                (out_dir / "batch.json").write_text(json.dumps(batch_data, indent=2, ensure_ascii=False))
-                break
-            time.sleep(max(1, poll_interval))
+        batch_data = asyncio.run(_wait())
     except KeyboardInterrupt:
         print("\nInterrompido pelo usuário durante o 'wait'.", file=sys.stderr)
         sys.exit(130)
+    get_registry().flush()
+    print(f"Status final: {batch_data.get('status')}")
+    save_batch_json(batch_id, batch_data)
+
+
+def download_file(client: Any, file_id: str, dest: Path, *, chunk_size: int = DOWNLOAD_CHUNK_SIZE) -> Dict[str, Any]:
+    """Baixa um arquivo da Files API em streaming, em blocos, para `dest` (troca atômica).
+
+    - Se `dest` já tem o tamanho do arquivo remoto (`files.retrieve(...).bytes`), não baixa de novo.
+    - Os bytes vão para `<dest>.part`; um `.part` de uma tentativa interrompida é retomado com
+      `Range: bytes=<n>-` (se o servidor ignorar o Range e responder 200, recomeça do zero).
+    - Ao final confere o nº de bytes com o tamanho remoto e só então renomeia para `dest`;
+      se não conferir, o `.part` fica para a próxima tentativa e levanta IOError.
+
+    Retorna {path, bytes, skipped, resumed_from}.
+    """
+    dest = Path(dest)
+    remote_size = getattr(client.files.retrieve(file_id), "bytes", None)
+    if remote_size is not None and dest.exists() and dest.stat().st_size == remote_size:
+        return {"path": str(dest), "bytes": remote_size, "skipped": True, "resumed_from": 0}
+
+    part = dest.with_name(dest.name + ".part")
+    offset = part.stat().st_size if part.exists() else 0
+    if remote_size is None or offset > remote_size:
+        offset = 0
+    resumed_from = offset
+    if remote_size is None or offset < remote_size:
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        with client.files.with_streaming_response.content(file_id, extra_headers=headers) as resp:
+            if offset and resp.status_code != 206:
+                offset = resumed_from = 0
+            with part.open("ab" if offset else "wb") as fh:
+                for chunk in resp.iter_bytes(chunk_size):
+                    fh.write(chunk)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+    written = part.stat().st_size
+    if remote_size is not None and written != remote_size:
+        raise IOError(f"download incompleto de {file_id}: {written} de {remote_size} bytes (retomável)")
+    os.replace(part, dest)
+    return {"path": str(dest), "bytes": written, "skipped": False, "resumed_from": resumed_from}
 
 
 def download(batch_id: str) -> None:
     out_dir = ensure_output_dir(batch_id)
     client = get_client()
     batch = client.batches.retrieve(batch_id)
-    if batch.status != "completed":
-        print(f"ERRO: batch {batch_id} não está 'completed' (atual: {batch.status}).", file=sys.stderr)
+    if batch.status not in TERMINAL_STATES:
+        print(f"ERRO: batch {batch_id} ainda não terminou (atual: {batch.status}).", file=sys.stderr)
         sys.exit(2)
+    if batch.status != "completed":
+        print(f"Batch {batch_id} terminou como '{batch.status}': baixando o resultado parcial.")
     if getattr(batch, "output_file_id", None):
-        out = client.files.content(batch.output_file_id)
-        (out_dir / "output.jsonl").write_text(out.text)
-        print(f"Output salvo em: {out_dir / 'output.jsonl'}")
+        info = download_file(client, batch.output_file_id, out_dir / "output.jsonl")
+        note = " (já estava baixado)" if info["skipped"] else ""
+        print(f"Output salvo em: {out_dir / 'output.jsonl'} ({info['bytes']} bytes){note}")
 
     if getattr(batch, "error_file_id", None):
-        err = client.files.content(batch.error_file_id)
-        (out_dir / "errors.jsonl").write_text(err.text)
-        print(f"Errors salvo em: {out_dir / 'errors.jsonl'}")
+        info = download_file(client, batch.error_file_id, out_dir / "errors.jsonl")
+        note = " (já estava baixado)" if info["skipped"] else ""
+        print(f"Errors salvo em: {out_dir / 'errors.jsonl'} ({info['bytes']} bytes){note}")
+    get_registry().record_batch(batch_id, stage="downloaded")
 
 
 def status(batch_id: str, json_output: bool = False) -> None:
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .registry import JobRegistry, get_registry
+
+# Estados do job (status) e etapas do pipeline (stage)
+JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+JOB_TERMINAL_STATES = {"succeeded", "failed", "cancelled"}
+JOB_STAGES = ("queued", "building", "submitting", "waiting", "downloading", "retrying", "parsing", "done")
+
+
+class Job:
+    """Estado de um job em background: etapa atual, progresso por batch e tempos por etapa."""
+
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None, job_id: Optional[str] = None) -> None:
+        self.id = job_id or f"job-{uuid.uuid4().hex[:12]}"
+        self.kind = kind
+        self.params = dict(params or {})
+        self.status = "queued"
+        self.stage = "queued"
+        self.batch_ids: List[str] = []
+        self.batch_status: Dict[str, Optional[str]] = {}
+        self.request_counts: Dict[str, Dict[str, int]] = {}
+        self.timings: Dict[str, float] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self._stage_started = self.created_at
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "Job":
+        """Reconstrói um job a partir do estado gravado no registro (`to_dict()` + params)."""
+        job = cls(state["kind"], state.get("params"), job_id=state["job_id"])
+        job.status = state.get("status") or "queued"
+        job.stage = state.get("stage") or "queued"
+        job.batch_ids = list(state.get("batch_ids") or [])
+        job.batch_status = dict(state.get("batch_status") or {})
+        job.request_counts = {k: dict(v) for k, v in (state.get("request_counts") or {}).items()}
+        job.timings = dict(state.get("timings") or {})
+        job.timings.pop(job.stage, None)
+        job.result = state.get("result")
+        job.error = state.get("error")
+        job.created_at = state.get("created_at") or job.created_at
+        job.updated_at = state.get("updated_at") or job.updated_at
+        job.finished_at = state.get("finished_at")
+        return job
+
+    @property
+    def done(self) -> bool:
+        return self.status in JOB_TERMINAL_STATES
+
+    def progress(self) -> Dict[str, int]:
+        """Soma de `request_counts` de todos os batches do job."""
+        acc = {"total": 0, "completed": 0, "failed": 0}
+        for counts in self.request_counts.values():
+            for k in acc:
+                acc[k] += int(counts.get(k) or 0)
+        return acc
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        timings = dict(self.timings)
+        if not self.done:
+            timings[self.stage] = round(end - self._stage_started, 3)
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "batch_ids": list(self.batch_ids),
+            "batch_status": dict(self.batch_status),
+            "request_counts": {k: dict(v) for k, v in self.request_counts.items()},
+            "progress": self.progress(),
+            "timings": timings,
+            "elapsed": round(end - self.created_at, 3),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Jobs ativos em memória e as tasks asyncio que os executam, com cópia durável no registro.
+
+    Toda atualização acontece no event loop (as etapas bloqueantes rodam em threads via
+    `asyncio.to_thread` e devolvem o resultado ao coroutine do job), então não há lock.
+    Cada atualização incrementa `job.version`, é enfileirada para a thread de escrita do registro
+    (se houver) e acorda quem acompanha o job (`watch`).
+    """
+
+    def __init__(self, registry: Optional[JobRegistry] = None) -> None:
+        self.registry = registry
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._shutting_down = False
+
+    def create(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Job:
+        job = Job(kind, params)
+        self.jobs[job.id] = job
+        self._save(job)
+        return job
+
+    def restore(self, state: Dict[str, Any]) -> Job:
+        """Recoloca em memória um job lido do registro (para retomar após restart)."""
+        job = self.jobs.get(state["job_id"])
+        if job is None:
+            job = self.jobs[state["job_id"]] = Job.from_dict(state)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None and self.registry is not None:
+            state = self.registry.get_job(job_id)
+            if state is not None:
+                job = Job.from_dict(state)
+        return job
+
+    def list(self, limit: int = 100) -> List[Job]:
+        """Jobs em memória mais os do registro (inclusive de execuções anteriores da API)."""
+        jobs = dict(self.jobs)
+        if self.registry is not None:
+            for state in self.registry.list_jobs(limit=limit):
+                jobs.setdefault(state["job_id"], Job.from_dict(state))
+        return sorted(jobs.values(), key=lambda j: j.created_at, reverse=True)[:limit]
+
+    def _save(self, job: Job) -> None:
+        # chamado do event loop: a gravação vai para a thread de escrita do registro (a última vence)
+        if self.registry is not None:
+            self.registry.write(self.registry.save_job, job.to_dict(), dict(job.params), key=("job", job.id))
+
+    def update(self, job: Job, *, stage: Optional[str] = None, **fields: Any) -> None:
+        """Aplica campos ao job; trocar `stage` fecha o tempo da etapa anterior."""
+        now = time.time()
+        if stage is not None and stage != job.stage:
+            job.timings[job.stage] = round(now - job._stage_started, 3)
+            job.stage = stage
+            job._stage_started = now
+        for k, v in fields.items():
+            setattr(job, k, v)
+        if job.done and job.finished_at is None:
+            job.finished_at = now
+            job.timings[job.stage] = round(now - job._stage_started, 3)
+        job.updated_at = now
+        job.version += 1
+        self._save(job)
+        event = self._changed.pop(job.id, None)
+        if event is not None:
+            event.set()
+
+    def start(self, job: Job, runner: Callable[[Job], Awaitable[Optional[Dict[str, Any]]]]) -> Job:
+        """Agenda `runner(job)` no event loop; o dict retornado vira `job.result`."""
+
+        async def _run() -> None:
+            self.update(job, status="running")
+            try:
+                result = await runner(job)
+            except asyncio.CancelledError:
+                # no shutdown o job continua "running" no registro e é retomado no próximo startup
+                if not self._shutting_down:
+                    self.update(job, status="cancelled", error="cancelado")
+                raise
+            except Exception as exc:  # erro da etapa fica no job; a task não propaga
+                detail = getattr(exc, "detail", None)
+                self.update(job, status="failed", error=str(detail or exc))
+            else:
+                self.update(job, stage="done", status="succeeded", result=result)
+            finally:
+                self._tasks.pop(job.id, None)
+
+        self._tasks[job.id] = asyncio.create_task(_run(), name=job.id)
+        return job
+
+    async def wait_change(self, job: Job, version: int, timeout: float) -> bool:
+        """Espera até `job.version` passar de `version` (True) ou o timeout (False)."""
+        if job.version != version:
+            return True
+        event = self._changed.setdefault(job.id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def watch(self, job: Job, *, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Gera o estado do job a cada mudança (None a cada `heartbeat` sem mudança) até o fim."""
+        version = -1
+        while True:
+            if job.version != version:
+                version = job.version
+                yield job.to_dict()
+                if job.done:
+                    return
+            elif not await self.wait_change(job, version, heartbeat):
+                yield None
+
+    def pending_states(self) -> List[Dict[str, Any]]:
+        """Estados gravados de jobs não terminados (interrompidos por restart/crash)."""
+        if self.registry is None:
+            return []
+        return [s for s in self.registry.list_jobs(status=["queued", "running"], limit=1000)
+                if s["job_id"] not in self._tasks]
+
+    async def shutdown(self) -> None:
+        """Interrompe os jobs em execução (shutdown da API); ficam pendentes no registro."""
+        self._shutting_down = True
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """Gerenciador de jobs do processo (criado sob demanda, persistido em JOB_REGISTRY_DB)."""
+    global _manager
+    if _manager is None:
+        _manager = JobManager(get_registry())
+    return _manager
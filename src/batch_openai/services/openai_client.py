@@ -1,16 +1,92 @@
+import os
 import sys
+import threading
+from typing import Optional
 
 from ..config import require_env
 
 try:
-    from openai import OpenAI
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 except ImportError:
     print("ERROR: pacote 'openai' não instalado. Execute 'pip install -r requirements.txt'.", file=sys.stderr)
     raise
 
+# Clientes compartilhados pelo processo: um único pool de conexões (keep-alive/TLS reaproveitados)
+# em vez de um OpenAI() novo a cada chamada. Criados sob demanda e fechados no shutdown da API.
+_lock = threading.Lock()
+_client: Optional["OpenAI"] = None
+_async_client: Optional["AsyncOpenAI"] = None
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
+
+
+def _limits() -> "httpx.Limits":
+    return httpx.Limits(
+        max_connections=int(_env_float("OPENAI_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(_env_float("OPENAI_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=_env_float("OPENAI_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+
+def _timeout() -> "httpx.Timeout":
+    return httpx.Timeout(_env_float("OPENAI_TIMEOUT", 600.0), connect=_env_float("OPENAI_CONNECT_TIMEOUT", 10.0))
+
+
+def _max_retries() -> int:
+    return int(_env_float("OPENAI_MAX_RETRIES", 2))
+
 
 def get_client() -> "OpenAI":
-    """Cria e retorna um cliente OpenAI após validar a OPENAI_API_KEY."""
-    # Valida que a variável está definida (mensagem amigável se não estiver)
-    require_env("OPENAI_API_KEY")
-    return OpenAI()
+    """Retorna o cliente OpenAI compartilhado (criado na primeira chamada, após validar a OPENAI_API_KEY).
+
+    Pool: OPENAI_MAX_CONNECTIONS (100), OPENAI_MAX_KEEPALIVE (20), OPENAI_KEEPALIVE_EXPIRY (30s);
+    timeouts: OPENAI_TIMEOUT (600s), OPENAI_CONNECT_TIMEOUT (10s); OPENAI_MAX_RETRIES (2).
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                # Valida que a variável está definida (mensagem amigável se não estiver)
+                require_env("OPENAI_API_KEY")
+                timeout = _timeout()
+                _client = OpenAI(
+                    timeout=timeout,
+                    max_retries=_max_retries(),
+                    http_client=DefaultHttpxClient(limits=_limits(), timeout=timeout),
+                )
+    return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Variante assíncrona de `get_client` (mesmos limites), para endpoints async."""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                require_env("OPENAI_API_KEY")
+                timeout = _timeout()
+                _async_client = AsyncOpenAI(
+                    timeout=timeout,
+                    max_retries=_max_retries(),
+                    http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=timeout),
+                )
+    return _async_client
+
+
+async def close_clients() -> None:
+    """Fecha os clientes compartilhados (lifespan da API); a próxima chamada cria novos."""
+    global _client, _async_client
+    with _lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .batch_service import TERMINAL_STATES
+
+# Intervalos (s) e limites do poller; o poll_interval pedido por quem espera vira o piso daquele batch
+POLL_MIN_INTERVAL = float(os.getenv("BATCH_POLL_MIN_INTERVAL", "5"))
+POLL_MAX_INTERVAL = float(os.getenv("BATCH_POLL_MAX_INTERVAL", "300"))
+# A partir de quantos batches vencidos num mesmo ciclo vale paginar batches.list em vez de N retrieves
+POLL_LIST_THRESHOLD = int(os.getenv("BATCH_POLL_LIST_THRESHOLD", "3"))
+POLL_LIST_MAX_PAGES = int(os.getenv("BATCH_POLL_LIST_MAX_PAGES", "10"))
+POLL_MAX_ERRORS = 5
+
+_LIST_PAGE_SIZE = 100
+_BACKOFF = 1.5
+_AGE_FACTOR = 0.1  # intervalo máximo cresce com a idade do batch (10% da idade)
+_FAST_STATES = {"validating", "finalizing", "cancelling"}
+
+
+def batch_to_dict(batch: Any) -> Dict[str, Any]:
+    """Serialização resiliente de um objeto Batch do SDK."""
+    if isinstance(batch, dict):
+        return batch
+    try:
+        return batch.model_dump()
+    except Exception:
+        try:
+            return batch.dict()
+        except Exception:
+            return {"id": getattr(batch, "id", None), "status": getattr(batch, "status", None)}
+
+
+def _done(counts: Dict[str, Any]) -> int:
+    return int(counts.get("completed") or 0) + int(counts.get("failed") or 0)
+
+
+class _Tracked:
+    __slots__ = ("batch_id", "data", "floor", "interval", "next_poll", "last_poll", "first_seen",
+                 "errors", "waiters", "listeners")
+
+    def __init__(self, batch_id: str, floor: float, now: float) -> None:
+        self.batch_id = batch_id
+        self.data: Dict[str, Any] = {}
+        self.floor = floor
+        self.interval = floor
+        self.next_poll = now
+        self.last_poll: Optional[float] = None
+        self.first_seen = now
+        self.errors = 0
+        self.waiters: List[asyncio.Future] = []
+        self.listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+class BatchPoller:
+    """Poller único para todos os batches ativos do processo.
+
+    Quem espera um batch chama `await poller.wait(batch_id, on_update=...)`; o poller mantém o
+    conjunto de ids ativos e, a cada ciclo, atualiza só os que venceram: com vários vencidos,
+    pagina `batches.list` (mais recentes primeiro) e usa `batches.retrieve` apenas para os que não
+    apareceram. O próximo poll de cada batch se adapta ao estado (validating/finalizing: rápido),
+    ao progresso de `request_counts` (ETA) e à idade do batch; sem progresso, o intervalo cresce.
+    """
+
+    def __init__(self, client: Any = None, *, min_interval: Optional[float] = None,
+                 max_interval: Optional[float] = None, list_threshold: Optional[int] = None,
+                 registry: Any = None) -> None:
+        self._client = client
+        self._registry = registry
+        self.min_interval = POLL_MIN_INTERVAL if min_interval is None else min_interval
+        self.max_interval = POLL_MAX_INTERVAL if max_interval is None else max_interval
+        self.list_threshold = POLL_LIST_THRESHOLD if list_threshold is None else list_threshold
+        self.tracked: Dict[str, _Tracked] = {}
+        self.stats = {"cycles": 0, "list_calls": 0, "retrieve_calls": 0, "updates": 0, "errors": 0}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            from .openai_client import get_async_client
+
+            self._client = get_async_client()
+        return self._client
+
+    @property
+    def registry(self) -> Any:
+        if self._registry is None:
+            from .registry import get_registry
+
+            self._registry = get_registry()
+        return self._registry
+
+    async def wait(self, batch_id: str, *, poll_interval: Optional[float] = None,
+                   on_update: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Aguarda o batch chegar a um estado terminal e retorna o objeto final (dict).
+
+        `on_update(batch)` é chamado a cada mudança de status/request_counts.
+        """
+        loop = asyncio.get_running_loop()
+        now = time.time()
+        floor = max(1.0, float(poll_interval)) if poll_interval else self.min_interval
+        t = self.tracked.get(batch_id)
+        if t is None:
+            t = self.tracked[batch_id] = _Tracked(batch_id, floor, now)
+        elif floor < t.floor:
+            t.floor = t.interval = floor
+            t.next_poll = min(t.next_poll, now + floor)
+        fut = loop.create_future()
+        t.waiters.append(fut)
+        if on_update is not None:
+            t.listeners.append(on_update)
+            if t.data:
+                on_update(t.data)
+        self._ensure_running(loop)
+        try:
+            return await fut
+        finally:
+            if fut in t.waiters:
+                t.waiters.remove(fut)
+            if on_update in t.listeners:
+                t.listeners.remove(on_update)
+            if not t.waiters and self.tracked.get(batch_id) is t:
+                del self.tracked[batch_id]
+
+    def _ensure_running(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run(), name="batch-poller")
+            self._task.add_done_callback(self._on_task_done)
+        self._wake.set()
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        """Se a task do poller morrer (erro ou cancelamento), ninguém fica esperando para sempre.
+
+        Quem aguarda recebe o erro (ou é cancelado no shutdown); o próximo `wait()` recria a task.
+        """
+        if self._task is not None and self._task is not task and not self._task.done():
+            return  # um wait() já recriou a task, que segue atendendo os batches
+        exc = None if task.cancelled() else task.exception()
+        if exc is None and not task.cancelled():
+            return  # saída normal: não havia mais batches acompanhados
+        for t in list(self.tracked.values()):
+            for fut in t.waiters:
+                if fut.done():
+                    continue
+                if exc is None:
+                    fut.cancel()
+                else:
+                    fut.set_exception(exc)
+
+    async def _run(self) -> None:
+        while self.tracked:
+            now = time.time()
+            due = [t for t in self.tracked.values() if t.next_poll <= now]
+            if due:
+                self.stats["cycles"] += 1
+                try:
+                    await self._refresh(due)
+                except Exception as exc:  # erro inesperado no ciclo: falha (com backoff) de cada batch vencido
+                    for t in due:
+                        self._fail(t, exc)
+                continue
+            delay = min(t.next_poll for t in self.tracked.values()) - now
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self, due: List[_Tracked]) -> None:
+        found: Dict[str, Dict[str, Any]] = {}
+        if len(due) >= self.list_threshold:
+            try:
+                found = await self._list_bulk(due)
+            except Exception:
+                self.stats["errors"] += 1
+                found = {}
+        missing = [t for t in due if t.batch_id not in found]
+        if missing:
+            self.stats["retrieve_calls"] += len(missing)
+            results = await asyncio.gather(
+                *(self.client.batches.retrieve(t.batch_id) for t in missing), return_exceptions=True
+            )
+            for t, res in zip(missing, results):
+                if isinstance(res, BaseException):
+                    self._fail(t, res)
+                else:
+                    found[t.batch_id] = batch_to_dict(res)
+        now = time.time()
+        for t in due:
+            data = found.get(t.batch_id)
+            if data is None:
+                continue
+            try:
+                self._apply(t, data, now)
+            except Exception as exc:  # erro de um batch (ex.: registro) não derruba o poller dos demais
+                self._fail(t, exc)
+
+    async def _list_bulk(self, due: List[_Tracked]) -> Dict[str, Dict[str, Any]]:
+        """Pagina batches.list (mais recentes primeiro) até achar todos os ids vencidos.
+
+        Para ao passar do batch mais antigo procurado (created_at conhecido) ou após
+        POLL_LIST_MAX_PAGES páginas; os que faltarem vão para retrieve.
+        """
+        want = {t.batch_id for t in due}
+        created = [t.data.get("created_at") for t in due]
+        oldest = min(created) if created and all(created) else None
+        found: Dict[str, Dict[str, Any]] = {}
+        page = await self.client.batches.list(limit=_LIST_PAGE_SIZE)
+        self.stats["list_calls"] += 1
+        for _ in range(POLL_LIST_MAX_PAGES):
+            passed_oldest = False
+            for item in page.data:
+                data = batch_to_dict(item)
+                if data.get("id") in want:
+                    found[data["id"]] = data
+                if oldest is not None and (data.get("created_at") or oldest) < oldest:
+                    passed_oldest = True
+            if len(found) == len(want) or passed_oldest or not page.has_next_page():
+                break
+            page = await page.get_next_page()
+            self.stats["list_calls"] += 1
+        return found
+
+    def _fail(self, t: _Tracked, exc: BaseException) -> None:
+        self.stats["errors"] += 1
+        t.errors += 1
+        if t.errors >= POLL_MAX_ERRORS:
+            for fut in t.waiters:
+                if not fut.done():
+                    fut.set_exception(exc)
+            self.tracked.pop(t.batch_id, None)
+            return
+        t.interval = min(self.max_interval, t.interval * 2)
+        t.next_poll = time.time() + t.interval
+
+    def _apply(self, t: _Tracked, data: Dict[str, Any], now: float) -> None:
+        from .status_cache import get_status_cache
+
+        get_status_cache().put(data)  # leituras de /status aproveitam o que o poller acabou de buscar
+        prev = t.data
+        counts = data.get("request_counts") or {}
+        prev_counts = prev.get("request_counts") or {}
+        t.errors = 0
+        if data.get("status") != prev.get("status") or counts != prev_counts:
+            self.stats["updates"] += 1
+            # fora do event loop e sem propagar erro: o registro é só acompanhamento
+            self.registry.write(self.registry.record_batch, t.batch_id, data=data)
+            for listener in list(t.listeners):
+                try:
+                    listener(data)
+                except Exception:  # um listener com erro não pode parar o poller dos demais
+                    self.stats["errors"] += 1
+        status = data.get("status")
+        if status in TERMINAL_STATES:
+            for fut in t.waiters:
+                if not fut.done():
+                    fut.set_result(data)
+            self.tracked.pop(t.batch_id, None)
+        else:
+            t.interval = self._next_interval(t, data, _done(counts) - _done(prev_counts), now)
+            t.next_poll = now + t.interval
+        t.data = data
+        t.last_poll = now
+
+    def _next_interval(self, t: _Tracked, data: Dict[str, Any], progressed: int, now: float) -> float:
+        floor = t.floor
+        status = data.get("status")
+        if status in _FAST_STATES:
+            return floor
+        age = now - float(data.get("created_at") or t.first_seen)
+        ceiling = max(floor, min(self.max_interval, age * _AGE_FACTOR))
+        counts = data.get("request_counts") or {}
+        remaining = int(counts.get("total") or 0) - _done(counts)
+        if progressed > 0 and t.last_poll is not None and remaining > 0:
+            rate = progressed / max(1e-6, now - t.last_poll)
+            interval = (remaining / rate) / 4  # ~4 polls até o fim estimado
+        else:
+            interval = t.interval * _BACKOFF
+        return max(floor, min(ceiling, interval))
+
+    async def shutdown(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+_poller: Optional[BatchPoller] = None
+
+
+def get_poller() -> BatchPoller:
+    """Poller do processo, ligado ao event loop em execução (um novo se o loop mudou)."""
+    global _poller
+    loop = asyncio.get_running_loop()
+    if _poller is None or (_poller.loop is not None and _poller.loop is not loop):
+        _poller = BatchPoller()
+    return _poller
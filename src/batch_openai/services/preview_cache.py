@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Limites do cache de respostas do preview: tamanho total em disco e idade máxima de uma entrada
+PREVIEW_CACHE_ENABLED = os.getenv("PREVIEW_CACHE", "1") not in ("0", "false", "False")
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+PREVIEW_CACHE_MAX_AGE = float(os.getenv("PREVIEW_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+# De quanto em quanto tempo (s) um put varre as entradas vencidas pela idade
+PREVIEW_CACHE_SWEEP_INTERVAL = float(os.getenv("PREVIEW_CACHE_SWEEP_INTERVAL", "600"))
+
+# Parâmetros que não mudam o conteúdo da resposta (só a forma de entrega)
+_TRANSPORT_KEYS = ("stream", "stream_options")
+# Ao passar de max_bytes, o despejo desce até esta fração (não despejar de novo a cada put)
+_LOW_WATER = 0.9
+
+
+class PreviewCache:
+    """Cache em disco das respostas de chat completions do preview, com despejo LRU por tamanho e idade.
+
+    Chave: sha256 do body sanitizado em JSON canônico (modelo, mensagens, limites de tokens...).
+    Layout: <root>/<sha[:2]>/<sha>.json; o mtime do arquivo marca o último uso (atualizado a cada hit).
+    Entradas sem uso há mais de `max_age` não são servidas (a idade conta do último uso, como no despejo). Um índice em memória (caminho -> último
+    uso, bytes), montado por uma varredura do diretório no primeiro uso, mantém o total em disco:
+    o put só despeja quando o total passa de `max_bytes` (as menos usadas recentemente, até 90%
+    do limite) ou, a cada `sweep_interval` segundos, para apagar as vencidas. `evict()` revarre o
+    diretório (acerta o índice com o que outros processos gravaram) e despeja na hora.
+    """
+
+    def __init__(self, root: Path, *, max_bytes: Optional[int] = None, max_age: Optional[float] = None,
+                 sweep_interval: Optional[float] = None) -> None:
+        self.root = Path(root)
+        self.max_bytes = PREVIEW_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age = PREVIEW_CACHE_MAX_AGE if max_age is None else max_age
+        self.sweep_interval = PREVIEW_CACHE_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        # previews concorrentes gravam do pool de threads
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[Path, List[float]]] = None
+        self.total_bytes = 0
+        self._last_sweep = 0.0
+
+    @staticmethod
+    def key(body: Dict[str, Any]) -> str:
+        canonical = {k: v for k, v in body.items() if k not in _TRANSPORT_KEYS}
+        raw = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        p = self._path(key)
+        try:
+            last_used = p.stat().st_mtime
+            data = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if self.max_age and time.time() - last_used > self.max_age:
+            p.unlink(missing_ok=True)
+            with self._lock:
+                self._forget(p)
+            return None
+        try:
+            os.utime(p)
+        except OSError:
+            pass
+        with self._lock:
+            if self._index is not None and p in self._index:
+                self._index[p][0] = time.time()
+        return data
+
+    def put(self, key: str, result: Dict[str, Any]) -> Path:
+        """Guarda a resposta (output_text, usage, request_body) e despeja se passou do limite."""
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        data = {
+            "output_text": result.get("output_text"),
+            "usage": result.get("usage"),
+            "request_body": result.get("request_body"),
+            "stored_at": now,
+        }
+        raw = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        tmp = p.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(raw)
+        os.replace(tmp, p)
+        with self._lock:
+            if self._index is None:
+                self._rescan()  # a varredura já inclui o arquivo recém-gravado
+            else:
+                self._forget(p)
+                self._index[p] = [now, len(raw)]
+                self.total_bytes += len(raw)
+            sweep_due = bool(self.max_age) and now - self._last_sweep >= self.sweep_interval
+            if self.total_bytes > self.max_bytes or sweep_due:
+                self._evict_locked(now)
+        return p
+
+    def evict(self) -> Dict[str, int]:
+        """Revarre o diretório e remove entradas vencidas e, por último uso, as que passam de `max_bytes`."""
+        with self._lock:
+            self._rescan()
+            return self._evict_locked(time.time())
+
+    def _forget(self, p: Path) -> None:
+        if self._index is not None:
+            entry = self._index.pop(p, None)
+            if entry is not None:
+                self.total_bytes -= int(entry[1])
+
+    def _rescan(self) -> None:
+        index: Dict[Path, List[float]] = {}
+        for p in self.root.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            index[p] = [st.st_mtime, st.st_size]
+        self._index = index
+        self.total_bytes = sum(int(size) for _, size in index.values())
+
+    def _evict_locked(self, now: float) -> Dict[str, int]:
+        removed = {"expired": 0, "evicted": 0}
+        index = self._index or {}
+        if self.max_age:
+            # o último uso vem do índice/mtime: uma entrada vencida pela idade já não é lida há max_age
+            for p in [p for p, (used, _) in index.items() if now - used > self.max_age]:
+                p.unlink(missing_ok=True)
+                self._forget(p)
+                removed["expired"] += 1
+            self._last_sweep = now
+        if self.total_bytes > self.max_bytes:
+            target = self.max_bytes * _LOW_WATER
+            for p, _ in sorted(index.items(), key=lambda item: item[1][0]):
+                if self.total_bytes <= target:
+                    break
+                p.unlink(missing_ok=True)
+                self._forget(p)
+                removed["evicted"] += 1
+        return removed
+
+
+_cache: Optional[PreviewCache] = None
+
+
+def get_preview_cache() -> Optional[PreviewCache]:
+    """Cache do preview (PREVIEW_CACHE_DIR, default outputs/_preview_cache); None se PREVIEW_CACHE=0."""
+    global _cache
+    if not PREVIEW_CACHE_ENABLED:
+        return None
+    root = Path(os.getenv("PREVIEW_CACHE_DIR", "outputs/_preview_cache"))
+    if _cache is None or _cache.root != root:
+        _cache = PreviewCache(root)
+    return _cache
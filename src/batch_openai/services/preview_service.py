@@ -1,28 +1,51 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 
-from .openai_client import get_client
+from .openai_client import get_async_client
+from .preview_cache import PreviewCache, get_preview_cache
 from ..tools import input_builder
+from ..utils.usage import add_usage, cached_tokens
+
+STRICT_SAMPLING_MODELS = {"gpt-5", "openai_o4-mini", "o4-mini"}
+_SAMPLING_PARAMS = ("temperature", "top_p", "seed")
+# Campos do body ausentes da assinatura de chat.completions.create em versões do SDK aceitas por
+# requirements.txt (openai>=1.40): vão em extra_body, que o SDK repassa sem validar
+_EXTRA_BODY_PARAMS = ("max_completion_tokens", "prompt_cache_key")
+# Requisições simultâneas por preview e tempo máximo (s) de cada uma
+PREVIEW_CONCURRENCY = int(os.getenv("PREVIEW_CONCURRENCY", "5"))
+PREVIEW_REQUEST_TIMEOUT = float(os.getenv("PREVIEW_REQUEST_TIMEOUT", "120"))
 
 
 def build_preview_entries_from_payload(payload: Dict[str, Any], *, topics: Optional[List[str]] = None,
-                                       max_tokens_override: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+                                       max_tokens_override: Optional[Dict[str, int]] = None,
+                                       layout: Optional[str] = None, combined: bool = False) -> List[Dict[str, Any]]:
     """Gera lista de entradas (sem escrever .jsonl) para execução direta de preview.
 
     Reusa lógica do builder de payload, mas sem segmentação e sem persistência de contexto.
+    `layout` segue o builder (`inline` | `cache`, default env PROMPT_LAYOUT); `combined` gera uma
+    única entrada com todos os tópicos (tópico `combined`, separado pelo parser).
     """
+    layout = input_builder.resolve_prompt_layout(layout)
     norm = input_builder.normalize_payload_sada(payload)
     ep_language = norm.get("ep_language") or "unknown"
     entry = norm.get("entry_point") or {}
     proc = entry.get("name") or "processo_desconhecido"
     content = entry.get("content") or ""
     deps = entry.get("deps") or []
+    graph = input_builder.CallGraph.from_deps(deps, entry.get("edges"))  # type: ignore
 
+    if combined:
+        topics = [input_builder.COMBINED_TOPIC]
     topics = topics or list(input_builder.DEFAULT_TOPICS)  # type: ignore
     templates_dir = Path("prompts")
-    packs = input_builder.build_topic_packs(proc, content, deps, topics=topics)  # type: ignore
+    packs = input_builder.build_topic_packs(proc, content, deps, topics=topics,  # type: ignore
+                                             code_language=ep_language, graph=graph)
 
     base_vars = {
         "language": payload.get("language", "pt-BR"),
@@ -37,98 +60,267 @@ def build_preview_entries_from_payload(payload: Dict[str, Any], *, topics: Optio
     for topic in topics:
         pack = packs.get(topic, {"content": content, "methods": "", "rules": ""})
         vars = {**base_vars, **pack}
-        effective = f"{proc}\n{topic}\n{vars.get('content','')}\n{vars.get('methods','')}\n{vars.get('rules','')}"
-        h8 = input_builder._sha8(effective)  # type: ignore
-        content_text = input_builder._build_message_content(topic, templates_dir, {  # type: ignore
+        h8 = input_builder._effective_hash(proc, topic, vars)  # type: ignore
+        system_prompt, content_text = input_builder._build_messages(topic, templates_dir, {  # type: ignore
             **vars,
             "content": vars.get("content", ""),
             "processes": vars.get("methods", ""),
             "rules": vars.get("rules", ""),
-        })
+        }, layout)
         cid = input_builder._build_custom_id(proc, topic, 0, h8, base_vars["language"], ep_language)  # type: ignore
         entry = input_builder._build_entry(  # type: ignore
             cid,
             norm.get("model") or payload.get("model") or "gpt-5",
             content_text,
             max_tokens_map.get(topic, 600),
+            system_prompt=system_prompt,
             seed=input_builder._sha_seed(h8),  # type: ignore
+            prompt_cache_key=f"doc-{input_builder._sha8(system_prompt)}" if layout == "cache" else None,  # type: ignore
         )
         entries.append(entry)
     return entries
 
 
-def run_preview(payload: Dict[str, Any], *, topics: Optional[List[str]] = None,
-                max_tokens_override: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
-    """Executa cada entrada via chat completions normal e retorna lista de resultados.
+def _topic_of(custom_id: str) -> Optional[str]:
+    for part in (custom_id or "").split("|"):
+        if part.startswith("topic="):
+            return part[len("topic="):]
+    return None
+
+
+def summarize_usage(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Uso agregado por tópico (prompt/cached/completion tokens e taxa de cache).
 
-    Retorna lista de dicts: {custom_id, output_text, usage?, request_body, error?}.
+    Itens servidos do cache de respostas (`cache_hit`) não geraram chamada e ficam de fora.
     """
-    client = get_client()
-    entries = build_preview_entries_from_payload(
+    acc: Dict[str, Dict[str, Any]] = {}
+    for r in results:
+        if r.get("error") is None and not r.get("cache_hit"):
+            add_usage(acc, r.get("topic") or "_topic", r.get("usage"))
+    return acc
+
+
+def sanitize_body(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Cópia do body sem parâmetros de sampling nos modelos que só aceitam os defaults."""
+    b = dict(body)
+    if b.get("model") in STRICT_SAMPLING_MODELS:
+        # Esses modelos só aceitam defaults (sem temperature/top_p/seed customizado)
+        for k in _SAMPLING_PARAMS:
+            b.pop(k, None)
+    return b
+
+
+def _create_kwargs(body: Dict[str, Any]) -> Dict[str, Any]:
+    """kwargs de chat.completions.create para o body de uma entrada do builder."""
+    kwargs = {k: v for k, v in body.items() if k not in _EXTRA_BODY_PARAMS}
+    extra = {k: body[k] for k in _EXTRA_BODY_PARAMS if k in body}
+    if extra:
+        kwargs["extra_body"] = extra
+    return kwargs
+
+
+def _should_retry_without_sampling(msg: str, body: Dict[str, Any]) -> bool:
+    # Retry heurístico: se erro de unsupported_value para sampling, remover e tentar 1 vez
+    return any(tok in msg for tok in ("unsupported_value", "temperature", "top_p")) and any(
+        k in body for k in _SAMPLING_PARAMS
+    )
+
+
+def _error_result(entry: Dict[str, Any], body: Dict[str, Any], msg: str) -> Dict[str, Any]:
+    return {
+        "custom_id": entry.get("custom_id"),
+        "topic": _topic_of(entry.get("custom_id")),
+        "error": msg,
+        "request_body": body,
+    }
+
+
+def _success_result(entry: Dict[str, Any], body: Dict[str, Any], resp: Any, latency_ms: int) -> Dict[str, Any]:
+    content = None
+    if hasattr(resp, "choices") and resp.choices:
+        first = resp.choices[0]
+        if hasattr(first, "message") and getattr(first.message, "content", None):
+            content = first.message.content
+    usage = getattr(resp, "usage", None)
+    usage_data = None
+    if usage is not None:
+        usage_data = getattr(usage, "model_dump", lambda: usage)()
+    return {
+        "custom_id": entry.get("custom_id"),
+        "topic": _topic_of(entry.get("custom_id")),
+        "output_text": content,
+        "usage": usage_data,
+        "cached_tokens": cached_tokens(usage_data),
+        "latency_ms": latency_ms,
+        "request_body": body,
+        "cache_hit": False,
+    }
+
+
+async def _consume_stream(client: Any, body: Dict[str, Any], on_delta: Callable[[str], None]) -> Any:
+    """Chat completion com stream=True: repassa cada trecho a `on_delta` e devolve a resposta montada."""
+    stream = await client.chat.completions.create(**_create_kwargs(body), stream=True,
+                                                  stream_options={"include_usage": True})
+    parts: List[str] = []
+    usage = None
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            for choice in getattr(chunk, "choices", None) or []:
+                text = getattr(getattr(choice, "delta", None), "content", None)
+                if text:
+                    parts.append(text)
+                    on_delta(text)
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
+    message = SimpleNamespace(content="".join(parts) or None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+async def _run_entry(client: Any, entry: Dict[str, Any], sem: asyncio.Semaphore, timeout: float,
+                     on_delta: Optional[Callable[[str], None]] = None, *, cache: Optional[PreviewCache] = None,
+                     bypass_cache: bool = False) -> Dict[str, Any]:
+    """Executa uma entrada (com `on_delta`, em streaming); erros e timeout viram item com `error`.
+
+    Com `cache`, uma resposta já guardada para o mesmo body sanitizado é servida sem chamar a API
+    (`bypass_cache` pula a consulta, mas a resposta nova ainda é guardada).
+    """
+    body = sanitize_body(entry.get("body", {}))
+    key = cache.key(body) if cache is not None else None
+    first_token: List[float] = []
+
+    def _delta(text: str) -> None:
+        if not first_token:
+            first_token.append(time.perf_counter())
+        on_delta(text)  # type: ignore[misc]
+
+    if key is not None and not bypass_cache:
+        t0 = time.perf_counter()
+        hit = await asyncio.to_thread(cache.get, key)  # type: ignore[union-attr]
+        if hit is not None:
+            if on_delta is not None and hit.get("output_text"):
+                _delta(hit["output_text"])
+            result = _success_result(entry, hit.get("request_body") or body,
+                                     SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+                                         content=hit.get("output_text")))], usage=hit.get("usage")),
+                                     int((time.perf_counter() - t0) * 1000))
+            result["cache_hit"] = True
+            if first_token:
+                result["first_token_ms"] = int((first_token[0] - t0) * 1000)
+            return result
+
+    async with sem:
+        t0 = time.perf_counter()
+        for attempt in range(2):
+            try:
+                if on_delta is None:
+                    call = client.chat.completions.create(**_create_kwargs(body))
+                else:
+                    call = _consume_stream(client, body, _delta)
+                resp = await asyncio.wait_for(call, timeout)
+                break
+            except asyncio.TimeoutError:
+                return _error_result(entry, body, f"timeout: sem resposta em {timeout:g}s")
+            except Exception as ex:
+                # depois de repassar texto ao cliente não dá para recomeçar a resposta
+                if attempt or first_token or not _should_retry_without_sampling(str(ex), body):
+                    return _error_result(entry, body, str(ex))
+                body = {k: v for k, v in body.items() if k not in _SAMPLING_PARAMS}
+    result = _success_result(entry, body, resp, int((time.perf_counter() - t0) * 1000))
+    if first_token:
+        result["first_token_ms"] = int((first_token[0] - t0) * 1000)
+    if key is not None and result.get("output_text"):
+        await asyncio.to_thread(cache.put, key, result)  # type: ignore[union-attr]
+    return result
+
+
+async def run_preview(payload: Dict[str, Any], *, topics: Optional[List[str]] = None,
+                      max_tokens_override: Optional[Dict[str, int]] = None,
+                      layout: Optional[str] = None, combined: bool = False,
+                      concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                      bypass_cache: bool = False) -> List[Dict[str, Any]]:
+    """Executa as entradas via chat completions, todas em paralelo, e retorna os resultados na ordem dos tópicos.
+
+    Retorna lista de dicts: {custom_id, topic, output_text, usage?, cached_tokens, latency_ms, request_body, error?}.
+    `cached_tokens` vem de `usage.prompt_tokens_details` (prefixo servido do prompt cache).
+    No máximo `concurrency` requisições simultâneas (PREVIEW_CONCURRENCY); cada uma tem até `timeout`
+    segundos (PREVIEW_REQUEST_TIMEOUT) e vira item com `error` se estourar. Cancelar a chamada
+    (cliente desconectou) cancela as requisições em andamento. Respostas repetidas vêm do cache
+    em disco (`cache_hit`), salvo com `bypass_cache`.
+    """
+    client = get_async_client()
+    entries = await asyncio.to_thread(
+        build_preview_entries_from_payload,
+        payload,
+        topics=topics,
+        max_tokens_override=max_tokens_override,
+        layout=layout,
+        combined=combined,
+    )
+    sem = asyncio.Semaphore(max(1, concurrency or PREVIEW_CONCURRENCY))
+    cache = get_preview_cache()
+    return list(await asyncio.gather(*(
+        _run_entry(client, e, sem, timeout or PREVIEW_REQUEST_TIMEOUT, cache=cache, bypass_cache=bypass_cache)
+        for e in entries
+    )))
+
+
+async def stream_preview(payload: Dict[str, Any], *, topics: Optional[List[str]] = None,
+                         max_tokens_override: Optional[Dict[str, int]] = None,
+                         layout: Optional[str] = None, combined: bool = False,
+                         concurrency: Optional[int] = None,
+                         timeout: Optional[float] = None,
+                         bypass_cache: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Variante em streaming de `run_preview`: gera eventos (tipo, dados) conforme as respostas chegam.
+
+    - `start`: {topics: [{custom_id, topic}]} na ordem das entradas;
+    - `delta`: {custom_id, topic, text} a cada trecho de texto recebido (resposta do cache: um trecho só);
+    - `topic_done`: o item do tópico (mesmo formato de `run_preview`, com `first_token_ms`);
+    - `done`: {items} com todos os itens na ordem das entradas.
+    Fechar o gerador (cliente desconectou) cancela as requisições em andamento.
+    """
+    client = get_async_client()
+    entries = await asyncio.to_thread(
+        build_preview_entries_from_payload,
         payload,
         topics=topics,
         max_tokens_override=max_tokens_override,
+        layout=layout,
+        combined=combined,
     )
-    results: List[Dict[str, Any]] = []
-    STRICT_SAMPLING_MODELS = {"gpt-5", "openai_o4-mini", "o4-mini"}
-
-    def _sanitize(body: Dict[str, Any]) -> Dict[str, Any]:
-        b = dict(body)
-        model = b.get("model")
-        if model in STRICT_SAMPLING_MODELS:
-            # Esses modelos só aceitam defaults (sem temperature/top_p/seed customizado)
-            b.pop("temperature", None)
-            b.pop("top_p", None)
-            b.pop("seed", None)
-        return b
-
-    for e in entries:
-        original_body = e.get("body", {})
-        body = _sanitize(original_body)
+    yield "start", {"topics": [{"custom_id": e.get("custom_id"), "topic": _topic_of(e.get("custom_id"))}
+                               for e in entries]}
+    sem = asyncio.Semaphore(max(1, concurrency or PREVIEW_CONCURRENCY))
+    queue: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+    cache = get_preview_cache()
+
+    async def _one(i: int, entry: Dict[str, Any]) -> None:
+        cid = entry.get("custom_id")
+        topic = _topic_of(cid)
+
+        def _on_delta(text: str) -> None:
+            queue.put_nowait(("delta", {"custom_id": cid, "topic": topic, "text": text}))
+
         try:
-            resp = client.chat.completions.create(**body)
-        except Exception as ex:
-            msg = str(ex)
-            # Retry heurístico: se erro de unsupported_value para sampling, remover e tentar 1 vez
-            if any(tok in msg for tok in ("unsupported_value", "temperature", "top_p")) and (
-                "temperature" in body or "top_p" in body or "seed" in body
-            ):
-                body_retry = dict(body)
-                body_retry.pop("temperature", None)
-                body_retry.pop("top_p", None)
-                body_retry.pop("seed", None)
-                try:
-                    resp = client.chat.completions.create(**body_retry)
-                    body = body_retry  # usar body efetivo
-                except Exception as ex2:
-                    results.append({
-                        "custom_id": e.get("custom_id"),
-                        "error": str(ex2),
-                        "request_body": body_retry,
-                    })
-                    continue
-            else:
-                results.append({
-                    "custom_id": e.get("custom_id"),
-                    "error": msg,
-                    "request_body": body,
-                })
-                continue
-
-        # Sucesso
-        content = None
-        if hasattr(resp, "choices") and resp.choices:
-            first = resp.choices[0]
-            if hasattr(first, "message") and getattr(first.message, "content", None):
-                content = first.message.content
-        usage = getattr(resp, "usage", None)
-        usage_data = None
-        if usage is not None:
-            usage_data = getattr(usage, "model_dump", lambda: usage)()
-        results.append({
-            "custom_id": e.get("custom_id"),
-            "output_text": content,
-            "usage": usage_data,
-            "request_body": body,
-        })
-    return results
+            results[i] = await _run_entry(client, entry, sem, timeout or PREVIEW_REQUEST_TIMEOUT, _on_delta,
+                                          cache=cache, bypass_cache=bypass_cache)
+        except Exception as exc:  # o consumidor conta um topic_done por entrada: nunca deixar de emitir
+            results[i] = _error_result(entry, entry.get("body", {}), str(exc))
+        queue.put_nowait(("topic_done", results[i]))
+
+    tasks = [asyncio.ensure_future(_one(i, e)) for i, e in enumerate(entries)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            kind, data = await queue.get()
+            if kind == "topic_done":
+                remaining -= 1
+            yield kind, data
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield "done", {"items": results}
@@ -0,0 +1,308 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    stage       TEXT NOT NULL,
+    params      TEXT NOT NULL DEFAULT '{}',
+    state       TEXT NOT NULL DEFAULT '{}',
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id       TEXT PRIMARY KEY,
+    job_id         TEXT,
+    input_path     TEXT,
+    input_file_id  TEXT,
+    status         TEXT,
+    stage          TEXT NOT NULL DEFAULT 'submitted',
+    request_counts TEXT NOT NULL DEFAULT '{}',
+    output_file_id TEXT,
+    error_file_id  TEXT,
+    data           TEXT NOT NULL DEFAULT '{}',
+    est_tokens     INTEGER,
+    model          TEXT,
+    created_at     REAL NOT NULL,
+    updated_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batches_job ON batches(job_id);
+CREATE INDEX IF NOT EXISTS batches_input ON batches(input_path);
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256       TEXT NOT NULL,
+    bytes        INTEGER NOT NULL,
+    file_id      TEXT NOT NULL,
+    filename     TEXT,
+    uses         INTEGER NOT NULL DEFAULT 1,
+    created_at   REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    PRIMARY KEY (sha256, bytes)
+);
+"""
+# Colunas adicionadas depois da primeira versão do schema (bancos existentes ganham via ALTER TABLE)
+_MIGRATIONS = {"batches": {"est_tokens": "INTEGER", "model": "TEXT"}}
+_TERMINAL = ("completed", "failed", "cancelled", "expired")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class JobRegistry:
+    """Registro local (SQLite) de jobs e batches: ids, arquivos de entrada, etapas e timestamps.
+
+    Sobrevive a restarts da API: jobs não terminados são retomados no startup e as consultas de
+    listagem/status são respondidas daqui, sem chamar a OpenAI. Uma conexão por operação (WAL),
+    então pode ser usado das threads de `asyncio.to_thread`; do event loop, as escritas vão por
+    `write()`, que as executa numa thread de escrita sem bloquear o loop.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            for table, columns in _MIGRATIONS.items():
+                have = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+                for name, decl in columns.items():
+                    if name not in have:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+        self.write_errors = 0
+        self._writes: "queue.Queue[Any]" = queue.Queue()
+        self._pending: Dict[Any, tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # -------- escrita em segundo plano --------
+
+    def write(self, fn: Callable[..., Any], *args: Any, key: Any = None, **kwargs: Any) -> None:
+        """Enfileira `fn(*args, **kwargs)` (ex.: `self.save_job`) para a thread de escrita e retorna na hora.
+
+        As escritas saem na ordem em que entraram. Com `key`, uma escrita com a mesma chave que ainda
+        está na fila é substituída (vale o estado mais recente, como em save_job). Erros (ex.: banco
+        travado além do timeout) são contados em `write_errors` e logados, nunca repassados a quem chamou.
+        """
+        with self._pending_lock:
+            if key is not None and key in self._pending:
+                self._pending[key] = (fn, args, kwargs)
+                return
+            token = key if key is not None else object()
+            self._pending[token] = (fn, args, kwargs)
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="registry-writer", daemon=True)
+                self._writer.start()
+        self._writes.put(token)
+
+    def _write_loop(self) -> None:
+        while True:
+            token = self._writes.get()
+            try:
+                with self._pending_lock:
+                    fn, args, kwargs = self._pending.pop(token)
+                try:
+                    fn(*args, **kwargs)
+                except Exception as exc:
+                    self.write_errors += 1
+                    print(f"AVISO: falha ao gravar no registro ({getattr(fn, '__name__', fn)}): {exc}",
+                          file=sys.stderr)
+            finally:
+                self._writes.task_done()
+
+    def flush(self) -> None:
+        """Bloqueia até a fila de escritas esvaziar (shutdown / fim do CLI)."""
+        self._writes.join()
+
+    # -------- jobs --------
+
+    def save_job(self, state: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> None:
+        """Grava o estado do job (`Job.to_dict()`) e liga seus batches ao job."""
+        with self._conn() as conn:
+            conn.execute(
+                """INSERT INTO jobs (job_id, kind, status, stage, params, state, created_at, updated_at, finished_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(job_id) DO UPDATE SET status=excluded.status, stage=excluded.stage,
+                       params=excluded.params, state=excluded.state, updated_at=excluded.updated_at,
+                       finished_at=excluded.finished_at""",
+                (state["job_id"], state["kind"], state["status"], state["stage"], _dumps(params or {}),
+                 _dumps(state), state["created_at"], state["updated_at"], state.get("finished_at")),
+            )
+            for batch_id in state.get("batch_ids") or []:
+                conn.execute("UPDATE batches SET job_id=? WHERE batch_id=? AND job_id IS NULL",
+                             (state["job_id"], batch_id))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+        return self._job_row(row) if row else None
+
+    def list_jobs(self, *, status: Optional[List[str]] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        sql = "SELECT * FROM jobs"
+        args: List[Any] = []
+        if status:
+            sql += f" WHERE status IN ({','.join('?' * len(status))})"
+            args.extend(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._conn() as conn:
+            return [self._job_row(r) for r in conn.execute(sql, args).fetchall()]
+
+    @staticmethod
+    def _job_row(row: sqlite3.Row) -> Dict[str, Any]:
+        state = json.loads(row["state"] or "{}")
+        state["params"] = json.loads(row["params"] or "{}")
+        return state
+
+    # -------- batches --------
+
+    def record_batch(self, batch_id: str, *, input_path: Optional[str] = None, input_file_id: Optional[str] = None,
+                     job_id: Optional[str] = None, data: Optional[Dict[str, Any]] = None,
+                     stage: Optional[str] = None, est_tokens: Optional[int] = None,
+                     model: Optional[str] = None) -> None:
+        """Cria/atualiza o registro do batch; campos None não sobrescrevem o que já existe.
+
+        est_tokens: tokens de entrada estimados (o que o batch ocupa do limite de tokens enfileirados
+        de `model`).
+        """
+        data = data or {}
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                """INSERT INTO batches (batch_id, job_id, input_path, input_file_id, status, stage, request_counts,
+                                        output_file_id, error_file_id, data, est_tokens, model, created_at,
+                                        updated_at)
+                   VALUES (?, ?, ?, ?, ?, COALESCE(?, 'submitted'), ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(batch_id) DO UPDATE SET
+                       job_id=COALESCE(excluded.job_id, batches.job_id),
+                       input_path=COALESCE(excluded.input_path, batches.input_path),
+                       input_file_id=COALESCE(excluded.input_file_id, batches.input_file_id),
+                       status=COALESCE(excluded.status, batches.status),
+                       stage=COALESCE(?, batches.stage),
+                       request_counts=CASE WHEN ? THEN excluded.request_counts ELSE batches.request_counts END,
+                       output_file_id=COALESCE(excluded.output_file_id, batches.output_file_id),
+                       error_file_id=COALESCE(excluded.error_file_id, batches.error_file_id),
+                       data=CASE WHEN ? THEN excluded.data ELSE batches.data END,
+                       est_tokens=COALESCE(excluded.est_tokens, batches.est_tokens),
+                       model=COALESCE(excluded.model, batches.model),
+                       updated_at=excluded.updated_at""",
+                (batch_id, job_id, input_path, input_file_id or data.get("input_file_id"), data.get("status"), stage,
+                 _dumps(data.get("request_counts") or {}), data.get("output_file_id"), data.get("error_file_id"),
+                 _dumps(data), est_tokens, model, now, now, stage, bool(data.get("request_counts")), bool(data)),
+            )
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM batches WHERE batch_id=?", (batch_id,)).fetchone()
+        return self._batch_row(row) if row else None
+
+    def list_batches(self, *, job_id: Optional[str] = None, status: Optional[str] = None,
+                     limit: int = 100) -> List[Dict[str, Any]]:
+        sql = "SELECT * FROM batches WHERE 1=1"
+        args: List[Any] = []
+        if job_id:
+            sql += " AND job_id=?"
+            args.append(job_id)
+        if status:
+            sql += " AND status=?"
+            args.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._conn() as conn:
+            return [self._batch_row(r) for r in conn.execute(sql, args).fetchall()]
+
+    def active_batches(self, *, since: float = 0.0) -> List[Dict[str, Any]]:
+        """Batches ainda não terminados na OpenAI (status vazio ou não terminal), criados desde `since`."""
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"""SELECT * FROM batches
+                    WHERE (status IS NULL OR status NOT IN ({','.join('?' * len(_TERMINAL))})) AND created_at >= ?
+                    ORDER BY created_at""",
+                [*_TERMINAL, since],
+            ).fetchall()
+        return [self._batch_row(r) for r in rows]
+
+    def job_batches_for_inputs(self, job_id: str, input_paths: List[str]) -> Dict[str, str]:
+        """{input_path: batch_id} dos batches que o job `job_id` já criou a partir desses arquivos."""
+        if not input_paths:
+            return {}
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"""SELECT input_path, batch_id FROM batches
+                    WHERE job_id=? AND input_path IN ({','.join('?' * len(input_paths))})
+                    ORDER BY created_at""",
+                [job_id, *input_paths],
+            ).fetchall()
+        return {r["input_path"]: r["batch_id"] for r in rows}
+
+    # -------- uploads (Files API) --------
+
+    def get_upload(self, sha256: str, size: int) -> Optional[Dict[str, Any]]:
+        """Upload já feito de um arquivo com este conteúdo (sha256 + tamanho), se houver."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM uploads WHERE sha256=? AND bytes=?", (sha256, size)).fetchone()
+        return dict(row) if row else None
+
+    def record_upload(self, sha256: str, size: int, file_id: str, filename: Optional[str] = None) -> None:
+        """Grava (ou marca mais um uso de) o file_id enviado para este conteúdo."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                """INSERT INTO uploads (sha256, bytes, file_id, filename, uses, created_at, last_used_at)
+                   VALUES (?, ?, ?, ?, 1, ?, ?)
+                   ON CONFLICT(sha256, bytes) DO UPDATE SET
+                       uses=CASE WHEN uploads.file_id = excluded.file_id THEN uploads.uses + 1 ELSE 1 END,
+                       created_at=CASE WHEN uploads.file_id = excluded.file_id THEN uploads.created_at
+                                       ELSE excluded.created_at END,
+                       file_id=excluded.file_id,
+                       filename=COALESCE(excluded.filename, uploads.filename),
+                       last_used_at=excluded.last_used_at""",
+                (sha256, size, file_id, filename, now, now),
+            )
+
+    def forget_upload(self, sha256: str, size: int) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM uploads WHERE sha256=? AND bytes=?", (sha256, size))
+
+    @staticmethod
+    def _batch_row(row: sqlite3.Row) -> Dict[str, Any]:
+        out = dict(row)
+        out["request_counts"] = json.loads(out.get("request_counts") or "{}")
+        out["data"] = json.loads(out.get("data") or "{}")
+        return out
+
+
+_registry: Optional[JobRegistry] = None
+
+
+def get_registry() -> JobRegistry:
+    """Registro padrão do processo (JOB_REGISTRY_DB, default outputs/_registry.db)."""
+    global _registry
+    path = Path(os.getenv("JOB_REGISTRY_DB", "outputs/_registry.db"))
+    if _registry is None or _registry.path != path:
+        _registry = JobRegistry(path)
+    return _registry
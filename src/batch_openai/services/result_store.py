@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ..utils.files import safe_name
+
+
+class ResultStore:
+    """Armazém de resultados endereçado por conteúdo: (model, topic, hash, lang, cfg) → saída por segmento.
+
+    Layout: <root>/<model>/<topic>/<lang>/<hash>/<cfg>/seg-NNN.json (cada nível passa por `safe_name`:
+    os componentes vêm do custom_id e não podem sair da raiz)
+    `cfg` é o hash da configuração do prompt (template, system prompt, layout e orçamento de
+    segmentação; ver `input_builder._config_hash`): editar prompts/*.md ou mudar
+    SEGMENT_TOKEN_BUDGET invalida as saídas guardadas. Vazio = layout antigo, sem esse nível.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+
+    def _path(self, model: str, topic: str, h8: str, lang: str, seg: int, cfg: str = "") -> Path:
+        base = (self.root / safe_name(model, "_model") / safe_name(topic, "_topic") / safe_name(lang, "_lang")
+                / safe_name(h8, "_hash"))
+        return (base / safe_name(cfg) if cfg else base) / f"seg-{int(seg):03d}.json"
+
+    def get(self, model: str, topic: str, h8: str, lang: str, seg: int, cfg: str = "") -> Optional[Dict[str, Any]]:
+        p = self._path(model, topic, h8, lang, seg, cfg)
+        try:
+            return json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def has(self, model: str, topic: str, h8: str, lang: str, seg: int, cfg: str = "") -> bool:
+        return self._path(model, topic, h8, lang, seg, cfg).exists()
+
+    def put(self, model: str, topic: str, h8: str, lang: str, seg: int, content: str, *, cfg: str = "",
+            custom_id: Optional[str] = None, batch_id: Optional[str] = None) -> Path:
+        p = self._path(model, topic, h8, lang, seg, cfg)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        data = {"custom_id": custom_id, "batch_id": batch_id, "content": content, "stored_at": int(time.time())}
+        tmp = p.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, p)
+        return p
+
+
+def get_store() -> ResultStore:
+    """Store padrão do processo (RESULT_STORE_DIR, default outputs/_store)."""
+    return ResultStore(Path(os.getenv("RESULT_STORE_DIR", "outputs/_store")))
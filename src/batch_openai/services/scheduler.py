@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .batch_service import submit as svc_submit
+from ..utils.files import read_jsonl
+from ..utils.tokens import get_estimator, lookup_by_prefix
+
+# Orçamento de submissão: tokens de entrada enfileirados (o limite da organização é por modelo) e nº de
+# batches em andamento ao mesmo tempo. 0 = sem limite.
+ENQUEUED_TOKEN_LIMIT = int(os.getenv("BATCH_ENQUEUED_TOKEN_LIMIT", "0"))
+MAX_CONCURRENT_BATCHES = int(os.getenv("BATCH_MAX_CONCURRENT", "0"))
+
+
+def _env_token_limits() -> Dict[str, int]:
+    """BATCH_ENQUEUED_TOKEN_LIMITS (JSON {"modelo": n}, por prefixo); inválido = vazio."""
+    raw = os.getenv("BATCH_ENQUEUED_TOKEN_LIMITS")
+    if not raw:
+        return {}
+    try:
+        return {str(k): int(v) for k, v in json.loads(raw).items()}
+    except (ValueError, TypeError, AttributeError):
+        print(f"AVISO: BATCH_ENQUEUED_TOKEN_LIMITS inválido ({raw!r}); usando BATCH_ENQUEUED_TOKEN_LIMIT")
+        return {}
+
+
+def _message_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(str(part.get("text") or "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _estimate_body(body: Dict[str, Any]) -> int:
+    estimator = get_estimator(str(body.get("model") or ""))
+    return sum(estimator.count(_message_text(m.get("content"))) for m in body.get("messages") or [])
+
+
+def estimate_input(input_path: str, index_path: Optional[Path] = None) -> Tuple[int, str]:
+    """Tokens de entrada estimados de um .jsonl da Batch API (o que ele ocupa na fila da organização) e o modelo.
+
+    Usa `estimated_prompt_tokens` do índice do builder (`<input>.index.jsonl` ou `index_path`) e,
+    para requisições fora do índice, estima pelo texto das mensagens (TOKEN_ESTIMATOR). O modelo é o
+    `body.model` da primeira requisição (o builder grava um modelo por shard).
+    """
+    p = Path(input_path)
+    if not p.exists():
+        raise FileNotFoundError(f"arquivo de entrada não encontrado: {input_path}")
+    if p.suffix.lower() != ".jsonl":
+        raise ValueError(f"arquivo de entrada deve ter extensão .jsonl (recebido: {p.name})")
+    idx = Path(index_path) if index_path else p.with_name(f"{p.stem}.index.jsonl")
+    known: Dict[str, int] = {}
+    for row in read_jsonl(idx):
+        if row.get("custom_id") and row.get("estimated_prompt_tokens") is not None:
+            known[row["custom_id"]] = int(row["estimated_prompt_tokens"])
+    total = 0
+    model = ""
+    with p.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            body = obj.get("body") or {}
+            model = model or str(body.get("model") or "")
+            tokens = known.get(obj.get("custom_id"))
+            total += tokens if tokens is not None else _estimate_body(body)
+    return total, model
+
+
+def estimate_input_tokens(input_path: str, index_path: Optional[Path] = None) -> int:
+    """Só os tokens de `estimate_input`."""
+    return estimate_input(input_path, index_path)[0]
+
+
+class _Pending:
+    __slots__ = ("path", "job_name", "job_id", "completion_window", "index_path", "tokens", "model", "priority",
+                 "future", "queued_at")
+
+    def __init__(self, path: str, job_name: Optional[str], job_id: Optional[str], completion_window: str,
+                 index_path: Optional[Path], tokens: int, model: str, priority: int, future: asyncio.Future) -> None:
+        self.path = path
+        self.job_name = job_name
+        self.job_id = job_id
+        self.completion_window = completion_window
+        self.index_path = index_path
+        self.tokens = tokens
+        self.model = model
+        self.priority = priority
+        self.future = future
+        self.queued_at = time.time()
+
+
+class BatchScheduler:
+    """Fila de submissão de batches com orçamento de tokens enfileirados por modelo e de batches simultâneos.
+
+    `await scheduler.submit(path, ...)` estima os tokens e o modelo do arquivo, entra na fila (maior
+    `priority` primeiro; empate por ordem de chegada) e retorna o batch_id quando o arquivo é de fato
+    enviado — só enquanto os batches em andamento do mesmo modelo + o arquivo cabem no limite do
+    modelo (`token_limits` por prefixo, senão `token_limit`) e o total cabe em `max_concurrent`.
+    A fila é estrita por modelo: o primeiro de cada modelo espera liberar espaço em vez de ser
+    ultrapassado por menores, mas não segura arquivos de outros modelos. Cada batch enviado é
+    acompanhado pelo poller central; ao chegar a um estado terminal, sua cota volta ao orçamento do
+    modelo e a fila anda. Um arquivo maior que o limite inteiro do modelo é enviado sozinho.
+    Sem nenhum limite configurado, os arquivos são enviados na hora e nada é acompanhado.
+    """
+
+    def __init__(self, *, token_limit: Optional[int] = None, token_limits: Optional[Dict[str, int]] = None,
+                 max_concurrent: Optional[int] = None, submit_fn: Optional[Callable[..., str]] = None,
+                 poller: Any = None, registry: Any = None) -> None:
+        self.token_limit = ENQUEUED_TOKEN_LIMIT if token_limit is None else token_limit
+        self.token_limits = _env_token_limits() if token_limits is None else dict(token_limits)
+        self.max_concurrent = MAX_CONCURRENT_BATCHES if max_concurrent is None else max_concurrent
+        self._submit_fn = submit_fn or svc_submit
+        self._poller = poller
+        self._registry = registry
+        # batch_id -> (modelo, tokens estimados)
+        self.active: Dict[str, Tuple[str, int]] = {}
+        self._queue: List[Tuple[int, int, _Pending]] = []
+        self._seq = itertools.count()
+        self._submitting = 0
+        self._submitting_tokens: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._trackers: Dict[str, asyncio.Task] = {}
+        self.stats = {"queued": 0, "submitted": 0, "released": 0, "errors": 0, "oversized": 0}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def poller(self) -> Any:
+        if self._poller is None:
+            from .poller import get_poller
+
+            self._poller = get_poller()
+        return self._poller
+
+    @property
+    def registry(self) -> Any:
+        if self._registry is None:
+            from .registry import get_registry
+
+            self._registry = get_registry()
+        return self._registry
+
+    @property
+    def enqueued_tokens(self) -> Dict[str, int]:
+        """Tokens estimados dos batches em andamento por modelo (inclui os que estão sendo enviados)."""
+        out = dict(self._submitting_tokens)
+        for model, tokens in self.active.values():
+            out[model] = out.get(model, 0) + tokens
+        return out
+
+    @property
+    def limited(self) -> bool:
+        """Há algum limite configurado (tokens ou concorrência); sem limite, batches não são acompanhados."""
+        return bool(self.token_limit or any(self.token_limits.values()) or self.max_concurrent)
+
+    def token_limit_for(self, model: str) -> int:
+        """Limite de tokens enfileirados do modelo: `token_limits` por prefixo, senão `token_limit`."""
+        found = lookup_by_prefix(self.token_limits, model) if model else None
+        return self.token_limit if found is None else found
+
+    async def submit(self, input_path: str, job_name: Optional[str], completion_window: str = "24h", *,
+                     index_path: Optional[Path] = None, priority: int = 0, tokens: Optional[int] = None,
+                     model: Optional[str] = None, job_id: Optional[str] = None) -> str:
+        """Enfileira o arquivo e retorna o batch_id quando ele for submetido.
+
+        job_id: job que pediu o batch; vai para o registro junto com o batch (retomada do job).
+
+        Erros de entrada (arquivo inexistente, extensão) sobem antes de entrar na fila. Cancelar a
+        espera tira o arquivo da fila (se ainda não foi enviado).
+        """
+        self.loop = asyncio.get_running_loop()
+        if tokens is None or model is None:
+            est_tokens, est_model = await asyncio.to_thread(estimate_input, input_path, index_path)
+            tokens = est_tokens if tokens is None else tokens
+            model = est_model if model is None else model
+        limit = self.token_limit_for(model)
+        if limit and tokens > limit:
+            self.stats["oversized"] += 1
+            print(f"AVISO: {input_path} estima {tokens} tokens, acima do limite de tokens enfileirados de "
+                  f"{model or '(sem modelo)'} ({limit}); será submetido sozinho")
+        item = _Pending(input_path, job_name, job_id, completion_window, index_path, tokens, model, priority,
+                        self.loop.create_future())
+        heapq.heappush(self._queue, (-priority, next(self._seq), item))
+        self.stats["queued"] += 1
+        self._dispatch()
+        return await item.future
+
+    def _fits(self, item: _Pending) -> bool:
+        if self.max_concurrent and len(self.active) + self._submitting >= self.max_concurrent:
+            return False
+        limit = self.token_limit_for(item.model)
+        in_flight = self.enqueued_tokens.get(item.model, 0)
+        if limit and in_flight and in_flight + item.tokens > limit:
+            return False
+        return True
+
+    def _dispatch(self) -> None:
+        started: Set[int] = set()
+        blocked: Set[str] = set()
+        for _, seq, item in sorted(self._queue, key=lambda entry: entry[:2]):
+            if item.future.done() or item.model in blocked:  # quem esperava desistiu / modelo já parado
+                continue
+            if not self._fits(item):
+                blocked.add(item.model)
+                continue
+            started.add(seq)
+            self._submitting += 1
+            self._submitting_tokens[item.model] = self._submitting_tokens.get(item.model, 0) + item.tokens
+            task = asyncio.ensure_future(self._submit(item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._queue = [entry for entry in self._queue if entry[1] not in started and not entry[2].future.done()]
+        heapq.heapify(self._queue)
+
+    def _submit_sync(self, item: _Pending) -> str:
+        try:
+            batch_id = self._submit_fn(item.path, item.job_name, item.completion_window, verbose=True,
+                                       index_path=item.index_path, job_id=item.job_id)
+        except SystemExit as exc:  # submit() encerra o processo em erro de entrada (uso via CLI)
+            raise RuntimeError(f"submit failed with code {exc.code}") from None
+        self.registry.record_batch(batch_id, est_tokens=item.tokens, model=item.model or None)
+        return batch_id
+
+    async def _submit(self, item: _Pending) -> None:
+        try:
+            batch_id = await asyncio.to_thread(self._submit_sync, item)
+        except Exception as exc:
+            self.stats["errors"] += 1
+            if not item.future.done():
+                item.future.set_exception(exc)
+        else:
+            # o batch já existe na OpenAI: conta no orçamento mesmo que quem pediu tenha desistido
+            self.stats["submitted"] += 1
+            if self.limited:
+                self._track(batch_id, item.model, item.tokens)
+            if not item.future.done():
+                item.future.set_result(batch_id)
+        finally:
+            self._submitting -= 1
+            left = self._submitting_tokens.get(item.model, 0) - item.tokens
+            if left > 0:
+                self._submitting_tokens[item.model] = left
+            else:
+                self._submitting_tokens.pop(item.model, None)
+            self._dispatch()
+
+    def _track(self, batch_id: str, model: str, tokens: int) -> None:
+        self.active[batch_id] = (model, tokens)
+        if batch_id not in self._trackers:
+            self._trackers[batch_id] = asyncio.ensure_future(self._watch(batch_id))
+
+    async def _watch(self, batch_id: str) -> None:
+        try:
+            await self.poller.wait(batch_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # o poller desistiu do batch (erros seguidos): libera para não travar a fila
+            self.stats["errors"] += 1
+        self._trackers.pop(batch_id, None)
+        if self.active.pop(batch_id, None) is not None:
+            self.stats["released"] += 1
+        self._dispatch()
+
+    async def restore(self) -> List[str]:
+        """Volta a contar no orçamento os batches ainda em andamento no registro (após um restart).
+
+        Sem limite configurado não há orçamento a recompor: nada é restaurado nem consultado.
+        """
+        self.loop = asyncio.get_running_loop()
+        restored: List[str] = []
+        if not self.limited:
+            return restored
+        for record in await asyncio.to_thread(self.registry.active_batches):
+            batch_id = record["batch_id"]
+            if batch_id in self.active:
+                continue
+            tokens = record.get("est_tokens")
+            model = record.get("model")
+            if (tokens is None or model is None) and record.get("input_path") and Path(record["input_path"]).exists():
+                try:
+                    est_tokens, est_model = await asyncio.to_thread(estimate_input, record["input_path"])
+                except (OSError, ValueError):
+                    pass
+                else:
+                    tokens = est_tokens if tokens is None else tokens
+                    model = est_model if model is None else model
+            self._track(batch_id, model or "", int(tokens or 0))
+            restored.append(batch_id)
+        return restored
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Orçamento, ocupação e fila (para o endpoint de estatísticas)."""
+        now = time.time()
+        queued = [item for _, _, item in self._queue if not item.future.done()]
+        return {
+            **self.stats,
+            "token_limit": self.token_limit,
+            "token_limits": dict(self.token_limits),
+            "max_concurrent": self.max_concurrent,
+            "active_batches": len(self.active),
+            "submitting": self._submitting,
+            "enqueued_tokens": self.enqueued_tokens,
+            "pending": len(queued),
+            "pending_tokens": sum(item.tokens for item in queued),
+            "oldest_pending_s": round(max((now - item.queued_at for item in queued), default=0.0), 3),
+        }
+
+    async def shutdown(self) -> None:
+        for _, _, item in self._queue:
+            if not item.future.done():
+                item.future.cancel()
+        self._queue.clear()
+        trackers = list(self._trackers.values())
+        for task in trackers:
+            task.cancel()
+        if trackers:
+            await asyncio.gather(*trackers, return_exceptions=True)
+        self._trackers.clear()
+
+
+_scheduler: Optional[BatchScheduler] = None
+
+
+def get_scheduler() -> BatchScheduler:
+    """Scheduler do processo (BATCH_ENQUEUED_TOKEN_LIMIT[S], BATCH_MAX_CONCURRENT), ligado ao event loop em execução."""
+    global _scheduler
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or (_scheduler.loop is not None and _scheduler.loop is not loop):
+        _scheduler = BatchScheduler()
+    return _scheduler
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .batch_service import TERMINAL_STATES
+from .poller import batch_to_dict
+
+STATUS_TTL = float(os.getenv("BATCH_STATUS_TTL", "5"))
+STATUS_CACHE_MAX = int(os.getenv("BATCH_STATUS_CACHE_MAX", "10000"))
+
+
+class BatchStatusCache:
+    """Cache de `batches.retrieve` com TTL curto e single-flight.
+
+    - Consultas concorrentes ao mesmo id compartilham uma única requisição upstream.
+    - Estados não terminais valem por `ttl` segundos; terminais (completed/failed/...) não mudam
+      mais e ficam em cache até saírem pelo limite de entradas (LRU).
+    - Num miss, um estado terminal já gravado no registro local é servido sem chamar a API.
+    - O poller central alimenta o cache (`put`) a cada atualização que recebe.
+    """
+
+    def __init__(self, client: Any = None, *, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 registry: Any = None) -> None:
+        self._client = client
+        self._registry = registry
+        self.ttl = STATUS_TTL if ttl is None else ttl
+        self.max_entries = STATUS_CACHE_MAX if max_entries is None else max_entries
+        self._entries: "OrderedDict[str, tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "registry_hits": 0, "upstream_calls": 0, "errors": 0}
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            from .openai_client import get_async_client
+
+            self._client = get_async_client()
+        return self._client
+
+    @property
+    def registry(self) -> Any:
+        if self._registry is None:
+            from .registry import get_registry
+
+            self._registry = get_registry()
+        return self._registry
+
+    def _fresh(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(batch_id)
+        if entry is None:
+            return None
+        data, fetched_at = entry
+        if data.get("status") in TERMINAL_STATES or time.monotonic() - fetched_at < self.ttl:
+            self._entries.move_to_end(batch_id)
+            return data
+        return None
+
+    def put(self, data: Dict[str, Any]) -> None:
+        """Guarda um estado recém-obtido (de qualquer fonte) para o id de `data`."""
+        batch_id = data.get("id")
+        if not batch_id:
+            return
+        self._entries[batch_id] = (data, time.monotonic())
+        self._entries.move_to_end(batch_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, batch_id: str) -> Dict[str, Any]:
+        """Estado do batch (dict), do cache ou de uma única chamada upstream compartilhada."""
+        data = self._fresh(batch_id)
+        if data is not None:
+            self.stats["hits"] += 1
+            return data
+        task = self._inflight.get(batch_id)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            # task própria: se quem disparou desistir (cliente desconectou), os demais seguem esperando
+            task = self._inflight[batch_id] = asyncio.ensure_future(self._load(batch_id))
+            task.add_done_callback(lambda t: self._settle(batch_id, t))
+        return await asyncio.shield(task)
+
+    def _settle(self, batch_id: str, task: asyncio.Future) -> None:
+        self._inflight.pop(batch_id, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.stats["errors"] += 1
+            return
+        self.put(task.result())
+
+    async def _load(self, batch_id: str) -> Dict[str, Any]:
+        record = await asyncio.to_thread(self.registry.get_batch, batch_id)
+        if record and record.get("status") in TERMINAL_STATES and record.get("data"):
+            self.stats["registry_hits"] += 1
+            return record["data"]
+        self.stats["upstream_calls"] += 1
+        return batch_to_dict(await self.client.batches.retrieve(batch_id))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Contadores + ocupação do cache (para o endpoint de estatísticas)."""
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "lookups": lookups,
+            "hit_ratio": round((lookups - self.stats["upstream_calls"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "ttl": self.ttl,
+        }
+
+
+_cache: Optional[BatchStatusCache] = None
+
+
+def get_status_cache() -> BatchStatusCache:
+    """Cache de status do processo (BATCH_STATUS_TTL, BATCH_STATUS_CACHE_MAX)."""
+    global _cache
+    if _cache is None:
+        _cache = BatchStatusCache()
+    return _cache
@@ -0,0 +1,186 @@
+"""Índice em memória do call graph do payload SADA.
+
+Nós deduplicados por nome, adjacência em listas de índices e contagem de linhas da subárvore
+pré-calculada (quando o payload não traz `total_subtree_lines`). Os context packers consultam o
+índice (`top_names`, `aggregate_content`) em vez de reordenar os dicts brutos a cada chamada.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def _as_int(v: Any) -> Optional[int]:
+    try:
+        return int(v) if v is not None and v != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _edge_pair(e: Any) -> Optional[Tuple[str, str]]:
+    """Aceita {from,to} / {source,target} / {caller,callee} ou pares [a, b]."""
+    if isinstance(e, dict):
+        src = e.get("from") or e.get("source") or e.get("caller") or e.get("src")
+        dst = e.get("to") or e.get("target") or e.get("callee") or e.get("dst")
+    elif isinstance(e, (list, tuple)) and len(e) >= 2:
+        src, dst = e[0], e[1]
+    else:
+        return None
+    if isinstance(src, str) and isinstance(dst, str) and src and dst:
+        return src, dst
+    return None
+
+
+class CallGraph:
+    __slots__ = ("ids", "names", "node_lines", "given_subtree", "contents", "children", "_subtree", "_ranking")
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.node_lines: List[Optional[int]] = []
+        self.given_subtree: List[Optional[int]] = []
+        self.contents: List[str] = []
+        self.children: List[List[int]] = []
+        self._subtree: Optional[List[int]] = None
+        self._ranking: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add_node(self, name: str, *, node_lines: Any = None, subtree_lines: Any = None,
+                 content: Any = None) -> int:
+        """Insere (ou mescla) um nó; duplicatas mantêm o primeiro valor não vazio de cada campo."""
+        self._subtree = self._ranking = None
+        i = self.ids.get(name)
+        nl, st = _as_int(node_lines), _as_int(subtree_lines)
+        body = content if isinstance(content, str) else ""
+        if i is None:
+            i = len(self.names)
+            self.ids[name] = i
+            self.names.append(name)
+            self.node_lines.append(nl)
+            self.given_subtree.append(st)
+            self.contents.append(body)
+            self.children.append([])
+            return i
+        if self.node_lines[i] is None:
+            self.node_lines[i] = nl
+        if self.given_subtree[i] is None:
+            self.given_subtree[i] = st
+        if not self.contents[i].strip() and body:
+            self.contents[i] = body
+        return i
+
+    def add_edge(self, src: str, dst: str) -> None:
+        self._subtree = self._ranking = None
+        a = self.ids.get(src)
+        if a is None:
+            a = self.add_node(src)
+        b = self.ids.get(dst)
+        if b is None:
+            b = self.add_node(dst)
+        if b not in self.children[a]:
+            self.children[a].append(b)
+
+    def add_edges(self, edges: Iterable[Any]) -> None:
+        """Insere arestas em qualquer formato aceito por `_edge_pair`; formatos desconhecidos são ignorados."""
+        for e in edges or ():
+            pair = _edge_pair(e)
+            if pair is not None:
+                self.add_edge(*pair)
+
+    @classmethod
+    def from_deps(cls, deps: Iterable[Dict[str, Any]], edges: Optional[Iterable[Any]] = None) -> "CallGraph":
+        g = cls()
+        for d in deps or []:
+            if not isinstance(d, dict):
+                continue
+            name = d.get("name")
+            if not isinstance(name, str) or not name:
+                continue
+            g.add_node(name, node_lines=d.get("node_lines"), subtree_lines=d.get("total_subtree_lines"),
+                       content=d.get("content"))
+            for callee in d.get("calls") or ():
+                if isinstance(callee, str) and callee:
+                    g.add_edge(name, callee)
+        g.add_edges(edges or ())
+        return g
+
+    # -------- consultas --------
+
+    def subtree_lines(self) -> List[int]:
+        """Linhas da subárvore por nó (informadas ou calculadas por DFS pós-ordem; ciclos contam uma vez)."""
+        if self._subtree is not None:
+            return self._subtree
+        n = len(self.names)
+        out = [0] * n
+        state = [0] * n  # 0 = não visitado, 1 = na pilha, 2 = concluído
+        for root in range(n):
+            if state[root]:
+                continue
+            stack = [(root, 0)]
+            state[root] = 1
+            while stack:
+                node, k = stack[-1]
+                kids = self.children[node]
+                if self.given_subtree[node] is None and k < len(kids):
+                    stack[-1] = (node, k + 1)
+                    child = kids[k]
+                    if state[child] == 0:
+                        state[child] = 1
+                        stack.append((child, 0))
+                    continue
+                stack.pop()
+                state[node] = 2
+                given = self.given_subtree[node]
+                if given is not None:
+                    out[node] = given
+                else:
+                    out[node] = (self.node_lines[node] or 0) + sum(out[c] for c in kids if state[c] == 2 and c != node)
+        self._subtree = out
+        return out
+
+    def ranking(self) -> List[int]:
+        """Índices ordenados por linhas (node_lines, ou subárvore quando ausente), maior primeiro."""
+        if self._ranking is None:
+            sub = self.subtree_lines()
+            scores = [(self.node_lines[i] or sub[i] or 0, self.names[i]) for i in range(len(self.names))]
+            self._ranking = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        return self._ranking
+
+    def top_names(self, top_n: int = 10) -> List[str]:
+        return [self.names[i] for i in self.ranking()[:top_n]]
+
+    def callees(self, name: str) -> List[str]:
+        i = self.ids.get(name)
+        return [self.names[c] for c in self.children[i]] if i is not None else []
+
+    def aggregate_content(self, max_chars: int = 6000) -> str:
+        """Concatena o corpo das dependências (ordem do payload) até `max_chars`."""
+        parts: List[str] = []
+        acc = 0
+        for nm, body in zip(self.names, self.contents):
+            if not body.strip():
+                continue
+            snippet = f"// DEP: {nm}\n" + body.strip() + "\n"
+            if acc + len(snippet) > max_chars:
+                break
+            parts.append(snippet)
+            acc += len(snippet)
+        return "\n".join(parts)
+
+    # -------- exportação para o payload canônico --------
+
+    def to_deps(self) -> List[Dict[str, Any]]:
+        sub = self.subtree_lines()
+        return [
+            {
+                "name": self.names[i],
+                "node_lines": self.node_lines[i],
+                "total_subtree_lines": sub[i],
+                "content": self.contents[i],
+            }
+            for i in range(len(self.names))
+        ]
+
+    def edge_list(self) -> List[Sequence[str]]:
+        return [[self.names[a], self.names[b]] for a in range(len(self.names)) for b in self.children[a]]
@@ -1,14 +1,33 @@
 import argparse
+import glob
 import hashlib
+import io
 import json
 import re
 import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from typing import BinaryIO, Callable, Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from ..services.result_store import ResultStore, get_store
+from ..utils.ingest import StreamParseError, parse_object_stream
+from ..utils.jsonl import ShardedJsonlWriter, manifest_path_for
+from ..utils.payloads import decode_payload_bytes
+from ..utils.files import safe_name
+from ..utils.templates import CompiledTemplate, get_template
+from ..utils.tokens import MIN_CONTENT_TOKENS, content_budget, get_estimator, split_by_tokens
+from .callgraph import CallGraph
+from .lexers import LineLexer, get_spec
+from .routing import Router, get_router
 
 TEMPLATE_FILES = {
     "diagram_activity": "03-diagram-activity.md",
     "diagram_sequence": "03-diagram-sequence.md",
+    "combined": "06-doc-combined.md",
     "__general": "02-doc-general.md",
 }
 
@@ -26,7 +45,11 @@ DEFAULT_TOPICS = [
     "diagram_sequence",
 ]
 
-DEFAULT_MAX_TOKENS = {
+# Modo combinado: uma requisição por processo/segmento com todos os DEFAULT_TOPICS, cada parte
+# da resposta iniciada pela linha `<<<tópico>>>` (o parser separa de volta em docs/<proc>/<tópico>/)
+COMBINED_TOPIC = "combined"
+
+_TOPIC_MAX_TOKENS = {
     "resumo": 80,
     "fluxo_execucao": 60,
     "regras_negocio": 60,
@@ -34,38 +57,46 @@ DEFAULT_MAX_TOKENS = {
     "diagram_sequence": 70,
 }
 
+DEFAULT_MAX_TOKENS = {
+    **_TOPIC_MAX_TOKENS,
+    # a resposta combinada traz todos os tópicos
+    COMBINED_TOPIC: sum(_TOPIC_MAX_TOKENS[t] for t in DEFAULT_TOPICS),
+}
+
 
-def _read_text(path: Path) -> str:
-    return path.read_text(encoding="utf-8")
+def _sha8(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()[:8]
 
 
-def _fill_template(tpl: str, vars: Dict[str, str]) -> str:
-    out = tpl
-    for k, v in vars.items():
-        out = out.replace(f"{{{{{k}}}}}", v)
-    return out
+def _effective_hash(proc: str, topic: str, vars: Dict[str, str]) -> str:
+    # hash por tópico baseado no conteúdo efetivo (concat chaves relevantes)
+    effective = f"{proc}\n{topic}\n{vars.get('content','')}\n{vars.get('methods','')}\n{vars.get('rules','')}"
+    if topic == COMBINED_TOPIC:
+        effective += f"\n{vars.get('skeleton','')}\n{vars.get('sequence','')}"
+    return _sha8(effective)
 
 
-def _sha8(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()[:8]
+def _config_hash(layout: str, system_prompt: str, template_text: str, budget: int, max_tokens: int) -> str:
+    # tudo o que muda a requisição além do código: template/instruções, layout e orçamento de segmentação
+    return _sha8(f"{layout}\n{budget}\n{max_tokens}\n{system_prompt}\n{template_text}")
 
 
 def _build_custom_id(proc: str, topic: str, seg: int, h8: str, language: str, code_language: str) -> str:
     return f"doc|v1|proc={proc}|topic={topic}|seg={seg}|hash={h8}|lang={language}|code={code_language}"
 
 
-def _build_message_content(topic: str, templates_dir: Path, variables: Dict[str, str]) -> str:
-    if topic in ("diagram_activity", "diagram_sequence"):
-        tpl_file = templates_dir / TEMPLATE_FILES[topic]
-        tpl = _read_text(tpl_file)
-        return _fill_template(tpl, variables)
+def _topic_template(topic: str, templates_dir: Path) -> CompiledTemplate:
+    # templates compilados uma vez por arquivo (recarregados só quando o mtime muda)
+    if topic in ("diagram_activity", "diagram_sequence", COMBINED_TOPIC):
+        return get_template(templates_dir / TEMPLATE_FILES[topic])
     # tópicos baseados no geral com instrução adicional
-    tpl_file = templates_dir / TEMPLATE_FILES["__general"]
-    tpl = _read_text(tpl_file)
     extra = TOPIC_INSTRUCTIONS.get(topic, "")
-    if extra:
-        tpl = extra + "\n\n" + tpl
-    return _fill_template(tpl, variables)
+    prefix = extra + "\n\n" if extra else ""
+    return get_template(templates_dir / TEMPLATE_FILES["__general"], prefix=prefix)
+
+
+def _build_message_content(topic: str, templates_dir: Path, variables: Dict[str, str]) -> str:
+    return _topic_template(topic, templates_dir).render(variables)
 
 
 SYSTEM_PROMPT_DEFAULT = (
@@ -75,8 +106,88 @@ SYSTEM_PROMPT_DEFAULT = (
 )
 
 
+# -------- Layout das mensagens --------
+# inline: template do tópico com o código no meio (instrução do tópico antes dele), system prompt curto.
+# cache: todas as instruções estáticas num system prompt idêntico para todos os tópicos/processos
+#        (prefixo reaproveitável pelo prompt caching) e só o tópico + variáveis no fim da mensagem.
+PROMPT_LAYOUTS = ("inline", "cache")
+
+# Modelos de template no prefixo do layout cache, em ordem fixa
+_LAYOUT_MODELS = (
+    ("__general", "GERAL"),
+    ("diagram_activity", "DIAGRAMA DE ATIVIDADES"),
+    ("diagram_sequence", "DIAGRAMA DE SEQUÊNCIA"),
+    (COMBINED_TOPIC, "COMBINADO"),
+)
+# Ordem fixa das variáveis no fim da mensagem (conteúdo sempre por último)
+_TAIL_SLOTS = ("language", "title", "file_name", "code_language", "processes", "methods", "rules", "skeleton",
+               "sequence", "content")
+
+_prefix_cache: Dict[str, Tuple[Tuple[CompiledTemplate, ...], str]] = {}
+
+
+def resolve_prompt_layout(layout: Optional[str] = None) -> str:
+    layout = (layout or os.getenv("PROMPT_LAYOUT", "inline")).strip().lower()
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"layout de prompt inválido: {layout} (use {', '.join(PROMPT_LAYOUTS)})")
+    return layout
+
+
+def _topic_model_key(topic: str) -> str:
+    return topic if topic in ("diagram_activity", "diagram_sequence", COMBINED_TOPIC) else "__general"
+
+
+def _static_prefix(templates_dir: Path) -> str:
+    """System prompt do layout cache: regras gerais, instrução de cada tópico e todos os modelos.
+
+    Os placeholders viram marcadores `<nome>`, preenchidos pelos blocos no fim da mensagem do usuário.
+    Recalculado só quando algum template é recarregado (mtime).
+    """
+    compiled = tuple(get_template(templates_dir / TEMPLATE_FILES[key]) for key, _ in _LAYOUT_MODELS)
+    hit = _prefix_cache.get(str(templates_dir))
+    if hit is not None and all(a is b for a, b in zip(hit[0], compiled)):
+        return hit[1]
+    titles = dict(_LAYOUT_MODELS)
+    topic_lines = []
+    for topic in DEFAULT_TOPICS + [COMBINED_TOPIC]:
+        extra = TOPIC_INSTRUCTIONS.get(topic, "")
+        topic_lines.append(f"- {topic}: modelo {titles[_topic_model_key(topic)]}." + (f" {extra}" if extra else ""))
+    parts = [
+        SYSTEM_PROMPT_DEFAULT,
+        "# COMO LER A REQUISIÇÃO\n"
+        "A mensagem do usuário informa o TÓPICO e, ao final, os dados de entrada em blocos <nome>...</nome>. "
+        "Nos modelos abaixo, <nome> marca onde cada dado se aplica. "
+        "Siga apenas o modelo e a instrução do tópico solicitado.",
+        "# TÓPICOS\n" + "\n".join(topic_lines),
+    ]
+    for (key, title), tpl in zip(_LAYOUT_MODELS, compiled):
+        parts.append(f"# MODELO {title}\n" + tpl.render({}, missing=lambda name: f"<{name}>").strip())
+    text = "\n\n".join(parts)
+    _prefix_cache[str(templates_dir)] = (compiled, text)
+    return text
+
+
+def _variable_tail(topic: str, templates_dir: Path, variables: Dict[str, str]) -> str:
+    """Mensagem do usuário no layout cache: tópico + variáveis usadas pelo template, em ordem fixa."""
+    slots = set(_topic_template(topic, templates_dir).slots)
+    ordered = [n for n in _TAIL_SLOTS if n in slots] + sorted(slots.difference(_TAIL_SLOTS))
+    blocks = [f"TÓPICO: {topic}"]
+    for name in ordered:
+        blocks.append(f"<{name}>\n{variables.get(name) or ''}\n</{name}>")
+    return "\n\n".join(blocks)
+
+
+def _build_messages(topic: str, templates_dir: Path, variables: Dict[str, str],
+                    layout: str = "inline") -> Tuple[str, str]:
+    """(system, user) da requisição conforme o layout."""
+    if layout == "cache":
+        return _static_prefix(templates_dir), _variable_tail(topic, templates_dir, variables)
+    return SYSTEM_PROMPT_DEFAULT, _build_message_content(topic, templates_dir, variables)
+
+
 def _build_entry(custom_id: str, model: str, content: str, max_tokens: int, *, system_prompt: Optional[str] = None,
-                 temperature: float = 0.2, top_p: float = 0.9, seed: Optional[int] = None) -> Dict[str, Any]:
+                 temperature: float = 0.2, top_p: float = 0.9, seed: Optional[int] = None,
+                 prompt_cache_key: Optional[str] = None) -> Dict[str, Any]:
     return {
         "custom_id": custom_id,
         "method": "POST",
@@ -91,6 +202,7 @@ def _build_entry(custom_id: str, model: str, content: str, max_tokens: int, *, s
             "temperature": temperature,
             "top_p": top_p,
             **({"seed": seed} if seed is not None else {}),
+            **({"prompt_cache_key": prompt_cache_key} if prompt_cache_key else {}),
         },
     }
 
@@ -120,124 +232,211 @@ def _map_code_language(ep_language: str) -> str:
     return mapping.get(key, key or "unknown")
 
 
-def _first_n_lines(text: str, n: int) -> str:
-    return "\n".join(text.splitlines()[:n])
-
+# Tabela de padrões pré-compilados do scanner de passada única
+_RULES_PATTERN = re.compile(r"\b(if|validate|valida|erro|error|throw|return)\b", re.IGNORECASE)
+_CALL_PATTERN = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*\.)?[A-Za-z_][A-Za-z0-9_]*\s*\(")
 
-def _extract_control_skeleton(text: str, max_lines: int = 200) -> str:
-    lines = []
-    for ln in text.splitlines():
-        if any(kw in ln for kw in ("if", "else", "for", "foreach", "while", "switch", "case", "return")):
-            lines.append(ln)
-        if len(lines) >= max_lines:
-            break
-    return "\n".join(lines[:max_lines])
+# Literais que toda linha candidata de rules/calls contém (busca via str.find, sem regex):
+# (buffer, literal, procurar no texto em minúsculas?). Os de skeleton vêm das palavras-chave do lexer.
+_SCAN_NEEDLES = (
+    [("rules", kw, True) for kw in ("if", "valida", "erro", "throw", "return")]
+    + [("calls", "(", False)]
+)
+_ASCII_LOWER = {c: c + 32 for c in range(ord("A"), ord("Z") + 1)}
+# Quebras de linha reconhecidas por str.splitlines() além de \n (\r e \r\n tratados à parte)
+_ASCII_BREAKS = ("\x0b", "\x0c", "\x1c", "\x1d", "\x1e")
+_UNICODE_BREAKS = re.compile("[\x85\u2028\u2029]")
+_BREAKS_TO_LF = {ord(ch): "\n" for ch in _ASCII_BREAKS + ("\x85", "\u2028", "\u2029")}
+
+# Limites de cada buffer preenchido pelo scanner (linhas)
+SCAN_CAPS = {"head": 200, "skeleton": 200, "rules": 20, "calls": 180}
+
+
+def _normalize_line_breaks(text: str) -> str:
+    """Converte para \n todas as quebras de linha de `str.splitlines()` (só copia se houver alguma)."""
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    if any(ch in text for ch in _ASCII_BREAKS) or (not text.isascii() and _UNICODE_BREAKS.search(text)):
+        text = text.translate(_BREAKS_TO_LF)
+    return text
+
+
+def _scan_source(text: str, caps: Dict[str, int], code_language: str = "unknown") -> Dict[str, List[str]]:
+    """Percorre o código uma única vez preenchendo todos os buffers dos context packs.
+
+    Buffers: head (primeiras linhas, brutas), skeleton (linhas com palavras-chave de controle/bloco
+    reais da linguagem, sem comentários), rules (`- <linha>`) e calls (linhas com chamadas). Um
+    lexer da linguagem descarta comentários e ignora o conteúdo de strings ao casar palavras-chave.
+    Após o head, salta direto para a próxima linha candidata (menor próxima ocorrência dos literais
+    dos buffers ainda abertos, ou de uma abertura de comentário de bloco) e para assim que todos
+    atingem o limite em `caps`, sem materializar `splitlines()` do conteúdo inteiro. As quebras
+    de linha são as mesmas de `str.splitlines()` (\r\n, \r, \v, \f, \x1c-\x1e, \x85, \u2028, \u2029).
+    """
+    bufs: Dict[str, List[str]] = {"head": [], "skeleton": [], "rules": [], "calls": []}
+    head, skeleton, rules, calls = bufs["head"], bufs["skeleton"], bufs["rules"], bufs["calls"]
+    cap_head = caps.get("head", 0)
+    cap_skel = caps.get("skeleton", 0)
+    cap_rules = caps.get("rules", 0)
+    cap_calls = caps.get("calls", 0)
+    spec = get_spec(code_language)
+    lexer = LineLexer(spec)
+    text = _normalize_line_breaks(text)
+    n = len(text)
+    lowered: Optional[str] = None
+    if cap_rules or (cap_skel and spec.case_insensitive):
+        lowered = text.lower()
+        if len(lowered) != n:  # minúsculas unicode que mudam o tamanho: manter só ASCII
+            lowered = text.translate(_ASCII_LOWER)
+    needle_table = (
+        [("skeleton", kw, spec.case_insensitive) for kw in spec.keywords]
+        + list(_SCAN_NEEDLES)
+        + [("", opener, False) for opener in spec.blocks]  # estado do lexer: nunca pular aberturas de bloco
+    )
+    # próxima ocorrência conhecida de cada literal (-1 = ainda não calculada)
+    needles = [[-1, buf, lit, lowered if low else text]
+               for buf, lit, low in needle_table if buf == "" or caps.get(buf, 0)]
+    keyword_search = spec.keyword_re.search
+    rules_search = _RULES_PATTERN.search
+    calls_search = _CALL_PATTERN.search
+    pos = 0
+    while pos < n:
+        open_skel = len(skeleton) < cap_skel
+        open_rules = len(rules) < cap_rules
+        open_calls = len(calls) < cap_calls
+        if len(head) >= cap_head:
+            if not (open_skel or open_rules or open_calls):
+                break
+            if lexer.block is not None:
+                # dentro de comentário de bloco: ir direto à linha que o fecha
+                close = text.find(lexer.block, pos)
+                if close == -1:
+                    break
+                pos = text.rfind("\n", pos, close) + 1 or pos
+            else:
+                nxt = n
+                for rec in needles:
+                    if rec[1] and len(bufs[rec[1]]) >= caps[rec[1]]:
+                        continue
+                    if rec[0] < pos:
+                        found = rec[3].find(rec[2], pos)
+                        rec[0] = n if found == -1 else found
+                    if rec[0] < nxt:
+                        nxt = rec[0]
+                if nxt >= n:
+                    break
+                pos = text.rfind("\n", pos, nxt) + 1 or pos
+        end = text.find("\n", pos)
+        if end == -1:
+            end = n
+        ln = text[pos:end]
+        pos = end + 1
+        if len(head) < cap_head:
+            head.append(ln)
+        code, bare = lexer.lex(ln)
+        if not code.strip():
+            continue
+        if open_skel and keyword_search(bare):
+            skeleton.append(code.rstrip())
+        if open_rules and rules_search(code):
+            rules.append(f"- {code.strip()}")
+        if open_calls and calls_search(bare):
+            calls.append(code.strip())
+    return bufs
 
 
-def _extract_rules(text: str, max_rules: int = 20) -> str:
-    # heurística simples: capturar linhas com if/validação/erro/modal
-    patt = re.compile(r"\b(if|validate|valida|erro|error|throw|return)\b", re.IGNORECASE)
-    rules = []
-    for ln in text.splitlines():
-        if patt.search(ln):
-            rules.append(f"- {ln.strip()}")
-        if len(rules) >= max_rules:
-            break
-    return "\n".join(rules)
-
-
-def _top_dep_names(deps: List[Dict[str, Any]], top_n: int = 10) -> List[str]:
-    scored: List[Tuple[int, str]] = []
-    for d in deps or []:
-        name = d.get("name") or ""
-        node_lines = int(d.get("node_lines") or d.get("total_subtree_lines") or 0)
-        scored.append((node_lines, name))
-    scored.sort(reverse=True)
-    return [n for _, n in scored[:top_n] if n]
-
-
-def _aggregate_deps_content(deps: List[Dict[str, Any]], max_chars: int = 6000) -> str:
-    parts: List[str] = []
-    acc = 0
-    for d in deps:
-        nm = d.get("name") or "dep"
-        body = d.get("content") or ""
-        if not isinstance(body, str) or not body.strip():
-            continue
-        snippet = f"// DEP: {nm}\n" + body.strip() + "\n"
-        if acc + len(snippet) > max_chars:
-            break
-        parts.append(snippet)
-        acc += len(snippet)
-    return "\n".join(parts)
-
-
-def _extract_sequence_lines(text: str, max_lines: int = 180) -> str:
-    patt = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*\.)?[A-Za-z_][A-Za-z0-9_]*\s*\(")
-    calls = []
-    for ln in text.splitlines():
-        if patt.search(ln):
-            calls.append(ln.strip())
-        if len(calls) >= max_lines:
-            break
-    return "\n".join(calls)
+def _extract_sequence_lines(text: str, max_lines: int = 180, code_language: str = "unknown") -> str:
+    return "\n".join(_scan_source(text, {"calls": max_lines}, code_language)["calls"])
 
 
 def build_topic_packs(proc: str, content: str, deps: List[Dict[str, Any]], *,
-                      topics: Optional[List[str]] = None) -> Dict[str, Dict[str, str]]:
+                      topics: Optional[List[str]] = None, code_language: str = "unknown",
+                      graph: Optional[CallGraph] = None) -> Dict[str, Dict[str, str]]:
     topics = topics or list(DEFAULT_TOPICS)
-    top_dep_list = _top_dep_names(deps, top_n=10)
+    code_language = _map_code_language(code_language)
+    if graph is None:
+        graph = CallGraph.from_deps(deps)
+    top_dep_list = graph.top_names(10)
     methods_txt = "\n".join(f"- {n}" for n in top_dep_list)
-    rules_txt = _extract_rules(content, max_rules=20)
-    deps_content_block = _aggregate_deps_content(deps)
+    scan = _scan_source(content, SCAN_CAPS, code_language)
+    head, skeleton = scan["head"], scan["skeleton"]
+    rules_txt = "\n".join(scan["rules"])
+    sequence_txt = "\n".join(scan["calls"])
+    if not sequence_txt and ("diagram_sequence" in topics or COMBINED_TOPIC in topics):
+        # fallback: chamadas encontradas no corpo das dependências
+        sequence_txt = _extract_sequence_lines(graph.aggregate_content(), SCAN_CAPS["calls"], code_language)
 
     packs: Dict[str, Dict[str, str]] = {
         "resumo": {
-            "content": _first_n_lines(content, 120) or content,
+            "content": "\n".join(head[:120]) or content,
             "methods": "\n".join(f"- {n}" for n in top_dep_list[:5]),
             "rules": rules_txt,
         },
         "fluxo_execucao": {
-            "content": _extract_control_skeleton(content, 200) or _first_n_lines(content, 200),
+            "content": "\n".join(skeleton[:200]) or "\n".join(head[:200]),
             "methods": methods_txt,
             "rules": rules_txt,
         },
         "regras_negocio": {
-            "content": _first_n_lines(content, 200),
+            "content": "\n".join(head[:200]),
             "methods": "",
             "rules": rules_txt,
         },
         "diagram_activity": {
-            "content": _extract_control_skeleton(content, 150) or _first_n_lines(content, 150),
+            "content": "\n".join(skeleton[:150]) or "\n".join(head[:150]),
             "methods": methods_txt,
             "rules": rules_txt,
         },
         "diagram_sequence": {
-            "content": _extract_sequence_lines(content, 180) or _extract_sequence_lines(deps_content_block, 180),
+            "content": sequence_txt,
             "methods": methods_txt,
             "rules": rules_txt,
         },
     }
+    if COMBINED_TOPIC in topics:
+        # código enviado uma única vez; esqueleto e chamadas como extratos auxiliares
+        packs[COMBINED_TOPIC] = {
+            "content": "\n".join(head[:200]) or content,
+            "skeleton": "\n".join(skeleton[:200]),
+            "sequence": sequence_txt,
+            "methods": methods_txt,
+            "rules": rules_txt,
+        }
 
     return {k: v for k, v in packs.items() if k in topics}
 
 
-def build_inputs_from_payload(payload: Dict[str, Any], templates_dir: Path, out_path: Path, *, language: str = "pt-BR",
+def iter_entries_from_payload(payload: Dict[str, Any], templates_dir: Path, *, language: str = "pt-BR",
                               topics: Optional[List[str]] = None, persist_context: Optional[Path] = None,
-                              max_tokens_override: Optional[Dict[str, int]] = None) -> None:
-    """Gera .jsonl a partir de um payload (formato SADA-like), criando context packs por tópico.
+                              max_tokens_override: Optional[Dict[str, int]] = None,
+                              store: Optional[ResultStore] = None, router: Optional[Router] = None,
+                              layout: Optional[str] = None, combined: bool = False
+                              ) -> Iterator[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]]:
+    """Gera pares (entrada do batch, registro de índice) por tópico/segmento a partir de um payload canônico.
+
+    O registro de índice traz custom_id, modelo e a estimativa de tokens de entrada da requisição.
 
     - persist_context: quando fornecido, salva os context packs em arquivos para auditoria.
+    - store: quando fornecido, segmentos com saída já armazenada (mesmo modelo/tópico/hash/idioma)
+      não geram entrada (None) e o registro de índice sai com `cached=True`.
+    Tópicos cujo template + reserva de saída não deixam MIN_CONTENT_TOKENS para o código também não
+    geram entrada (None): o registro sai com `skipped="over_budget"` e `content_budget`.
+    - router: quando fornecido, classifica o processo e escolhe modelo/max_tokens por tópico; a rota
+      (`route`, `category`, `size`) vai para o registro de índice.
+    - layout: `inline` ou `cache` (default env PROMPT_LAYOUT); ver `_build_messages`.
+    - combined: uma única requisição (tópico `combined`) por segmento com todos os DEFAULT_TOPICS.
     """
-    model = payload.get("model") or os.getenv("DEFAULT_MODEL", "gpt-5")
+    layout = resolve_prompt_layout(layout)
+    default_model = payload.get("model") or os.getenv("DEFAULT_MODEL", "gpt-5")
     ep_language = _map_code_language(payload.get("ep_language", ""))
     entry = payload.get("entry_point") or {}
     proc = entry.get("name") or "processo_desconhecido"
     content = entry.get("content") or ""
     deps = entry.get("deps") or []
+    graph = CallGraph.from_deps(deps, entry.get("edges"))
 
-    topics = topics or list(DEFAULT_TOPICS)
-    packs = build_topic_packs(proc, content, deps, topics=topics)
+    topics = [COMBINED_TOPIC] if combined else (topics or list(DEFAULT_TOPICS))
+    packs = build_topic_packs(proc, content, deps, topics=topics, code_language=ep_language, graph=graph)
+    classification = router.classify(proc, content, ep_language) if router is not None else None
 
     # variáveis comuns
     base_vars = {
@@ -248,63 +447,151 @@ def build_inputs_from_payload(payload: Dict[str, Any], templates_dir: Path, out_
         "context_md": "",
     }
 
-    lines: List[str] = []
     for topic in topics:
         pack = packs.get(topic, {"content": content, "methods": "", "rules": ""})
         vars = {**base_vars, **pack}
-        # custom hash por tópico baseado no conteúdo efetivo (concat chaves relevantes)
-        effective = f"{proc}\n{topic}\n{vars.get('content','')}\n{vars.get('methods','')}\n{vars.get('rules','')}"
-        h8 = _sha8(effective)
+        h8 = _effective_hash(proc, topic, vars)
 
         # opcionalmente persistir packs
         if persist_context is not None:
-            topic_dir = persist_context / proc / topic
+            topic_dir = persist_context / safe_name(proc, "processo") / safe_name(topic)
             topic_dir.mkdir(parents=True, exist_ok=True)
             (topic_dir / "content.md").write_text(vars.get("content", ""), encoding="utf-8")
             (topic_dir / "methods.txt").write_text(vars.get("methods", ""), encoding="utf-8")
             (topic_dir / "rules.txt").write_text(vars.get("rules", ""), encoding="utf-8")
 
-        # chunking simples por tamanho de conteúdo do pack (caracteres)
-        content_text = _build_message_content(topic, templates_dir, {
+        # segmentação por orçamento de tokens: o template (e o system prompt) vai em todo segmento,
+        # então o espaço para código é o orçamento do modelo menos esse overhead e a reserva de saída
+        max_tokens = (max_tokens_override or DEFAULT_MAX_TOKENS).get(topic, 600)
+        route_name = "default"
+        model = default_model
+        if router is not None:
+            route = router.route(classification, topic, default_model, max_tokens)
+            route_name, model, max_tokens = route["name"], route["model"], route["max_tokens"]
+        estimator = get_estimator(model)
+        render_vars = {
             **vars,
-            "content": vars.get("content", ""),
             "processes": vars.get("methods", ""),
             "rules": vars.get("rules", ""),
-        })
-
-        # tamanho alvo aproximado
-        max_chars = 6000  # pequeno/seguro para testes; pode ser configurável
-        segments: List[str] = []
-        if len(content_text) <= max_chars:
-            segments = [content_text]
+        }
+        system_prompt, empty_user = _build_messages(topic, templates_dir, {**render_vars, "content": ""}, layout)
+        overhead = estimator.count(empty_user) + estimator.count(system_prompt)
+        cache_key = f"doc-{_sha8(system_prompt)}" if layout == "cache" else None
+        budget = content_budget(model, overhead, max_tokens)
+        cfg = _config_hash(layout, system_prompt, empty_user, budget, max_tokens)
+
+        # templates sem {{content}} (ex.: diagram_sequence) não carregam código: um único segmento
+        has_content = "content" in _topic_template(topic, templates_dir).slots
+        if budget < (MIN_CONTENT_TOKENS if has_content else 1):
+            # template + reserva de saída não deixam espaço: não gera requisição acima do orçamento
+            print(f"AVISO: {proc}/{topic}: template ({overhead} tokens) + saída ({max_tokens}) deixam só {budget} "
+                  f"tokens para o código no orçamento de {model}; tópico não gerado", file=sys.stderr)
+            yield None, {
+                "custom_id": _build_custom_id(proc, topic, 0, h8, language, ep_language),
+                "proc": proc,
+                "topic": topic,
+                "seg": 0,
+                "hash": h8,
+                "lang": language,
+                "model": model,
+                "estimated_prompt_tokens": overhead,
+                "max_completion_tokens": max_tokens,
+                "cached": False,
+                "skipped": "over_budget",
+                "content_budget": budget,
+                "route": route_name,
+                "cfg": cfg,
+            }
+            continue
+        if has_content:
+            chunks = split_by_tokens(vars.get("content", ""), budget, estimator)
         else:
-            # dividir em blocos respeitando quebras de linha
-            buf = []
-            acc = 0
-            for line in content_text.splitlines(True):
-                if acc + len(line) > max_chars and buf:
-                    segments.append("".join(buf))
-                    buf = []
-                    acc = 0
-                buf.append(line)
-                acc += len(line)
-            if buf:
-                segments.append("".join(buf))
-
-        max_tokens_map = max_tokens_override or DEFAULT_MAX_TOKENS
-        for i, seg_txt in enumerate(segments):
+            chunks = [("", 0)]
+        for i, (chunk, chunk_tokens) in enumerate(chunks):
             cid = _build_custom_id(proc, topic, i, h8, language, ep_language)
+            info = {
+                "custom_id": cid,
+                "proc": proc,
+                "topic": topic,
+                "seg": i,
+                "hash": h8,
+                "lang": language,
+                "model": model,
+                "estimated_prompt_tokens": overhead + chunk_tokens,
+                "max_completion_tokens": max_tokens,
+                "cached": False,
+                "route": route_name,
+                "cfg": cfg,
+            }
+            if classification is not None:
+                info["category"] = classification["category"]
+                info["size"] = classification["size"]
+            if store is not None and store.has(model, topic, h8, language, i, cfg):
+                info["cached"] = True
+                yield None, info
+                continue
+            _, seg_txt = _build_messages(topic, templates_dir, {**render_vars, "content": chunk}, layout)
             entry = _build_entry(
                 cid,
                 model,
                 seg_txt,
-                max_tokens_map.get(topic, 600),
+                max_tokens,
+                system_prompt=system_prompt,
                 seed=_sha_seed(h8),
+                prompt_cache_key=cache_key,
             )
-            lines.append(json.dumps(entry, ensure_ascii=False))
+            yield entry, info
+
+
+def _sidecar_path(out_path: Path, kind: str) -> Path:
+    """Arquivo auxiliar ao lado do .jsonl (ex.: foo.jsonl -> foo.index.jsonl)."""
+    return out_path.with_name(f"{out_path.stem}.{kind}.jsonl")
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+def build_inputs_from_payload(payload: Dict[str, Any], templates_dir: Path, out_path: Path, *, language: str = "pt-BR",
+                              topics: Optional[List[str]] = None, persist_context: Optional[Path] = None,
+                              max_tokens_override: Optional[Dict[str, int]] = None,
+                              store: Optional[ResultStore] = None, router: Optional[Router] = None,
+                              layout: Optional[str] = None, combined: bool = False) -> Dict[str, Any]:
+    """Gera .jsonl a partir de um payload (formato SADA-like), criando context packs por tópico.
+
+    As entradas são gravadas em streaming; se ultrapassarem os limites da Batch API por arquivo,
+    a saída é dividida em `<out>.part-NNN.jsonl`, e com roteamento para mais de um modelo cada
+    modelo vai para `<out>.model-<modelo>.jsonl` (um modelo por arquivo, como exige a Batch API).
+    Sempre grava `<out>.manifest.json` (shards) e `<out>.index.jsonl` com a estimativa de tokens
+    de cada entrada (e as reaproveitadas do store).
+
+    - persist_context: quando fornecido, salva os context packs em arquivos para auditoria.
+    - store: modo incremental; segmentos já documentados não são reenviados.
+    - router: roteamento por tópico/categoria (ver tools/routing.py).
+    - layout: layout das mensagens (`inline` | `cache`, default env PROMPT_LAYOUT).
+    - combined: uma requisição por segmento com todos os tópicos (ver COMBINED_TOPIC).
+
+    Retorna {"entries": n, "cached": m, "skipped": k, "manifest": {...}, "manifest_path": str}
+    (skipped: tópicos sem espaço para o código no orçamento).
+    """
+    index_path = _sidecar_path(out_path, "index")
+    entries = 0
+    cached = 0
+    skipped = 0
+    writer = ShardedJsonlWriter(out_path, index_path=index_path)
+    with writer, index_path.open("w", encoding="utf-8") as index_fh:
+        for e, info in iter_entries_from_payload(payload, templates_dir, language=language, topics=topics,
+                                                 persist_context=persist_context,
+                                                 max_tokens_override=max_tokens_override, store=store,
+                                                 router=router, layout=layout, combined=combined):
+            if e is None:
+                if info.get("skipped"):
+                    skipped += 1
+                else:
+                    cached += 1
+            else:
+                writer.write(e)
+                entries += 1
+            index_fh.write(json.dumps(info, ensure_ascii=False) + "\n")
+        manifest = writer.close()
+    return {"entries": entries, "cached": cached, "skipped": skipped, "manifest": manifest,
+            "manifest_path": str(manifest_path_for(out_path))}
 
 
 # -------- Normalizador/adaptador de payload SADA --------
@@ -325,15 +612,53 @@ def _infer_language_from_filenames(files: List[str]) -> str:
     return "unknown"
 
 
-def normalize_payload_sada(payload_raw: Dict[str, Any]) -> Dict[str, Any]:
+class SourceCollector:
+    """Concatena itens de `sources`/`files` ({path, content|code}) com cabeçalho `// FILE:`.
+
+    Recebe um item por vez (`add`), o que permite alimentá-lo direto do parser em streaming.
+    Em `files`, itens string entram só como caminho (para inferir a linguagem).
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.paths: List[str] = []
+        self._out = io.StringIO()
+        self._parts = 0
+
+    def add(self, it: Any) -> None:
+        if isinstance(it, dict):
+            path = it.get("path") or it.get("file") or it.get("name") or ""
+            txt = it.get("content") or it.get("code") or ""
+            if isinstance(path, str) and isinstance(txt, str) and txt.strip():
+                self.paths.append(path)
+                if self._parts:
+                    self._out.write("\n")
+                self._out.write(f"\n\n// FILE: {path}\n")
+                self._out.write(txt)
+                self._parts += 1
+        elif isinstance(it, str) and self.kind == "files":
+            self.paths.append(it)
+
+    def content(self) -> Optional[str]:
+        return self._out.getvalue() if self._parts else None
+
+
+def normalize_payload_sada(payload_raw: Dict[str, Any], *,
+                           streamed: Optional[Dict[str, SourceCollector]] = None) -> Dict[str, Any]:
     """Converte o payload SADA (ou variantes) para o formato canônico esperado por build_inputs_from_payload.
 
     Formato canônico:
       {
         "model": str,
         "ep_language": str,
-        "entry_point": {"name": str, "content": str, "deps": List[Dict]}
+        "entry_point": {"name": str, "content": str, "deps": List[Dict], "edges": List[[str, str]]}
       }
+
+    Cada dep mantém `content` (corpo), `node_lines` e `total_subtree_lines` (calculado pelas arestas
+    quando ausente); nós repetidos entre deps e callgraph.nodes são mesclados.
+
+    - streamed: coletores de `sources`/`files` já preenchidos pelo parser incremental (essas chaves
+      não estão em `payload_raw`).
     """
     # Se já estiver canônico, apenas retorne
     if isinstance(payload_raw.get("entry_point"), dict):
@@ -357,68 +682,60 @@ def normalize_payload_sada(payload_raw: Dict[str, Any]) -> Dict[str, Any]:
             content = v
             break
 
-    # Listas de fontes/arquivos
+    # Listas de fontes/arquivos (já coletadas em streaming, quando vierem de normalize_payload_stream)
     files_collected: List[str] = []
-    if content is None:
-        # sources: [{path, content|code}]
-        sources = pr.get("sources")
-        if isinstance(sources, list):
-            parts = []
-            for it in sources:
-                if not isinstance(it, dict):
-                    continue
-                path = it.get("path") or it.get("file") or it.get("name") or ""
-                txt = it.get("content") or it.get("code") or ""
-                if isinstance(path, str) and isinstance(txt, str) and txt.strip():
-                    files_collected.append(path)
-                    header = f"\n\n// FILE: {path}\n"
-                    parts.append(header + txt)
-            if parts:
-                content = "\n".join(parts)
-
-    if content is None:
-        # files: [{path, content}] (ou lista de caminhos com outro campo de textos)
-        files = pr.get("files")
-        if isinstance(files, list):
-            parts = []
-            for it in files:
-                if isinstance(it, dict):
-                    path = it.get("path") or it.get("file") or it.get("name") or ""
-                    txt = it.get("content") or it.get("code") or ""
-                    if isinstance(path, str) and isinstance(txt, str) and txt.strip():
-                        files_collected.append(path)
-                        header = f"\n\n// FILE: {path}\n"
-                        parts.append(header + txt)
-                elif isinstance(it, str):
-                    files_collected.append(it)
-            if parts:
-                content = "\n".join(parts)
+    for key in ("sources", "files"):
+        if content is not None:
+            break
+        collector = (streamed or {}).get(key)
+        if collector is None:
+            collector = SourceCollector(key)
+            items = pr.get(key)
+            if isinstance(items, list):
+                for it in items:
+                    collector.add(it)
+        files_collected.extend(collector.paths)
+        content = collector.content()
 
     if content is None:
         content = ""
 
-    # Dependências / deps
-    deps: List[Dict[str, Any]] = []
+    # Dependências / deps + callgraph: indexados (nós deduplicados, arestas preservadas)
+    graph = CallGraph()
+
+    def _add_dep(d: Any) -> None:
+        if isinstance(d, str):
+            graph.add_node(d)
+            return
+        if not isinstance(d, dict):
+            return
+        nm = d.get("name") or d.get("id") or d.get("method") or d.get("func")
+        if not isinstance(nm, str) or not nm:
+            return
+        body = next((d[k] for k in ("content", "code", "body", "source")
+                     if isinstance(d.get(k), str) and d[k].strip()), None)
+        graph.add_node(nm, node_lines=d.get("node_lines") or d.get("total_lines"),
+                       subtree_lines=d.get("total_subtree_lines"), content=body)
+        for key in ("calls", "callees", "children"):
+            for callee in d.get(key) or ():
+                callee_name = callee.get("name") or callee.get("id") if isinstance(callee, dict) else callee
+                if isinstance(callee_name, str) and callee_name:
+                    graph.add_edge(nm, callee_name)
+
     raw_deps = pr.get("deps") or pr.get("dependencies") or pr.get("dependencias") or pr.get("methods")
     if isinstance(raw_deps, list):
         for d in raw_deps:
-            if isinstance(d, dict):
-                name_d = d.get("name") or d.get("id") or d.get("method") or d.get("func")
-                node_lines = d.get("node_lines") or d.get("total_lines") or d.get("total_subtree_lines")
-                deps.append({"name": name_d, "node_lines": node_lines})
-            elif isinstance(d, str):
-                deps.append({"name": d, "node_lines": None})
-
-    # callgraph / graph nós (opcional)
+            _add_dep(d)
+
     cg = pr.get("callgraph") or pr.get("graph")
     if isinstance(cg, dict):
         nodes = cg.get("nodes") or []
         if isinstance(nodes, list):
             for n in nodes:
-                if isinstance(n, dict):
-                    nm = n.get("name") or n.get("id")
-                    nl = n.get("node_lines") or n.get("total_lines") or n.get("total_subtree_lines")
-                    deps.append({"name": nm, "node_lines": nl})
+                _add_dep(n)
+        edges = cg.get("edges") or cg.get("links") or []
+        if isinstance(edges, list):
+            graph.add_edges(edges)
 
     # Linguagem
     lang_candidates = [
@@ -437,30 +754,252 @@ def normalize_payload_sada(payload_raw: Dict[str, Any]) -> Dict[str, Any]:
         "entry_point": {
             "name": name,
             "content": content,
-            "deps": deps,
+            "deps": graph.to_deps(),
+            "edges": graph.edge_list(),
         },
     }
 
 
+def normalize_payload_stream(fp: BinaryIO) -> Dict[str, Any]:
+    """Lê e normaliza um payload SADA de um arquivo binário sem carregá-lo inteiro em memória.
+
+    `sources`/`files` são consumidos item a item direto nos coletores do normalizador. Se o
+    conteúdo não for JSON estrito (comentários, vírgulas finais, encoding sem BOM não UTF-8, ...),
+    relê o arquivo inteiro pelo decodificador tolerante (`decode_payload_bytes`).
+    Levanta ValueError se o conteúdo não for um objeto JSON.
+    """
+    streamed = {key: SourceCollector(key) for key in ("sources", "files")}
+    try:
+        top = parse_object_stream(fp, streamed)
+    except StreamParseError:
+        fp.seek(0)
+        payload = decode_payload_bytes(fp.read())
+        if not isinstance(payload, dict):
+            raise ValueError("payload deve ser um objeto JSON")
+        return normalize_payload_sada(payload)
+    norm = normalize_payload_sada(top, streamed=streamed)
+    if norm is top:
+        return norm  # canônico
+    if isinstance(top.get("language"), str):
+        norm.setdefault("language", top["language"])
+    return norm
+
+
+# -------- Modo bulk (vários payloads em paralelo) --------
+
+# (rótulo, caminho do arquivo | None, texto NDJSON | None)
+BulkTask = Tuple[str, Optional[str], Optional[str]]
+
+
+def iter_bulk_tasks(*, payload_dir: Optional[str] = None, payload_glob: Optional[str] = None,
+                    ndjson: Optional[str] = None) -> Iterator[BulkTask]:
+    """Enumera payloads de um diretório (*.json), glob ou stream NDJSON ('-' = stdin), em ordem estável."""
+    if payload_dir:
+        for fp in sorted(Path(payload_dir).glob("*.json")):
+            yield (fp.name, str(fp), None)
+    if payload_glob:
+        for fp in sorted(glob.glob(payload_glob, recursive=True)):
+            yield (Path(fp).name, fp, None)
+    if ndjson:
+        stream = sys.stdin if ndjson == "-" else open(ndjson, "r", encoding="utf-8")
+        try:
+            for n, line in enumerate(stream, start=1):
+                if line.strip():
+                    yield (f"{ndjson}:{n}", None, line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def _build_bulk_task(task: BulkTask, templates_dir: str, persist_context: Optional[str],
+                     store_dir: Optional[str] = None, routing: Optional[Tuple[str, Optional[str]]] = None,
+                     layout: Optional[str] = None, combined: bool = False) -> Dict[str, Any]:
+    """Worker: decodifica, normaliza e serializa as entradas de um payload (executa no pool)."""
+    label, path, text = task
+    t0 = time.perf_counter()
+    try:
+        if path:
+            with open(path, "rb") as fp:
+                norm = normalize_payload_stream(fp)
+        else:
+            payload = decode_payload_bytes((text or "").encode("utf-8"))
+            if not isinstance(payload, dict):
+                raise ValueError("payload deve ser um objeto JSON")
+            norm = normalize_payload_sada(payload)
+        proc = (norm.get("entry_point") or {}).get("name") or "processo_desconhecido"
+        lines: List[Tuple[Optional[str], str]] = []  # (modelo, linha): o writer separa por modelo
+        index_lines: List[str] = []
+        skipped = 0
+        store = ResultStore(Path(store_dir)) if store_dir else None
+        router = get_router(*routing, templates_dir=Path(templates_dir)) if routing else None
+        for e, info in iter_entries_from_payload(norm, Path(templates_dir),
+                                                 persist_context=Path(persist_context) if persist_context else None,
+                                                 store=store, router=router, layout=layout, combined=combined):
+            if e is not None:
+                lines.append((e["body"].get("model"), json.dumps(e, ensure_ascii=False)))
+            elif info.get("skipped"):
+                skipped += 1
+            index_lines.append(json.dumps(info, ensure_ascii=False))
+        return {"label": label, "proc": proc, "lines": lines, "index_lines": index_lines, "skipped": skipped,
+                "error": None, "elapsed": time.perf_counter() - t0}
+    except Exception as e:
+        return {"label": label, "proc": None, "lines": [], "index_lines": [], "skipped": 0, "error": str(e),
+                "elapsed": time.perf_counter() - t0}
+
+
+def _ordered_map(fn: Callable[[BulkTask], Dict[str, Any]], tasks: Iterable[BulkTask],
+                 workers: int) -> Iterator[Dict[str, Any]]:
+    """map() em pool de processos preservando a ordem de entrada, com janela limitada de tarefas."""
+    if workers <= 1:
+        for t in tasks:
+            yield fn(t)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending: deque = deque()
+        for t in tasks:
+            pending.append(ex.submit(fn, t))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def build_inputs_bulk(tasks: Iterable[BulkTask], templates_dir: Path, out_path: Path, *, workers: int = 1,
+                      split: bool = False, persist_context: Optional[Path] = None,
+                      store: Optional[ResultStore] = None,
+                      routing: Optional[Tuple[str, Optional[str]]] = None,
+                      layout: Optional[str] = None, combined: bool = False) -> Dict[str, Any]:
+    """Gera entradas de vários payloads em paralelo, gravando em ordem determinística.
+
+    - split=False: todas as entradas em `out_path` (um único .jsonl).
+    - split=True: `out_path` é um diretório com um `<NNNN>-<proc>.jsonl` (e manifest) por payload.
+    Em ambos, requisições roteadas para modelos diferentes vão para arquivos separados (ShardedJsonlWriter).
+    - routing: (modo, caminho da tabela) repassado aos workers; o Router é criado em cada processo.
+
+    Retorna resumo com tempos por payload e vazão total.
+    """
+    fn = partial(_build_bulk_task, templates_dir=str(templates_dir),
+                 persist_context=str(persist_context) if persist_context else None,
+                 store_dir=str(store.root) if store is not None else None, routing=routing, layout=layout,
+                 combined=combined)
+    if split:
+        out_path.mkdir(parents=True, exist_ok=True)
+    else:
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.perf_counter()
+    items: List[Dict[str, Any]] = []
+    total_entries = 0
+    single = None if split else ShardedJsonlWriter(out_path, index_path=_sidecar_path(out_path, "index"))
+    single_index = None if split else _sidecar_path(out_path, "index").open("w", encoding="utf-8")
+    try:
+        for idx, res in enumerate(_ordered_map(fn, tasks, workers)):
+            item = {k: res[k] for k in ("label", "proc", "error", "elapsed")}
+            item["entries"] = len(res["lines"])
+            item["skipped"] = res["skipped"]
+            item["cached"] = len(res["index_lines"]) - len(res["lines"]) - res["skipped"]
+            if res["error"] is None:
+                if single is not None:
+                    for model, ln in res["lines"]:
+                        single.write(ln, model=model)
+                    for ln in res["index_lines"]:
+                        single_index.write(ln + "\n")
+                else:
+                    target = out_path / f"{idx:04d}-{safe_name(str(res['proc']))}.jsonl"
+                    target_index = _sidecar_path(target, "index")
+                    with ShardedJsonlWriter(target, index_path=target_index) as writer:
+                        for model, ln in res["lines"]:
+                            writer.write(ln, model=model)
+                        item["shards"] = len(writer.close()["shards"])
+                    target_index.write_text("\n".join(res["index_lines"]) + "\n", encoding="utf-8")
+                    item["file"] = str(target)
+                    item["manifest"] = str(manifest_path_for(target))
+                total_entries += item["entries"]
+                print(f"[{idx + 1}] {res['proc']} ({res['label']}): {item['entries']} entradas em "
+                      f"{res['elapsed'] * 1000:.0f} ms")
+            else:
+                print(f"[{idx + 1}] ERRO em {res['label']}: {res['error']}", file=sys.stderr)
+            items.append(item)
+    finally:
+        if single is not None:
+            manifest = single.close()
+            single_index.close()
+
+    elapsed = time.perf_counter() - t0
+    ok = sum(1 for it in items if it["error"] is None)
+    summary = {
+        "payloads": len(items),
+        "ok": ok,
+        "failed": len(items) - ok,
+        "entries": total_entries,
+        "elapsed": elapsed,
+        "payloads_per_s": (len(items) / elapsed) if elapsed > 0 else 0.0,
+        "entries_per_s": (total_entries / elapsed) if elapsed > 0 else 0.0,
+        "items": items,
+    }
+    if single is not None:
+        summary["manifest_path"] = str(manifest_path_for(out_path))
+        summary["shards"] = len(manifest["shards"])
+    print(f"Total: {ok}/{len(items)} payloads, {total_entries} entradas em {elapsed:.2f} s "
+          f"({summary['payloads_per_s']:.1f} payloads/s, {summary['entries_per_s']:.1f} entradas/s)")
+    return summary
+
+
 def main():
     parser = argparse.ArgumentParser(description="Gerador de inputs .jsonl para documentação modular em batch")
     # Removido suporte a --config (multi-processos)
-    parser.add_argument("--payload", help="Caminho para payload JSON (ponto de entrada único)")
-    parser.add_argument("--out", required=True, help="Caminho de saída do .jsonl gerado")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--payload", help="Caminho para payload JSON (ponto de entrada único)")
+    src.add_argument("--payload-dir", help="Diretório com payloads *.json (modo bulk)")
+    src.add_argument("--payload-glob", help="Glob de payloads, ex.: 'payloads/**/*.json' (modo bulk)")
+    src.add_argument("--ndjson", help="Arquivo NDJSON com um payload por linha; '-' lê do stdin (modo bulk)")
+    parser.add_argument("--out", required=True, help="Caminho de saída do .jsonl gerado (diretório com --split)")
     parser.add_argument("--prompts", default="prompts", help="Diretório dos templates de prompts")
     parser.add_argument("--persist-context", help="Diretório para salvar context packs (opcional)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processos paralelos no modo bulk (default: nº de CPUs)")
+    parser.add_argument("--split", action="store_true", help="Modo bulk: um .jsonl por payload dentro de --out")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Não gera entradas já documentadas no result store (RESULT_STORE_DIR)")
+    parser.add_argument("--routing", choices=["off", "heuristic", "classifier"],
+                        help="Roteamento de modelo por tópico/categoria (default: env ROUTING_MODE ou off)")
+    parser.add_argument("--routing-table", help="JSON com a tabela de roteamento (default: env ROUTING_TABLE)")
+    parser.add_argument("--layout", choices=list(PROMPT_LAYOUTS),
+                        help="Layout das mensagens: inline ou cache (prefixo estável; default: env PROMPT_LAYOUT)")
+    parser.add_argument("--combined", action="store_true",
+                        help="Uma requisição por processo/segmento com todos os tópicos (código enviado uma vez)")
     args = parser.parse_args()
 
     templates_dir = Path(args.prompts)
     out_path = Path(args.out)
+    persist_dir = Path(args.persist_context) if args.persist_context else None
+    store = get_store() if args.incremental else None
+    routing_mode = (args.routing or os.getenv("ROUTING_MODE", "off")).lower()
+    routing = (routing_mode, args.routing_table) if routing_mode != "off" else None
+
+    if args.payload_dir or args.payload_glob or args.ndjson:
+        tasks = iter_bulk_tasks(payload_dir=args.payload_dir, payload_glob=args.payload_glob, ndjson=args.ndjson)
+        summary = build_inputs_bulk(tasks, templates_dir, out_path, workers=args.workers, split=args.split,
+                                    persist_context=persist_dir, store=store, routing=routing, layout=args.layout,
+                                    combined=args.combined)
+        print(f"Saída: {out_path}" + (f" ({summary['shards']} shards, manifest: {summary['manifest_path']})"
+                                      if summary.get("shards", 1) > 1 else ""))
+        if summary["failed"]:
+            raise SystemExit(1)
+        return
 
     if not args.payload:
-        raise SystemExit("É necessário informar --payload")
+        raise SystemExit("É necessário informar --payload (ou --payload-dir/--payload-glob/--ndjson)")
     payload = json.loads(Path(args.payload).read_text(encoding="utf-8"))
-    persist_dir = Path(args.persist_context) if args.persist_context else None
-    build_inputs_from_payload(payload, templates_dir, out_path, persist_context=persist_dir)
-
-    print(f"Arquivo gerado: {out_path}")
+    router = get_router(*routing, templates_dir=templates_dir) if routing else None
+    counts = build_inputs_from_payload(payload, templates_dir, out_path, persist_context=persist_dir, store=store,
+                                       router=router, layout=args.layout, combined=args.combined)
+
+    shards = counts["manifest"]["shards"]
+    if len(shards) > 1:
+        print(f"Arquivos gerados: {len(shards)} shards (manifest: {counts['manifest_path']})")
+    else:
+        print(f"Arquivo gerado: {out_path} ({counts['entries']} entradas, {counts['cached']} reaproveitadas)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+"""Lexers leves por linguagem para extração de esqueleto de controle.
+
+Cada linguagem (chaves de `_map_code_language`: csharp, vb, java, python, sql; demais caem no
+genérico) define comentários, strings e palavras-chave de controle/estrutura de bloco. O lexer
+processa uma linha por vez mantendo o estado de comentário de bloco (ou string multi-linha) e
+devolve duas visões: `code` (sem comentários) e `bare` (sem comentários e sem conteúdo de strings),
+usada para casar palavras-chave reais em vez de substrings.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, Optional, Tuple
+
+
+class LexSpec:
+    __slots__ = ("name", "token_re", "line_comments", "blocks", "keywords", "keyword_re", "case_insensitive",
+                 "rem_re")
+
+    def __init__(self, name: str, *, tokens: str, line_comments: Tuple[str, ...],
+                 blocks: Dict[str, str], keywords: Tuple[str, ...], case_insensitive: bool,
+                 rem_comment: bool = False) -> None:
+        self.name = name
+        self.token_re = re.compile(tokens)
+        self.line_comments = line_comments
+        self.blocks = blocks  # abertura -> fechamento (comentários de bloco / strings multi-linha)
+        self.keywords = keywords
+        flags = re.IGNORECASE if case_insensitive else 0
+        self.keyword_re = re.compile(r"\b(?:" + "|".join(keywords) + r")\b", flags)
+        self.case_insensitive = case_insensitive
+        self.rem_re = re.compile(r"^\s*rem\b", re.IGNORECASE) if rem_comment else None
+
+
+_C_STRINGS = r'"(?:[^"\\]|\\.)*"?|\'(?:[^\'\\]|\\.)*\'?'
+
+SPECS: Dict[str, LexSpec] = {
+    "csharp": LexSpec(
+        "csharp",
+        tokens=r'//|/\*|@"(?:[^"]|"")*"?|' + _C_STRINGS,
+        line_comments=("//",),
+        blocks={"/*": "*/"},
+        keywords=("if", "else", "for", "foreach", "while", "do", "switch", "case", "default", "return", "break",
+                  "continue", "goto", "throw", "try", "catch", "finally"),
+        case_insensitive=False,
+    ),
+    "java": LexSpec(
+        "java",
+        tokens=r'//|/\*|"""|' + _C_STRINGS,
+        line_comments=("//",),
+        blocks={"/*": "*/", '"""': '"""'},
+        keywords=("if", "else", "for", "while", "do", "switch", "case", "default", "return", "break", "continue",
+                  "throw", "try", "catch", "finally"),
+        case_insensitive=False,
+    ),
+    "vb": LexSpec(
+        "vb",
+        tokens=r"'|\"(?:[^\"]|\"\")*\"?",
+        line_comments=("'",),
+        blocks={},
+        keywords=("if", "elseif", "else", "select", "case", "for", "next", "do", "loop", "while", "wend", "until",
+                  "exit", "return", "goto", "gosub", "resume", "try", "catch", "finally", "throw", "sub",
+                  "function", "end"),
+        case_insensitive=True,
+        rem_comment=True,
+    ),
+    "python": LexSpec(
+        "python",
+        tokens=r'#|"""|\'\'\'|' + _C_STRINGS,
+        line_comments=("#",),
+        blocks={'"""': '"""', "'''": "'''"},
+        keywords=("if", "elif", "else", "for", "while", "try", "except", "finally", "with", "return", "raise",
+                  "break", "continue", "match", "case", "def", "class", "yield"),
+        case_insensitive=False,
+    ),
+    "sql": LexSpec(
+        "sql",
+        tokens=r"--|/\*|'(?:[^']|'')*'?",
+        line_comments=("--",),
+        blocks={"/*": "*/"},
+        keywords=("if", "else", "elsif", "begin", "end", "while", "loop", "for", "case", "when", "then", "return",
+                  "break", "continue", "goto", "exit", "raiserror", "throw", "try", "catch", "create"),
+        case_insensitive=True,
+    ),
+    "generic": LexSpec(
+        "generic",
+        tokens=r'//|/\*|"(?:[^"\\]|\\.)*"?',
+        line_comments=("//",),
+        blocks={"/*": "*/"},
+        keywords=("if", "else", "elif", "elseif", "for", "foreach", "while", "do", "switch", "case", "return",
+                  "try", "catch", "except", "finally", "throw", "raise", "break", "continue", "goto"),
+        case_insensitive=True,
+    ),
+}
+
+
+def get_spec(code_language: str) -> LexSpec:
+    return SPECS.get(code_language, SPECS["generic"])
+
+
+class LineLexer:
+    """Lexer incremental linha a linha; `block` guarda o fechamento pendente (ou None)."""
+
+    __slots__ = ("spec", "block")
+
+    def __init__(self, spec: LexSpec) -> None:
+        self.spec = spec
+        self.block: Optional[str] = None
+
+    def lex(self, line: str) -> Tuple[str, str]:
+        """Retorna (code, bare) da linha, atualizando o estado de bloco."""
+        spec = self.spec
+        i = 0
+        if self.block is not None:
+            close = line.find(self.block)
+            if close == -1:
+                return "", ""
+            i = close + len(self.block)
+            self.block = None
+        if spec.rem_re is not None and spec.rem_re.match(line, i):
+            return "", ""
+        m = spec.token_re.search(line, i)
+        if m is None:
+            seg = line[i:] if i else line
+            return seg, seg
+        code_parts = []
+        bare_parts = []
+        search = spec.token_re.search
+        while m is not None:
+            seg = line[i : m.start()]
+            code_parts.append(seg)
+            bare_parts.append(seg)
+            tok = m.group(0)
+            if tok in spec.line_comments:
+                i = len(line)
+                break
+            closer = spec.blocks.get(tok)
+            if closer is not None:
+                close = line.find(closer, m.end())
+                if close == -1:
+                    self.block = closer
+                    i = len(line)
+                    break
+                i = close + len(closer)
+            else:
+                # literal de string: mantido em `code`, esvaziado em `bare`
+                code_parts.append(tok)
+                bare_parts.append('""')
+                i = m.end()
+            m = search(line, i)
+        tail = line[i:]
+        code_parts.append(tail)
+        bare_parts.append(tail)
+        return "".join(code_parts), "".join(bare_parts)
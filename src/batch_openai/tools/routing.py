@@ -0,0 +1,176 @@
+"""Roteamento de processos para modelos por tópico/categoria.
+
+Antes de gerar as entradas, cada processo é classificado (heurística local ou o prompt
+`00-classify.json.md`) e cada tópico recebe modelo e orçamento de saída da primeira regra da
+tabela de roteamento que casar. A rota escolhida vai para o índice do builder
+(`<out>.index.jsonl`), e o parser agrega o uso de tokens por rota.
+
+Modos (env ROUTING_MODE ou `--routing`): off | heuristic | classifier.
+Tabela: DEFAULT_ROUTING_TABLE ou um JSON em ROUTING_TABLE (caminho) / `--routing-table`.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from ..utils.payloads import decode_payload_bytes
+from ..utils.templates import get_template
+
+ROUTING_MODES = ("off", "heuristic", "classifier")
+
+# Regras avaliadas em ordem; a primeira que casar define a rota. Critérios ausentes casam com tudo.
+#   match: {"category": [...], "size": [...], "topics": [...], "is_procedure": bool, "has_db": bool}
+#   model: modelo da rota (None = modelo do payload); max_tokens: {tópico: limite} (parcial)
+DEFAULT_ROUTING_TABLE: Dict[str, Any] = {
+    "routes": [
+        {
+            "name": "sql-trivial",
+            "match": {"category": ["sql"], "size": ["trivial", "small"]},
+            "model": "gpt-5-nano",
+        },
+        {
+            "name": "diagramas",
+            "match": {"topics": ["diagram_activity", "diagram_sequence"], "size": ["trivial", "small", "medium"]},
+            "model": "gpt-5-mini",
+        },
+        {
+            "name": "trivial",
+            "match": {"size": ["trivial"]},
+            "model": "gpt-5-mini",
+        },
+    ],
+}
+
+# Faixas de tamanho (linhas do entry point)
+SIZE_CLASSES: Tuple[Tuple[str, int], ...] = (("trivial", 40), ("small", 300), ("medium", 2000))
+
+_CATEGORY_BY_LANGUAGE = {
+    "sql": "sql",
+    "csharp": "oo",
+    "java": "oo",
+    "python": "script",
+    "vb": "script",
+    "javascript": "frontend",
+    "typescript": "frontend",
+}
+_PROCEDURE_RE = re.compile(r"\bcreate\s+(?:or\s+(?:replace|alter)\s+)?(?:procedure|proc|function)\b", re.IGNORECASE)
+_DB_RE = re.compile(
+    r"\b(?:select\s+.+?\s+from|insert\s+into|update\s+\w+\s+set|delete\s+from|adodb|recordset|sqlcommand|"
+    r"dbcontext|executequery|executeupdate|cursor\.execute|preparedstatement)\b",
+    re.IGNORECASE,
+)
+_ENDPOINT_RE = re.compile(
+    r"@(?:Get|Post|Put|Delete|Request)Mapping|\[Http(?:Get|Post|Put|Delete)|\[Route\(|@app\.route|"
+    r"\bApiController\b|\bRestController\b"
+)
+# amostra de código enviada ao classificador (início do entry point)
+CLASSIFIER_SAMPLE_LINES = 200
+
+
+def size_class(lines: int) -> str:
+    for name, limit in SIZE_CLASSES:
+        if lines <= limit:
+            return name
+    return "large"
+
+
+def classify_heuristic(content: str, code_language: str) -> Dict[str, Any]:
+    """Classificação local no formato de saída do `00-classify.json.md` (+ `size`)."""
+    lines = content.count("\n") + 1 if content else 0
+    is_procedure = bool(_PROCEDURE_RE.search(content))
+    category = "sql" if is_procedure else _CATEGORY_BY_LANGUAGE.get(code_language, "unknown")
+    return {
+        "language": code_language or "unknown",
+        "category": category,
+        "has_db": bool(_DB_RE.search(content)),
+        "has_endpoints": bool(_ENDPOINT_RE.search(content)),
+        "is_procedure": is_procedure,
+        "size_hint": {"lines": lines, "bytes": len(content.encode("utf-8"))},
+        "size": size_class(lines),
+        "source": "heuristic",
+    }
+
+
+def load_routing_table(path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or os.getenv("ROUTING_TABLE")
+    if not path:
+        return DEFAULT_ROUTING_TABLE
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+class Router:
+    """Classifica um processo e resolve (modelo, max_tokens, nome da rota) por tópico."""
+
+    def __init__(self, mode: str = "heuristic", table: Optional[Dict[str, Any]] = None, *,
+                 templates_dir: Path = Path("prompts"), classifier_model: Optional[str] = None) -> None:
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"modo de roteamento inválido: {mode} (use {', '.join(ROUTING_MODES)})")
+        self.mode = mode
+        self.table = table if table is not None else load_routing_table()
+        self.templates_dir = templates_dir
+        self.classifier_model = classifier_model or os.getenv("ROUTING_CLASSIFIER_MODEL", "gpt-5-nano")
+
+    def classify(self, proc: str, content: str, code_language: str) -> Dict[str, Any]:
+        base = classify_heuristic(content, code_language)
+        if self.mode != "classifier":
+            return base
+        try:
+            result = self._classify_with_model(proc, content, code_language)
+        except Exception as e:  # classificador é opcional: falha cai na heurística
+            print(f"Aviso: classificador indisponível para {proc} ({e}); usando heurística", file=sys.stderr)
+            return base
+        if not isinstance(result, dict):
+            return base
+        merged = {**base, **{k: v for k, v in result.items() if k in base and k not in ("size_hint", "size")}}
+        merged["source"] = "classifier"
+        return merged
+
+    def _classify_with_model(self, proc: str, content: str, code_language: str) -> Any:
+        from ..services.openai_client import get_client
+
+        sample = "\n".join(content.splitlines()[:CLASSIFIER_SAMPLE_LINES])
+        prompt = get_template(self.templates_dir / "00-classify.json.md").render(
+            {"file_name": proc, "code_language": code_language, "content": sample})
+        resp = get_client().chat.completions.create(
+            model=self.classifier_model,
+            messages=[{"role": "user", "content": prompt}],
+            extra_body={"max_completion_tokens": 200},  # fora da assinatura de SDKs openai<1.45
+        )
+        text = resp.choices[0].message.content or ""
+        return decode_payload_bytes(text.encode("utf-8"))
+
+    def route(self, classification: Dict[str, Any], topic: str, default_model: str,
+              default_max_tokens: int) -> Dict[str, Any]:
+        """Primeira regra que casar com (classificação, tópico); sem regra = rota `default`."""
+        for rule in self.table.get("routes") or []:
+            if _matches(rule.get("match") or {}, classification, topic):
+                return {
+                    "name": rule.get("name") or "rota",
+                    "model": rule.get("model") or default_model,
+                    "max_tokens": int((rule.get("max_tokens") or {}).get(topic, default_max_tokens)),
+                }
+        return {"name": "default", "model": default_model, "max_tokens": default_max_tokens}
+
+
+def _matches(match: Dict[str, Any], classification: Dict[str, Any], topic: str) -> bool:
+    for key, expected in match.items():
+        actual = topic if key == "topics" else classification.get(key)
+        if isinstance(expected, list):
+            if actual not in expected:
+                return False
+        elif actual != expected:
+            return False
+    return True
+
+
+def get_router(mode: Optional[str] = None, table_path: Optional[str] = None, *,
+               templates_dir: Path = Path("prompts")) -> Optional[Router]:
+    """Router conforme `mode` (default env ROUTING_MODE); None quando desligado."""
+    mode = (mode or os.getenv("ROUTING_MODE", "off")).strip().lower()
+    if mode == "off":
+        return None
+    return Router(mode, load_routing_table(table_path), templates_dir=templates_dir)
@@ -1,4 +1,9 @@
+import json
+import re
 from pathlib import Path
+from typing import Optional
+
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
 
 
 def ensure_output_dir(batch_id: str) -> Path:
@@ -8,8 +13,45 @@ def ensure_output_dir(batch_id: str) -> Path:
     return out_dir
 
 
+def safe_name(name: str, default: str = "_") -> str:
+    """Nome de processo/tópico como um único componente de caminho: fora de [A-Za-z0-9._-] vira `_`.
+
+    Nomes vazios ou só de pontos (`.`, `..`) viram `default`.
+    """
+    cleaned = _UNSAFE_NAME_CHARS.sub("_", name or "")
+    return cleaned if cleaned.strip(".") else default
+
+
 def safe_copy_input(input_path: Path, out_dir: Path) -> None:
     """Copia o arquivo de entrada para o diretório de saída, se ainda não for o mesmo caminho."""
     dst = out_dir / "input.jsonl"
     if input_path.resolve() != dst.resolve():
         dst.write_bytes(input_path.read_bytes())
+
+
+def safe_copy_index(input_path: Path, out_dir: Path, index_path: Optional[Path] = None) -> None:
+    """Copia o índice gerado pelo builder (<input>.index.jsonl) para outputs/<batch_id>/input.index.jsonl.
+
+    index_path: índice explícito (ex.: índice único de um manifest com vários shards).
+    """
+    src = index_path or input_path.with_name(f"{input_path.stem}.index.jsonl")
+    dst = out_dir / "input.index.jsonl"
+    if src.exists() and src.resolve() != dst.resolve():
+        dst.write_bytes(src.read_bytes())
+
+
+def read_jsonl(path: Path) -> list:
+    """Lê um .jsonl ignorando linhas vazias/inválidas; lista vazia se o arquivo não existir."""
+    items = []
+    if not path.exists():
+        return items
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                continue
+    return items
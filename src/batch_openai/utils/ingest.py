@@ -0,0 +1,181 @@
+"""Ingestão de payloads grandes: upload em disco (spool), detecção de encoding e parse incremental.
+
+O upload é copiado em blocos para um SpooledTemporaryFile (memória até INGEST_SPOOL_MAX_MEMORY,
+depois disco). O objeto JSON de nível mais alto é lido em streaming: cada chave é decodificada
+isoladamente e os arrays indicados em `sinks` (ex.: `sources`/`files`) são entregues item a item,
+sem materializar a lista. Qualquer desvio do JSON estrito levanta `StreamParseError`, e quem chama
+cai no decodificador tolerante (`decode_payload_bytes`).
+"""
+from __future__ import annotations
+
+import codecs
+import json
+import os
+import re
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional, Protocol, Tuple
+
+from .payloads import _normalize_chars
+
+CHUNK_SIZE = 1 << 20
+SPOOL_MAX_MEMORY = int(os.getenv("INGEST_SPOOL_MAX_MEMORY", str(8 << 20)))
+
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+_WS = re.compile(r"[ \t\n\r\ufeff]*")
+_DECODER = json.JSONDecoder()
+
+
+class StreamParseError(ValueError):
+    """O conteúdo não é JSON estrito (ou o encoding detectado não confere): usar o caminho tolerante."""
+
+
+class ItemSink(Protocol):
+    def add(self, item: Any) -> None: ...
+
+
+async def spool_upload(upload: Any, *, chunk_size: int = CHUNK_SIZE) -> BinaryIO:
+    """Copia um upload (objeto com `await read(n)`, ex.: UploadFile) para um arquivo temporário."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def sniff_encoding(prefix: bytes) -> Tuple[str, int]:
+    """(encoding, tamanho do BOM) a partir do início do arquivo.
+
+    Sem BOM, usa o padrão de bytes nulos dos primeiros caracteres (JSON começa com ASCII)
+    para UTF-16/32; caso contrário UTF-8.
+    """
+    for bom, enc in _BOMS:
+        if prefix.startswith(bom):
+            return enc, len(bom)
+    if len(prefix) >= 4:
+        if prefix[0] == 0 and prefix[1] == 0 and prefix[2] == 0 and prefix[3] != 0:
+            return "utf-32-be", 0
+        if prefix[0] != 0 and prefix[1] == 0 and prefix[2] == 0 and prefix[3] == 0:
+            return "utf-32-le", 0
+    if len(prefix) >= 2:
+        if prefix[0] == 0 and prefix[1] != 0:
+            return "utf-16-be", 0
+        if prefix[0] != 0 and prefix[1] == 0:
+            return "utf-16-le", 0
+    return "utf-8", 0
+
+
+class _CharStream:
+    """Texto decodificado (e normalizado) sob demanda, mantendo só a janela ainda não consumida."""
+
+    def __init__(self, fp: BinaryIO) -> None:
+        prefix = fp.read(4)
+        encoding, bom = sniff_encoding(prefix)
+        self.fp = fp
+        self.decoder = codecs.getincrementaldecoder(encoding)("strict")
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._pending = prefix[bom:]
+
+    def fill(self, size: int = CHUNK_SIZE) -> bool:
+        """Lê mais `size` bytes, descartando o que já foi consumido; False no fim do arquivo."""
+        if self.eof:
+            return False
+        raw = self._pending + self.fp.read(max(size, CHUNK_SIZE))
+        self._pending = b""
+        try:
+            if raw:
+                text = self.decoder.decode(raw)
+            else:
+                text = self.decoder.decode(b"", final=True)
+                self.eof = True
+        except UnicodeDecodeError as exc:
+            raise StreamParseError(f"encoding: {exc}") from None
+        self.buf = self.buf[self.pos:] + _normalize_chars(text)
+        self.pos = 0
+        return bool(text) or not self.eof
+
+    def peek(self) -> str:
+        """Próximo caractere não branco (sem consumir); '' no fim."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise StreamParseError(f"esperado {ch!r} na posição {self.pos}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decodifica o próximo valor JSON completo, lendo mais blocos enquanto estiver truncado."""
+        self.peek()
+        while True:
+            try:
+                val, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # valor truncado no fim da janela (ou inválido): crescer geometricamente até o EOF
+                if not self.fill(len(self.buf)):
+                    raise StreamParseError(f"JSON inválido na posição {self.pos}") from None
+                continue
+            if end == len(self.buf) and isinstance(val, (int, float)) and not self.eof:
+                self.fill()  # número pode continuar no próximo bloco
+                continue
+            self.pos = end
+            return val
+
+
+def parse_object_stream(fp: BinaryIO, sinks: Optional[Dict[str, ItemSink]] = None) -> Dict[str, Any]:
+    """Lê um objeto JSON de `fp` em streaming.
+
+    Arrays das chaves presentes em `sinks` são entregues item a item (`sink.add(item)`) e não
+    aparecem no dict retornado; as demais chaves são decodificadas normalmente.
+    """
+    sinks = sinks or {}
+    stream = _CharStream(fp)
+    top: Dict[str, Any] = {}
+    stream.expect("{")
+    if stream.peek() == "}":
+        stream.pos += 1
+    else:
+        while True:
+            key = stream.value()
+            if not isinstance(key, str):
+                raise StreamParseError("chave de objeto inválida")
+            stream.expect(":")
+            sink = sinks.get(key)
+            if sink is not None and stream.peek() == "[":
+                stream.pos += 1
+                if stream.peek() == "]":
+                    stream.pos += 1
+                else:
+                    while True:
+                        sink.add(stream.value())
+                        sep = stream.peek()
+                        stream.pos += 1
+                        if sep == "]":
+                            break
+                        if sep != ",":
+                            raise StreamParseError(f"esperado ',' ou ']' em {key}")
+            else:
+                top[key] = stream.value()
+            sep = stream.peek()
+            stream.pos += 1
+            if sep == "}":
+                break
+            if sep != ",":
+                raise StreamParseError("esperado ',' ou '}'")
+    if stream.peek() != "":
+        raise StreamParseError("conteúdo após o objeto JSON")
+    return top
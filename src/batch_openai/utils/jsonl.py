@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Limites da Batch API por arquivo de entrada
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_BYTES = 200 * 1024 * 1024
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    return int(raw) if raw and raw.isdigit() else default
+
+
+def manifest_path_for(out_path: Path) -> Path:
+    return out_path.with_name(f"{out_path.stem}.manifest.json")
+
+
+def _model_slug(model: Optional[str]) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model or "") or "default"
+
+
+class _ShardSeries:
+    """Sequência de shards de um único modelo: `<base>` e, após o 1º rollover, `<stem>.part-NNN.jsonl`."""
+
+    def __init__(self, base: Path, max_requests: int, max_bytes: int, model: Optional[str] = None) -> None:
+        self.base = base
+        self.model = model
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.shards: List[Dict[str, Any]] = []
+        self._fh = None
+        self._path: Optional[Path] = None
+        self._requests = 0
+        self._bytes = 0
+        self._open(base)
+
+    def _part_path(self, i: int) -> Path:
+        return self.base.with_name(f"{self.base.stem}.part-{i:03d}.jsonl")
+
+    def _open(self, path: Path) -> None:
+        self._path = path
+        self._fh = path.open("wb")
+        self._requests = 0
+        self._bytes = 0
+
+    def _close_current(self) -> None:
+        if self._fh is None:
+            return
+        self._fh.close()
+        self._fh = None
+        self.shards.append({"path": str(self._path), "model": self.model, "requests": self._requests,
+                            "bytes": self._bytes})
+
+    def _rollover(self) -> None:
+        self._close_current()
+        if len(self.shards) == 1 and self._path == self.base:
+            # primeiro rollover: o arquivo único passa a ser o part-000
+            part0 = self._part_path(0)
+            os.replace(self.base, part0)
+            self.shards[0]["path"] = str(part0)
+        self._open(self._part_path(len(self.shards)))
+
+    def write(self, data: bytes) -> None:
+        if self._requests and (self._requests + 1 > self.max_requests or self._bytes + len(data) > self.max_bytes):
+            self._rollover()
+        self._fh.write(data)
+        self._requests += 1
+        self._bytes += len(data)
+
+    def close(self) -> None:
+        self._close_current()
+        for shard in self.shards:
+            shard["model"] = self.model
+
+    def move_to(self, base: Path) -> None:
+        """Renomeia os arquivos (já fechados) da série para a nova base, mantendo a numeração."""
+        for i, shard in enumerate(self.shards):
+            old = Path(shard["path"])
+            new = base if old == self.base else base.with_name(f"{base.stem}.part-{i:03d}.jsonl")
+            os.replace(old, new)
+            shard["path"] = str(new)
+        self.base = base
+
+
+class ShardedJsonlWriter:
+    """Writer JSONL em streaming que separa a saída por modelo e divide cada parte nos limites da Batch API.
+
+    A Batch API exige um único modelo por arquivo de entrada, então cada `body.model` tem sua própria
+    série de shards. Com um só modelo, grava em `out_path`; ao cruzar o limite de requisições ou de
+    bytes, o arquivo atual vira `<stem>.part-000.jsonl` e as próximas linhas seguem em
+    `<stem>.part-001.jsonl`, ... Com mais de um modelo (roteamento), cada série fica em
+    `<stem>.model-<modelo>.jsonl` (e `.part-NNN.jsonl`) e `out_path` deixa de existir. Ao fechar,
+    grava `<stem>.manifest.json` listando os shards (cada um com seu modelo, um batch por shard).
+    """
+
+    def __init__(self, out_path: Path, *, max_requests: Optional[int] = None, max_bytes: Optional[int] = None,
+                 index_path: Optional[Path] = None) -> None:
+        self.out_path = Path(out_path)
+        self.max_requests = max_requests or _env_int("BATCH_MAX_REQUESTS_PER_FILE", BATCH_MAX_REQUESTS)
+        self.max_bytes = max_bytes or _env_int("BATCH_MAX_BYTES_PER_FILE", BATCH_MAX_BYTES)
+        self.index_path = index_path
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        for pattern in (f"{self.out_path.stem}.part-*.jsonl", f"{self.out_path.stem}.model-*.jsonl"):
+            for stale in self.out_path.parent.glob(pattern):
+                stale.unlink()
+        # a primeira série nasce em out_path e fica com o primeiro modelo escrito
+        self._first = _ShardSeries(self.out_path, self.max_requests, self.max_bytes)
+        self._series: Dict[Optional[str], _ShardSeries] = {}
+        self._manifest: Optional[Dict[str, Any]] = None
+
+    def _model_path(self, model: Optional[str]) -> Path:
+        return self.out_path.with_name(f"{self.out_path.stem}.model-{_model_slug(model)}.jsonl")
+
+    def write(self, obj: Any, model: Optional[str] = None) -> None:
+        """Grava uma requisição (dict ou linha JSON); `model` evita reler o body de uma linha pronta."""
+        if isinstance(obj, str):
+            line = obj
+            if model is None:
+                model = (json.loads(obj).get("body") or {}).get("model")
+        else:
+            line = json.dumps(obj, ensure_ascii=False)
+            if model is None:
+                model = (obj.get("body") or {}).get("model")
+        series = self._series.get(model)
+        if series is None:
+            if not self._series:
+                series = self._first
+                series.model = model
+            else:
+                series = _ShardSeries(self._model_path(model), self.max_requests, self.max_bytes, model)
+            self._series[model] = series
+        series.write((line + "\n").encode("utf-8"))
+
+    def close(self) -> Dict[str, Any]:
+        """Fecha os shards abertos e grava o manifest; retorna o manifest."""
+        if self._manifest is not None:
+            return self._manifest
+        series = [self._first, *(s for s in self._series.values() if s is not self._first)]
+        for s in series:
+            s.close()
+        if len(series) > 1:
+            self._first.move_to(self._model_path(self._first.model))
+        shards = [shard for s in series for shard in s.shards]
+        self._manifest = {
+            "input": str(self.out_path),
+            "index": str(self.index_path) if self.index_path else None,
+            "requests": sum(s["requests"] for s in shards),
+            "bytes": sum(s["bytes"] for s in shards),
+            "limits": {"max_requests": self.max_requests, "max_bytes": self.max_bytes},
+            "models": {
+                s.model or "": {"requests": sum(sh["requests"] for sh in s.shards), "shards": len(s.shards)}
+                for s in series
+            },
+            "shards": shards,
+        }
+        manifest_path_for(self.out_path).write_text(json.dumps(self._manifest, indent=2, ensure_ascii=False),
+                                                    encoding="utf-8")
+        return self._manifest
+
+    def __enter__(self) -> "ShardedJsonlWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
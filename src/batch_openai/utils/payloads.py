@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Any
+from itertools import chain
+from typing import Any, Iterable, Iterator
 import json as _json
 import re as _re
 
@@ -32,80 +33,84 @@ def _decode_bytes(raw: bytes) -> str:
         return raw.decode("utf-8", errors="replace")
 
 
+# aspas tipográficas -> ASCII; controles (exceto \t, \n, \r) removidos
+_QUOTES = (("\u201c", '"'), ("\u201d", '"'), ("\u201e", '"'), ("\u201f", '"'), ("\u2018", "'"), ("\u2019", "'"))
+_CONTROL_RE = _re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]+")
+_NEEDS_NORMALIZE_RE = _re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\u201c-\u201f\u2018\u2019]")
+
+# String JSON (laço "desenrolado", linear); sem aspas de fechamento consome até o fim
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"?'
+# Passada única de saneamento: strings são mantidas (grupo 1), o resto casado é descartado:
+# comentários /* */, // (no início ou após espaço), linhas # , vírgula antes de } ou ] (mesmo com
+# comentários no meio) e '*' soltos fora de strings
+_SANITIZE_RE = _re.compile(
+    "(" + _STRING + r")"
+    r"|/\*.*?(?:\*/|\Z)"
+    r"|(?:(?<=\s)|^)//[^\n]*"
+    r"|^[ \t]*#[^\n]*"
+    r"|,(?=(?:\s|/\*.*?\*/|//[^\n]*)*[}\]])"
+    r"|\*",
+    _re.S | _re.M,
+)
+# Tokens estruturais dentro de um bloco: strings e delimitadores
+_BLOCK_TOKEN_RE = _re.compile(_STRING + r"|[{}\[\]]")
+_BLOCK_OPEN_RE = _re.compile(r"[{\[]")
+_CLOSERS = {"}": "{", "]": "["}
+
+
 def _normalize_chars(text: str) -> str:
-    text = text.replace("\u201c", '"').replace("\u201d", '"').replace("\u201e", '"').replace("\u201f", '"')
-    text = text.replace("\u2018", "'").replace("\u2019", "'")
-    # remover controles exceto \t, \n, \r
-    return "".join(ch for ch in text if ch >= " " or ch in "\t\n\r")
+    if not _NEEDS_NORMALIZE_RE.search(text):
+        return text
+    for src, dst in _QUOTES:
+        text = text.replace(src, dst)
+    return _CONTROL_RE.sub("", text)
 
 
 def _sanitize_json_like(text: str) -> str:
-    s = _re.sub(r"/\*.*?\*/", "", text, flags=_re.S)
-    s = _re.sub(r"(^|\s)//.*$", "", s, flags=_re.M)
-    s = _re.sub(r"^\s*#.*$", "", s, flags=_re.M)
-    s = _re.sub(r",\s*([}\]])", r"\1", s)
-
-    def _drop_unquoted(st: str, drop_chars: str = "*") -> str:
-        res = []
-        in_str = False
-        esc = False
-        for ch in st:
-            if in_str:
-                if esc:
-                    res.append(ch)
-                    esc = False
-                else:
-                    if ch == "\\":
-                        res.append(ch)
-                        esc = True
-                    elif ch == '"':
-                        res.append(ch)
-                        in_str = False
-                    else:
-                        res.append(ch)
-            else:
-                if ch == '"':
-                    res.append(ch)
-                    in_str = True
-                else:
-                    if ch in drop_chars:
-                        continue
-                    res.append(ch)
-        return "".join(res)
-
-    return _drop_unquoted(s)
-
-
-def _extract_first_json_block(txt: str) -> list[str]:
-    blocks: list[str] = []
-    for opener, closer in (("{", "}"), ("[", "]")):
-        i = txt.find(opener)
-        while i != -1:
-            depth = 0
-            in_str = False
-            esc = False
-            for j in range(i, len(txt)):
-                ch = txt[j]
-                if in_str:
-                    if esc:
-                        esc = False
-                    else:
-                        if ch == "\\":
-                            esc = True
-                        elif ch == '"':
-                            in_str = False
-                else:
-                    if ch == '"':
-                        in_str = True
-                    elif ch == opener:
-                        depth += 1
-                    elif ch == closer:
-                        depth -= 1
-                        if depth == 0:
-                            blocks.append(txt[i : j + 1])
-                            break
-            i = txt.find(opener, i + 1)
-    return blocks
+    """Remove comentários, vírgulas finais e '*' soltos fora de strings numa única varredura (regex)."""
+    return _SANITIZE_RE.sub(r"\1", text)
+
+
+def _extract_first_json_block(txt: str) -> Iterator[str]:
+    """Blocos balanceados ({...} antes de [...]), por posição de início, numa única varredura.
+
+    Fora de blocos, aspas são ignoradas (texto livre); dentro, o estado de string é respeitado e
+    delimitadores de fechamento sem par são ignorados. Blocos fechados dentro de uma abertura que
+    nunca fecha também contam (o lixo antes deles é descartado), e blocos aninhados vêm logo depois
+    do bloco que os contém: se o externo for inválido, os internos ainda são tentados. Os trechos
+    são fatiados sob demanda (o chamador para no primeiro que decodifica).
+    """
+    spans: list[tuple[int, int]] = []  # todos os blocos fechados (início, fim)
+    stack: list[tuple[str, int]] = []
+    pos = 0
+    n = len(txt)
+    while pos < n:
+        if not stack:
+            m = _BLOCK_OPEN_RE.search(txt, pos)
+            if m is None:
+                break
+            stack.append((m.group(), m.start()))
+            pos = m.end()
+            continue
+        m = _BLOCK_TOKEN_RE.search(txt, pos)
+        if m is None:
+            break
+        tok = m.group()
+        pos = m.end()
+        if tok[0] == '"':
+            continue
+        if tok in "{[":
+            stack.append((tok, m.start()))
+            continue
+        if stack[-1][0] != _CLOSERS[tok]:
+            continue
+        _, start = stack.pop()
+        spans.append((start, pos))
+    spans.sort()
+    for opener in "{[":
+        for a, b in spans:
+            if txt[a] == opener:
+                yield txt[a:b]
 
 
 def _json_loads_loose(text: str) -> Any | None:
@@ -134,7 +139,11 @@ def decode_payload_bytes(raw: bytes) -> Any:
         sanitized = _sanitize_json_like(text)
         payload = _json_loads_loose(sanitized)
     if payload is None:
-        for block in _extract_first_json_block(text):
+        # blocos balanceados do texto saneado (e do original, se o saneamento mudou algo)
+        candidates: Iterable[str] = _extract_first_json_block(sanitized)
+        if sanitized != text:
+            candidates = chain(candidates, _extract_first_json_block(text))
+        for block in candidates:
             payload = _json_loads_loose(block)
             if payload is not None:
                 break
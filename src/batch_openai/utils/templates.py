@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import os
+import re as _re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+_PLACEHOLDER = _re.compile(r"\{\{([A-Za-z_][A-Za-z0-9_]*)\}\}")
+
+
+class CompiledTemplate:
+    """Template pré-processado em pedaços literais + slots de placeholder.
+
+    `chunks` sempre tem len(slots) + 1 elementos; a renderização intercala os dois
+    e faz um único join, sem copiar o texto inteiro a cada variável.
+    """
+
+    __slots__ = ("chunks", "slots")
+
+    def __init__(self, text: str) -> None:
+        chunks: List[str] = []
+        slots: List[str] = []
+        pos = 0
+        for m in _PLACEHOLDER.finditer(text):
+            chunks.append(text[pos : m.start()])
+            slots.append(m.group(1))
+            pos = m.end()
+        chunks.append(text[pos:])
+        self.chunks: Tuple[str, ...] = tuple(chunks)
+        self.slots: Tuple[str, ...] = tuple(slots)
+
+    def render(self, variables: Dict[str, str], missing: Optional[Callable[[str], str]] = None) -> str:
+        """Preenche os slots; placeholders sem valor são mantidos literais (ou via `missing`)."""
+        parts: List[str] = [self.chunks[0]]
+        for name, chunk in zip(self.slots, self.chunks[1:]):
+            val = variables.get(name)
+            if val is None:
+                val = missing(name) if missing is not None else f"{{{{{name}}}}}"
+            parts.append(val)
+            parts.append(chunk)
+        return "".join(parts)
+
+
+class TemplateRegistry:
+    """Cache de templates compilados por caminho, recarregado quando o mtime muda."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Tuple[int, CompiledTemplate]] = {}
+
+    def get(self, path: Path, *, prefix: str = "") -> CompiledTemplate:
+        """Retorna o template compilado de `path` (com `prefix` opcional antes do texto)."""
+        key = (str(path), prefix)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[0] == mtime:
+                return hit[1]
+        compiled = CompiledTemplate(prefix + path.read_text(encoding="utf-8"))
+        with self._lock:
+            self._entries[key] = (mtime, compiled)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_REGISTRY = TemplateRegistry()
+
+
+def get_template(path: Path, *, prefix: str = "") -> CompiledTemplate:
+    """Atalho para o registro global de templates do processo."""
+    return _REGISTRY.get(path, prefix=prefix)
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import json as _json
+import os
+import re as _re
+from typing import Dict, List, Optional, Tuple
+
+# Janela de contexto (tokens) por modelo; prefixos cobrem variantes datadas (ex.: gpt-4o-2024-08-06)
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    "gpt-5": 400_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4o": 128_000,
+    "o4-mini": 200_000,
+    "openai_o4-mini": 200_000,
+    "o3": 200_000,
+}
+DEFAULT_CONTEXT_TOKENS = 128_000
+
+# Orçamento de entrada por requisição (template + código); pode ser sobrescrito por env
+DEFAULT_SEGMENT_BUDGET = 12_000
+# Folga para diferenças entre a estimativa e o tokenizer real
+SAFETY_MARGIN_TOKENS = 512
+# Abaixo disso, sobra pouco código por requisição para valer a pena (o builder não gera o tópico)
+MIN_CONTENT_TOKENS = 256
+
+_WORD = _re.compile(r"\w+")
+_SYMBOL = _re.compile(r"[^\w\s]")
+
+
+class HeuristicEstimator:
+    """Estimativa offline: palavras (~1 token a cada 5 caracteres) + 1 token por símbolo."""
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        words = sum(1 + len(w) // 5 for w in _WORD.findall(text))
+        return words + len(_SYMBOL.findall(text))
+
+
+class TiktokenEstimator:
+    """Contagem exata via tiktoken (opcional; requer `pip install tiktoken`)."""
+
+    name = "tiktoken"
+
+    def __init__(self, model: str) -> None:
+        import tiktoken  # type: ignore
+
+        try:
+            self._enc = tiktoken.encoding_for_model(model)
+        except Exception:
+            self._enc = tiktoken.get_encoding("o200k_base")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._enc.encode(text, disallowed_special=()))
+
+
+_ESTIMATORS: Dict[str, object] = {}
+
+
+def get_estimator(model: str):
+    """Retorna o estimador configurado em TOKEN_ESTIMATOR (auto|heuristic|tiktoken)."""
+    mode = os.getenv("TOKEN_ESTIMATOR", "auto").strip().lower()
+    key = f"{mode}:{model}"
+    est = _ESTIMATORS.get(key)
+    if est is None:
+        est = HeuristicEstimator()
+        if mode in ("auto", "tiktoken"):
+            try:
+                est = TiktokenEstimator(model)
+            except ImportError:
+                if mode == "tiktoken":
+                    raise
+        _ESTIMATORS[key] = est
+    return est
+
+
+def lookup_by_prefix(table: Dict[str, int], model: str) -> Optional[int]:
+    """Valor do modelo em `table`, pelo nome exato ou pelo prefixo mais longo (ex.: gpt-4o-2024-08-06 → gpt-4o)."""
+    if model in table:
+        return table[model]
+    best = max((k for k in table if model.startswith(k)), key=len, default=None)
+    return table[best] if best is not None else None
+
+
+def context_tokens(model: str) -> int:
+    return lookup_by_prefix(MODEL_CONTEXT_TOKENS, model) or DEFAULT_CONTEXT_TOKENS
+
+
+def segment_budget(model: str) -> int:
+    """Orçamento de entrada por requisição para o modelo.
+
+    SEGMENT_TOKEN_BUDGETS (JSON {"modelo": n}) tem precedência sobre SEGMENT_TOKEN_BUDGET (valor único).
+    """
+    raw_map = os.getenv("SEGMENT_TOKEN_BUDGETS")
+    if raw_map:
+        try:
+            found = lookup_by_prefix({k: int(v) for k, v in _json.loads(raw_map).items()}, model)
+        except Exception:
+            found = None
+        if found:
+            return found
+    raw = os.getenv("SEGMENT_TOKEN_BUDGET")
+    return int(raw) if raw and raw.isdigit() else DEFAULT_SEGMENT_BUDGET
+
+
+def content_budget(model: str, template_tokens: int, max_completion_tokens: int) -> int:
+    """Tokens disponíveis para o código, descontando template e reserva de saída.
+
+    0 quando template + reserva já ocupam todo o orçamento/contexto; compare com MIN_CONTENT_TOKENS.
+    """
+    prompt_cap = min(segment_budget(model), context_tokens(model) - max_completion_tokens - SAFETY_MARGIN_TOKENS)
+    return max(0, prompt_cap - template_tokens)
+
+
+def split_by_tokens(text: str, budget: int, estimator) -> List[Tuple[str, int]]:
+    """Divide `text` em blocos de até `budget` tokens, respeitando quebras de linha.
+
+    Retorna pares (bloco, tokens estimados). Linhas isoladas maiores que o orçamento são cortadas por caracteres.
+    """
+    total = estimator.count(text)
+    if total <= budget:
+        return [(text, total)]
+    segments: List[Tuple[str, int]] = []
+    buf: List[str] = []
+    acc = 0
+    for line in text.splitlines(True):
+        n = estimator.count(line)
+        if n > budget:
+            if buf:
+                segments.append(("".join(buf), acc))
+                buf, acc = [], 0
+            # corte por caracteres proporcional à densidade da própria linha
+            step = max(1, len(line) * budget // n)
+            for i in range(0, len(line), step):
+                piece = line[i : i + step]
+                segments.append((piece, estimator.count(piece)))
+            continue
+        if acc + n > budget and buf:
+            segments.append(("".join(buf), acc))
+            buf, acc = [], 0
+        buf.append(line)
+        acc += n
+    if buf:
+        segments.append(("".join(buf), acc))
+    return segments
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+
+def cached_tokens(usage: Optional[Dict[str, Any]]) -> int:
+    """Tokens de entrada servidos do prompt cache (`usage.prompt_tokens_details.cached_tokens`)."""
+    details = (usage or {}).get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or 0)
+
+
+def add_usage(acc: Dict[str, Dict[str, Any]], key: str, usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Acumula o `usage` de uma resposta em `acc[key]` (requisições, tokens e taxa de cache)."""
+    item = acc.setdefault(key, {
+        "requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+        "cached_ratio": 0.0,
+    })
+    usage = usage or {}
+    item["requests"] += 1
+    for k in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        item[k] += int(usage.get(k) or 0)
+    item["cached_tokens"] += cached_tokens(usage)
+    item["cached_ratio"] = round(item["cached_tokens"] / item["prompt_tokens"], 4) if item["prompt_tokens"] else 0.0
+    return item
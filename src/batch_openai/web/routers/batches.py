@@ -1,14 +1,31 @@
 from __future__ import annotations
 
-from typing import Optional, Dict, Any
+import asyncio
+import uuid
+from pathlib import Path
+from typing import Optional, Dict, Any, List
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 
 from ...services.openai_client import get_client
-from ...services.batch_service import submit as svc_submit, TERMINAL_STATES
-from ...utils.files import ensure_output_dir
-from ...utils.payloads import decode_payload_bytes
-from ...parsers.output_parser import parse as parse_outputs
+from ...services.poller import get_poller
+from ...services.jobs import Job, get_job_manager
+from ...services.batch_service import (
+    download_file as svc_download_file,
+    manifest_shard_paths as svc_manifest_shard_paths,
+    manifest_submissions as svc_manifest_submissions,
+    save_batch_json as svc_save_batch_json,
+    TERMINAL_STATES,
+)
+from ...utils.files import ensure_output_dir, safe_copy_index, safe_name
+from ...utils.ingest import spool_upload
+from ...parsers.output_parser import (
+    parse as parse_outputs,
+    add_retry_batch,
+    build_retry_input,
+    retry_batch_ids,
+    set_shard_batches,
+)
 from ..errors import as_http_error
 from ..schemas.batches import (
     SubmitRequest,
@@ -17,8 +34,15 @@ from ..schemas.batches import (
     BatchStatusResponse,
     DownloadResponse,
     RunPayloadFileResponse,
+    BatchRecord,
 )
-from ...tools.input_builder import build_inputs_from_payload, normalize_payload_sada
+from ..schemas.jobs import JobResponse
+from ...tools.input_builder import build_inputs_from_payload, normalize_payload_stream
+from ...tools.routing import get_router
+from ...services.result_store import get_store
+from ...services.registry import get_registry
+from ...services.status_cache import get_status_cache
+from ...services.scheduler import get_scheduler
 
 
 router = APIRouter(tags=["Batches"])
@@ -26,6 +50,8 @@ router = APIRouter(tags=["Batches"])
 # Flag opcional via env para habilitar/desabilitar logs de status (default: ON)
 import os
 LOG_STATUS = os.getenv("BATCH_LOG_STATUS", "1") not in ("0", "false", "False")
+# Quantas rodadas de retry das requisições sem resultado (por batch) no run-payload-file
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", "2"))
 
 
 def _batch_to_dict(batch: Any) -> Dict[str, Any]:
@@ -43,64 +69,68 @@ def _batch_to_dict(batch: Any) -> Dict[str, Any]:
                 return {"id": getattr(batch, "id", None), "status": getattr(batch, "status", None)}
 
 
-def _wait_blocking(batch_id: str, poll_interval: int) -> Dict[str, Any]:
-    import time as _time
+async def _wait_batch(batch_id: str, poll_interval: int, job: Optional[Job] = None) -> Dict[str, Any]:
+    """Aguarda o batch pelo poller central (sem bloquear o event loop) e persiste batch.json.
 
-    client = get_client()
-    last_status: Optional[str] = None
+    Com `job`, cada mudança de status/request_counts é publicada no job.
+    """
+    manager = get_job_manager()
+    prefix = f"[{job.id}] " if job is not None else ""
+    last_status: list = [None]
     if LOG_STATUS:
-        print(f"Aguardando batch {batch_id} terminar... (poll={poll_interval}s)")
-    while True:
-        batch = client.batches.retrieve(batch_id)
-        status = getattr(batch, "status", None)
-        if LOG_STATUS and status != last_status:
-            print(f"status={status}")
-            last_status = status
-        if status in TERMINAL_STATES:
-            out_dir = ensure_output_dir(batch_id)
-            data = _batch_to_dict(batch)
-            (out_dir / "batch.json").write_text(
-                __import__("json").dumps(data, indent=2, ensure_ascii=False)
-            )
-            if LOG_STATUS:
-                print(f"Status final: {status}")
-            return {"final_status": status, "batch": data}
-        _time.sleep(max(1, poll_interval))
+        print(f"{prefix}Aguardando batch {batch_id} terminar... (poll>={poll_interval}s)")
+
+    def _on_update(data: Dict[str, Any]) -> None:
+        status = data.get("status")
+        if LOG_STATUS and status != last_status[0]:
+            print(f"{prefix}{batch_id} status={status}")
+        last_status[0] = status
+        if job is not None:
+            manager.update(job, batch_status={**job.batch_status, batch_id: status},
+                           request_counts={**job.request_counts, batch_id: data.get("request_counts") or {}})
+
+    data = await get_poller().wait(batch_id, poll_interval=poll_interval, on_update=_on_update)
+    await asyncio.to_thread(svc_save_batch_json, batch_id, data)
+    if LOG_STATUS:
+        print(f"{prefix}Status final: {data.get('status')}")
+    return {"final_status": data.get("status"), "batch": data}
 
 
 def _download_files(batch_id: str) -> DownloadResponse:
     client = get_client()
     batch = client.batches.retrieve(batch_id)
     status = getattr(batch, "status", None)
-    if status != "completed":
-        raise HTTPException(status_code=409, detail=f"batch {batch_id} not completed (status={status})")
+    if status not in TERMINAL_STATES:
+        raise HTTPException(status_code=409, detail=f"batch {batch_id} not finished (status={status})")
 
+    # expired/failed/cancelled também: o que foi processado está em output_file_id/error_file_id
     out_dir = ensure_output_dir(batch_id)
+    resp: Dict[str, Any] = {"output_dir": str(out_dir), "batch_status": status}
+    # streaming em blocos → .part → rename atômico; pula se o arquivo local já confere com o remoto
     if getattr(batch, "output_file_id", None):
-        out = client.files.content(batch.output_file_id)
-        (out_dir / "output.jsonl").write_text(out.text)
+        resp["output_bytes"] = svc_download_file(client, batch.output_file_id, out_dir / "output.jsonl")["bytes"]
     if getattr(batch, "error_file_id", None):
-        err = client.files.content(batch.error_file_id)
-        (out_dir / "errors.jsonl").write_text(err.text)
-
-    resp: Dict[str, Any] = {"output_dir": str(out_dir)}
+        resp["error_bytes"] = svc_download_file(client, batch.error_file_id, out_dir / "errors.jsonl")["bytes"]
     if (out_dir / "output.jsonl").exists():
         resp["output_file"] = str(out_dir / "output.jsonl")
     if (out_dir / "errors.jsonl").exists():
         resp["error_file"] = str(out_dir / "errors.jsonl")
+    get_registry().record_batch(batch_id, stage="downloaded")
     return DownloadResponse(**resp)
 
 
 def _parse_outputs(batch_id: str, force: bool = False, only: Optional[list[str]] = None) -> Dict[str, Any]:
     out_dir = ensure_output_dir(batch_id)
     output_path = out_dir / "output.jsonl"
-    if not output_path.exists():
+    if not output_path.exists() and not (out_dir / "errors.jsonl").exists():
         raise HTTPException(status_code=404, detail=f"{output_path} not found; download first")
     result = parse_outputs(batch_id, force=force, only=only)
     return {
         "docs_dir": result.get("docs_dir"),
-        "processed": result.get("processed", 0),
+        "processed": result.get("processed", 0) + result.get("from_store", 0),
         "skipped": result.get("skipped", 0),
+        "failed": result.get("failed", 0),
+        "missing": result.get("missing", 0),
         "index_file": str(out_dir / "index.json"),
     }
 
@@ -109,50 +139,123 @@ def _parse_outputs(batch_id: str, force: bool = False, only: Optional[list[str]]
     "/batches",
     summary="Criar batch (submit)",
     description=(
-        "Cria um batch a partir de um arquivo .jsonl local. "
-        "Campos: input_path (obrigatório), job_name (opcional), completion_window (ex.: '24h'). "
+        "Cria um batch a partir de um arquivo .jsonl local (ou um batch por shard de um <input>.manifest.json). "
+        "Campos: input_path (obrigatório), job_name (opcional), completion_window (ex.: '24h'), priority (maior sai "
+        "antes na fila). A submissão passa pelo scheduler: com BATCH_ENQUEUED_TOKEN_LIMIT[S]/BATCH_MAX_CONCURRENT "
+        "configurados, a resposta só volta quando houver orçamento para enviar. "
         "Retorna o batch_id e o diretório onde os artefatos serão gravados."
     ),
     response_model=SubmitResponse,
 )
-def submit(req: SubmitRequest) -> SubmitResponse:
+async def submit(req: SubmitRequest) -> SubmitResponse:
     try:
-        batch_id = svc_submit(req.input_path, req.job_name, req.completion_window, verbose=True)
-        out_dir = str(ensure_output_dir(batch_id))
-        return SubmitResponse(batch_id=batch_id, output_dir=out_dir)
-    except SystemExit as e:
-        raise HTTPException(status_code=400, detail=f"submit failed with code {e.code}")
+        scheduler = get_scheduler()
+        if req.input_path.endswith(".manifest.json"):
+            items = await asyncio.to_thread(svc_manifest_submissions, req.input_path, req.job_name)
+            if not items:
+                raise HTTPException(status_code=400, detail="manifest sem entradas para submeter")
+            batch_ids = list(await asyncio.gather(*(
+                scheduler.submit(item["path"], item["job_name"], req.completion_window,
+                                 index_path=item["index_path"], priority=req.priority)
+                for item in items
+            )))
+        else:
+            batch_ids = [await scheduler.submit(req.input_path, req.job_name, req.completion_window,
+                                                priority=req.priority)]
+        out_dir = str(ensure_output_dir(batch_ids[0]))
+        return SubmitResponse(batch_id=batch_ids[0], output_dir=out_dir, batch_ids=batch_ids)
+    except HTTPException:
+        raise
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"submit failed: {e}")
     except Exception as e:
         raise as_http_error(e)
 
 
+@router.get(
+    "/batches",
+    summary="Listar batches (registro local)",
+    description=(
+        "Batches conhecidos pelo registro local (JOB_REGISTRY_DB), mais recentes primeiro, sem chamar a OpenAI. "
+        "Filtros opcionais: job_id, status; limit (default 100)."
+    ),
+    response_model=List[BatchRecord],
+)
+def list_batches(job_id: Optional[str] = None, status: Optional[str] = None, limit: int = 100) -> List[BatchRecord]:
+    return [BatchRecord(**r) for r in get_registry().list_batches(job_id=job_id, status=status, limit=limit)]
+
+
+@router.get(
+    "/batches/{batch_id}",
+    summary="Consultar batch (registro local)",
+    description=(
+        "Último estado conhecido do batch no registro local (status, request_counts, etapa local "
+        "submitted/downloaded/parsed, job), sem chamar a OpenAI. Para o status ao vivo use /batches/{batch_id}/status."
+    ),
+    response_model=BatchRecord,
+)
+def get_batch_record(batch_id: str) -> BatchRecord:
+    record = get_registry().get_batch(batch_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"batch {batch_id} not in local registry")
+    return BatchRecord(**record)
+
+
 @router.get(
     "/batches/{batch_id}/status",
     summary="Consultar status do batch",
-    description="Retorna o status atual e o objeto completo do batch.",
+    description=(
+        "Retorna o status atual e o objeto completo do batch. Consultas concorrentes ao mesmo id viram uma única "
+        "chamada à OpenAI; o resultado vale por BATCH_STATUS_TTL segundos (default 5) e estados terminais ficam em cache."
+    ),
     response_model=BatchStatusResponse,
 )
-def get_status(batch_id: str) -> BatchStatusResponse:
+async def get_status(batch_id: str) -> BatchStatusResponse:
     try:
-        client = get_client()
-        batch = client.batches.retrieve(batch_id)
-        data = _batch_to_dict(batch)
+        data = await get_status_cache().get(batch_id)
         return BatchStatusResponse(status=data.get("status"), batch=data)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"batch {batch_id} not found or inaccessible: {e}")
 
 
+@router.get(
+    "/batches/status-cache/stats",
+    summary="Estatísticas do cache de status",
+    description=(
+        "Contadores do cache de GET /batches/{batch_id}/status: hits, misses, coalesced (consultas que "
+        "aguardaram uma requisição já em andamento), registry_hits, upstream_calls, errors, hit_ratio, entradas e TTL."
+    ),
+)
+def status_cache_stats() -> Dict[str, Any]:
+    return get_status_cache().snapshot()
+
+
+@router.get(
+    "/batches/scheduler/stats",
+    summary="Estado do scheduler de submissão",
+    description=(
+        "Orçamento (token_limit = BATCH_ENQUEUED_TOKEN_LIMIT, token_limits = BATCH_ENQUEUED_TOKEN_LIMITS por modelo, "
+        "max_concurrent = BATCH_MAX_CONCURRENT; 0 = sem limite), batches em andamento e tokens enfileirados "
+        "estimados por modelo, arquivos aguardando na fila (pending, pending_tokens, "
+        "oldest_pending_s) e contadores (queued, submitted, released, errors, oversized)."
+    ),
+)
+def scheduler_stats() -> Dict[str, Any]:
+    return get_scheduler().snapshot()
+
+
 @router.post(
     "/batches/{batch_id}/wait",
     summary="Aguardar conclusão do batch",
     description=(
-        "Faz polling até o batch entrar em estado terminal (completed/failed/cancelled/expired). "
-        "Opcional: poll_interval (segundos). Persiste outputs/<batch_id>/batch.json."
+        "Aguarda (pelo poller central, sem bloquear o servidor) até o batch entrar em estado terminal "
+        "(completed/failed/cancelled/expired). Opcional: poll_interval (segundos, intervalo mínimo). "
+        "Persiste outputs/<batch_id>/batch.json."
     ),
 )
-def wait(batch_id: str, req: WaitRequest) -> Dict[str, Any]:
+async def wait(batch_id: str, req: WaitRequest) -> Dict[str, Any]:
     try:
-        return _wait_blocking(batch_id, req.poll_interval)
+        return await _wait_batch(batch_id, req.poll_interval)
     except Exception as e:
         raise as_http_error(e)
 
@@ -161,7 +264,9 @@ def wait(batch_id: str, req: WaitRequest) -> Dict[str, Any]:
     "/batches/{batch_id}/download",
     summary="Baixar resultados do batch",
     description=(
-        "Baixa e salva output.jsonl e errors.jsonl (quando houver) em outputs/<batch_id>/."
+        "Baixa e salva output.jsonl e errors.jsonl (quando houver) em outputs/<batch_id>/ para qualquer estado terminal "
+        "(em expired/failed/cancelled, o resultado parcial), em streaming e com "
+        "troca atômica. Download interrompido é retomado; arquivo local com o mesmo tamanho do remoto não é baixado de novo."
     ),
     response_model=DownloadResponse,
 )
@@ -179,14 +284,216 @@ def download(batch_id: str) -> DownloadResponse:
 # Removidos endpoints antigos: parse, run, run-file, run-payload (refatoração de escopo solicitado)
 
 
+async def _run_payload_job(job: Job, payload_norm: Dict[str, Any], filename: Optional[str], *,
+                           router: Any) -> Dict[str, Any]:
+    """Pipeline do run-payload-file em background: build → submit → wait → download → parse.
+
+    Etapas bloqueantes (build, upload/submit, download, parse) rodam em threads; o polling usa o
+    poller central, então o event loop nunca fica parado. Depois do build, tudo o que é preciso
+    para continuar fica em `job.params` (e no registro), o que permite retomar após um restart.
+    """
+    manager = get_job_manager()
+    params = job.params
+    manager.update(job, stage="building")
+    proc = (payload_norm.get("entry_point") or {}).get("name") or (filename or "processo")
+    sanitized = safe_name(proc, "processo")
+    proc_root = Path("inputs/by_process") / sanitized
+    # um diretório por job: jobs simultâneos do mesmo processo não sobrescrevem o .jsonl, o índice
+    # e o manifest uns dos outros
+    jsonl_dir = proc_root / "payloads" / safe_name(job.id, "job")
+    jsonl_dir.mkdir(parents=True, exist_ok=True)
+    jsonl_path = jsonl_dir / f"{sanitized}.jsonl"
+    # agrupar context packs sob inputs/by_process/<proc>/...
+    ctx_dir = Path("inputs/by_process") if params.get("persist_context") else None
+    templates_dir = Path("prompts")
+    counts = await asyncio.to_thread(
+        build_inputs_from_payload, payload_norm, templates_dir, jsonl_path, persist_context=ctx_dir,
+        store=get_store() if params.get("incremental") else None, router=router,
+        combined=bool(params.get("combined")),
+    )
+    manager.update(job, params={**params, "jsonl_path": str(jsonl_path), "entries": counts["entries"],
+                                "skipped_over_budget": counts.get("skipped", 0),
+                                "manifest_path": counts.get("manifest_path")})
+
+    if counts["entries"] == 0:
+        # Tudo já documentado: nada a submeter, apenas recompor docs a partir do store
+        batch_id = f"cached-{uuid.uuid4().hex[:8]}"
+        out_dir = ensure_output_dir(batch_id)
+        (out_dir / "output.jsonl").write_text("", encoding="utf-8")
+        safe_copy_index(jsonl_path, out_dir)
+        manager.update(job, batch_ids=[batch_id])
+        return await _finish_cached_job(job, batch_id)
+    return await _run_submitted_job(job)
+
+
+async def _finish_cached_job(job: Job, batch_id: str) -> Dict[str, Any]:
+    manager = get_job_manager()
+    out_dir = ensure_output_dir(batch_id)
+    do_parse = job.params.get("do_parse", True)
+    manager.update(job, stage="parsing")
+    parse_result = await asyncio.to_thread(_parse_outputs, batch_id, False, None) if do_parse else None
+    return RunPayloadFileResponse(
+        batch_id=batch_id,
+        batch_ids=[batch_id],
+        download=DownloadResponse(output_dir=str(out_dir), output_file=str(out_dir / "output.jsonl")),
+        parse_docs_dir=(parse_result.get("docs_dir") if parse_result else None),
+        parse_processed=(parse_result.get("processed", 0) if parse_result else 0),
+        parse_skipped=(parse_result.get("skipped", 0) if parse_result else 0),
+        parse_failed=(parse_result.get("failed", 0) if parse_result else 0),
+        parse_missing=(parse_result.get("missing", 0) if parse_result else 0),
+        parse_index_file=(parse_result.get("index_file") if parse_result else None),
+        retry_batch_ids=[],
+    ).model_dump()
+
+
+async def _run_submitted_job(job: Job) -> Dict[str, Any]:
+    """Submit → wait → download → parse a partir do manifest do job; idempotente (serve para retomar).
+
+    Shards que já viraram batch (registro, desde a criação do job) não são reenviados; o download
+    pula arquivos já completos e o parse sem force não reprocessa o que já foi gerado.
+    """
+    manager = get_job_manager()
+    params = job.params
+    manifest_path = params["manifest_path"]
+    poll_interval = int(params.get("poll_interval") or 10)
+    do_parse = params.get("do_parse", True)
+
+    # Submit (um batch por shard quando o .jsonl excede os limites da Batch API). Todos os shards entram
+    # na fila do scheduler de uma vez; cada um segue para wait/download assim que vira batch.
+    manager.update(job, stage="submitting")
+    existing = await asyncio.to_thread(
+        lambda: get_registry().job_batches_for_inputs(job.id, svc_manifest_shard_paths(manifest_path))
+    )
+    items = await asyncio.to_thread(svc_manifest_submissions, manifest_path, params.get("job_name"))
+    scheduler = get_scheduler()
+
+    async def _submit_shard(item: Dict[str, Any]) -> str:
+        known = existing.get(str(Path(item["path"]).resolve()))
+        if known:
+            return known
+        return await scheduler.submit(item["path"], item["job_name"], params.get("completion_window") or "24h",
+                                      index_path=item["index_path"], priority=int(params.get("priority") or 0),
+                                      job_id=job.id)
+
+    pending = [asyncio.ensure_future(_submit_shard(item)) for item in items]
+    batch_ids: List[str] = []
+    downloads = []
+    retries: List[str] = []
+    try:
+        for submission in pending:
+            batch_id = await submission
+            batch_ids.append(batch_id)
+            manager.update(job, stage="waiting", batch_ids=list(dict.fromkeys([*job.batch_ids, batch_id])))
+            await _wait_batch(batch_id, poll_interval, job)
+            manager.update(job, stage="downloading")
+            downloads.append(await asyncio.to_thread(_download_files, batch_id))
+            retries.extend(await _retry_failed(job, batch_id))
+    finally:
+        # erro/cancelamento: shards ainda na fila do scheduler saem dela
+        for submission in pending:
+            submission.cancel()
+    # um único parse pelo primeiro shard junta os demais (shards.json): docs/ e final.md de cada
+    # processo ficam numa só árvore, mesmo com os segmentos espalhados por vários batches
+    parse_result = None
+    if do_parse:
+        manager.update(job, stage="parsing")
+        await asyncio.to_thread(set_shard_batches, batch_ids[0], batch_ids[1:])
+        parse_result = await asyncio.to_thread(_parse_outputs, batch_ids[0], False, None)
+        for batch_id in batch_ids:
+            await asyncio.to_thread(get_registry().record_batch, batch_id, stage="parsed")
+    return RunPayloadFileResponse(
+        batch_id=batch_ids[0],
+        batch_ids=batch_ids,
+        download=downloads[0],
+        parse_docs_dir=(parse_result.get("docs_dir") if parse_result else None),
+        parse_processed=(parse_result.get("processed", 0) if parse_result else 0),
+        parse_skipped=(parse_result.get("skipped", 0) if parse_result else 0),
+        parse_failed=(parse_result.get("failed", 0) if parse_result else 0),
+        parse_missing=(parse_result.get("missing", 0) if parse_result else 0),
+        parse_index_file=(parse_result.get("index_file") if parse_result else None),
+        retry_batch_ids=retries,
+    ).model_dump()
+
+
+async def _retry_failed(job: Job, batch_id: str) -> List[str]:
+    """Reenvia, até `max_retries` vezes, só as requisições do batch que ficaram sem resultado.
+
+    Depois do download (qualquer estado terminal), monta retry-NNN.jsonl com as que faltam ou
+    falharam com erro reenviável, submete, aguarda e baixa; o parse do batch original junta
+    tudo no mesmo docs/. Retries já criados (retries.json/registro) são retomados, não recriados.
+    """
+    manager = get_job_manager()
+    params = job.params
+    poll_interval = int(params.get("poll_interval") or 10)
+    max_retries = int(params.get("max_retries", BATCH_MAX_RETRIES))
+    for retry_id in retry_batch_ids(batch_id):
+        await _wait_batch(retry_id, poll_interval, job)
+        await asyncio.to_thread(_download_files, retry_id)
+    attempt = len(retry_batch_ids(batch_id))
+    while attempt < max_retries:
+        spec = await asyncio.to_thread(build_retry_input, batch_id, attempt + 1)
+        if spec is None:
+            break
+        attempt += 1
+        manager.update(job, stage="retrying")
+        if LOG_STATUS:
+            print(f"[{job.id}] {batch_id}: retry {attempt}/{max_retries} com {spec['requests']} requisições")
+        retry_path = str(Path(spec["path"]).resolve())
+        known = await asyncio.to_thread(get_registry().job_batches_for_inputs, job.id, [retry_path])
+        retry_id = known.get(retry_path)
+        if retry_id is None:
+            name = f"{params['job_name']}-retry-{attempt}" if params.get("job_name") else None
+            # retries passam à frente dos shards do mesmo nível de prioridade: fecham batches já em andamento
+            retry_id = await get_scheduler().submit(spec["path"], name, params.get("completion_window") or "24h",
+                                                    priority=int(params.get("priority") or 0) + 1, job_id=job.id)
+        add_retry_batch(batch_id, retry_id)
+        manager.update(job, batch_ids=[*job.batch_ids, retry_id])
+        await _wait_batch(retry_id, poll_interval, job)
+        await asyncio.to_thread(_download_files, retry_id)
+    return retry_batch_ids(batch_id)
+
+
+async def _resume_payload_job(job: Job) -> Dict[str, Any]:
+    if job.batch_ids and job.batch_ids[0].startswith("cached-"):
+        return await _finish_cached_job(job, job.batch_ids[0])
+    if not job.params.get("manifest_path"):
+        # o payload normalizado só existia na memória do processo anterior
+        raise RuntimeError("job interrompido antes de gerar o .jsonl; reenvie o payload")
+    return await _run_submitted_job(job)
+
+
+async def resume_jobs() -> List[str]:
+    """Retoma (no startup da API) os jobs que ficaram pendentes no registro; retorna os ids."""
+    manager = get_job_manager()
+    resumed: List[str] = []
+    for state in await asyncio.to_thread(manager.pending_states):
+        if state.get("kind") != "run-payload-file":
+            continue
+        job = manager.restore(state)
+        manager.start(job, _resume_payload_job)
+        resumed.append(job.id)
+    if resumed and LOG_STATUS:
+        print(f"Jobs retomados: {', '.join(resumed)}")
+    return resumed
+
+
 @router.post(
     "/batches/run-payload-file",
-    summary="Upload de payload JSON → (build .jsonl) → submit → wait → download → (parse)",
+    summary="Upload de payload JSON → job em background (build .jsonl → submit → wait → download → parse)",
     description=(
-        "Recebe um arquivo JSON (payload do processo) via multipart/form-data, gera um .jsonl modular (5 tópicos), "
-        "e executa todo o fluxo. Campos: file (obrigatório), job_name, completion_window, poll_interval, do_parse, persist_context."
+        "Recebe um arquivo JSON (payload do processo) via multipart/form-data, valida e responde 202 com um job_id; "
+        "o .jsonl modular (5 tópicos) é gerado e todo o fluxo roda em background. Acompanhe por GET /jobs/{job_id} "
+        "ou GET /jobs/{job_id}/events (SSE); o resultado final (RunPayloadFileResponse) fica em `result`. "
+        "Campos: file (obrigatório), job_name, completion_window, poll_interval, do_parse, persist_context, "
+        "incremental (opcional, default false: não reenvia segmentos cujo hash e configuração de prompt já têm "
+        "saída no result store), "
+        "routing (off|heuristic|classifier: modelo por tópico/categoria; default env ROUTING_MODE), "
+        "combined (uma requisição por processo/segmento com todos os tópicos), "
+        "max_retries (rodadas de reenvio só das requisições que falharam ou ficaram sem resultado; default env "
+        "BATCH_MAX_RETRIES=2), priority (ordem na fila do scheduler de submissão; maior sai antes)."
     ),
-    response_model=RunPayloadFileResponse,
+    response_model=JobResponse,
+    status_code=202,
 )
 async def run_payload_file(
     file: UploadFile = File(...),
@@ -195,49 +502,40 @@ async def run_payload_file(
     poll_interval: int = Form(default=10),
     do_parse: bool = Form(default=True),
     persist_context: bool = Form(default=False),
-) -> RunPayloadFileResponse:
+    incremental: bool = Form(default=False),
+    routing: Optional[str] = Form(default=None),
+    combined: bool = Form(default=False),
+    max_retries: Optional[int] = Form(default=None),
+    priority: int = Form(default=0),
+) -> JobResponse:
     try:
         if not (file.filename or "").lower().endswith((".json", ".payload", ".txt")):
             # Aceita também .txt para facilitar, mas valida conteúdo abaixo
             pass
-        raw = await file.read()
+        # upload em disco (spool) + parse incremental direto no normalizador (fora do event loop)
+        spool = await spool_upload(file)
+        try:
+            payload_norm = await asyncio.to_thread(normalize_payload_stream, spool)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        finally:
+            spool.close()
+
         try:
-            payload = decode_payload_bytes(raw)
+            router = get_router(routing, templates_dir=Path("prompts"))
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc))
 
-        from pathlib import Path
-        payload_norm = normalize_payload_sada(payload or {})
-        proc = (payload_norm.get("entry_point") or {}).get("name") or (file.filename or "processo")
-        sanitized = proc.replace(" ", "").replace("/", "_")
-        proc_root = Path("inputs/by_process") / sanitized
-        jsonl_dir = proc_root / "payloads"
-        jsonl_dir.mkdir(parents=True, exist_ok=True)
-        jsonl_path = jsonl_dir / f"{sanitized}.jsonl"
-        # agrupar context packs sob inputs/by_process/<proc>/...
-        ctx_dir = Path("inputs/by_process") if persist_context else None
-        templates_dir = Path("prompts")
-        build_inputs_from_payload(payload_norm, templates_dir, jsonl_path, persist_context=ctx_dir)
-
-        # Submit
-        batch_id = svc_submit(str(jsonl_path), job_name, completion_window, verbose=True)
-        # Wait
-        _ = _wait_blocking(batch_id, poll_interval=poll_interval)
-        # Download
-        d = _download_files(batch_id)
-        # Parse (sempre porque faz parte do fluxo solicitado implícito)
-        parse_result = None
-        if do_parse:
-            pr = _parse_outputs(batch_id, force=False, only=None)
-            parse_result = pr
-        return RunPayloadFileResponse(
-            batch_id=batch_id,
-            download=d,
-            parse_docs_dir=(parse_result.get("docs_dir") if parse_result else None),
-            parse_processed=(parse_result.get("processed") if parse_result else 0),
-            parse_skipped=(parse_result.get("skipped") if parse_result else 0),
-            parse_index_file=(str(ensure_output_dir(batch_id) / "index.json") if parse_result else None),
-        )
+        manager = get_job_manager()
+        job = manager.create("run-payload-file", params={
+            "file_name": file.filename, "job_name": job_name, "completion_window": completion_window,
+            "poll_interval": poll_interval, "do_parse": do_parse, "persist_context": persist_context,
+            "incremental": incremental, "routing": routing, "combined": combined,
+            "max_retries": BATCH_MAX_RETRIES if max_retries is None else max_retries, "priority": priority,
+        })
+        manager.start(job, lambda j: _run_payload_job(j, payload_norm, file.filename, router=router))
+        return JobResponse(job_id=job.id, status=job.status, stage=job.stage,
+                           status_url=f"/jobs/{job.id}", events_url=f"/jobs/{job.id}/events")
     except HTTPException:
         raise
     except Exception as e:
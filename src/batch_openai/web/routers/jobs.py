@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+from typing import List
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from ...services.jobs import get_job_manager
+from ..schemas.jobs import JobStatusResponse
+
+router = APIRouter(tags=["Jobs"], prefix="/jobs")
+
+
+def _get_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    return job
+
+
+@router.get(
+    "",
+    summary="Listar jobs",
+    description="Jobs em background do processo, mais recentes primeiro.",
+    response_model=List[JobStatusResponse],
+)
+def list_jobs() -> List[JobStatusResponse]:
+    return [JobStatusResponse(**job.to_dict()) for job in get_job_manager().list()]
+
+
+@router.get(
+    "/{job_id}",
+    summary="Consultar job",
+    description=(
+        "Etapa atual (building/submitting/waiting/downloading/parsing/done), status, request_counts por batch "
+        "(e soma em progress), tempo por etapa e, ao terminar, o resultado ou o erro."
+    ),
+    response_model=JobStatusResponse,
+)
+def get_job(job_id: str) -> JobStatusResponse:
+    return JobStatusResponse(**_get_job(job_id).to_dict())
+
+
+@router.get(
+    "/{job_id}/events",
+    summary="Acompanhar job (server-sent events)",
+    description=(
+        "Stream text/event-stream: um evento `status` (mesmo JSON de GET /jobs/{job_id}) a cada mudança, "
+        "comentários de keep-alive enquanto nada muda, e fim do stream quando o job termina."
+    ),
+)
+async def job_events(job_id: str) -> StreamingResponse:
+    job = _get_job(job_id)
+    manager = get_job_manager()
+
+    async def _stream():
+        async for state in manager.watch(job):
+            if state is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: status\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
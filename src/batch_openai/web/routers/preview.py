@@ -1,29 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 
-from ...services.preview_service import run_preview
+from ...services.preview_service import run_preview, stream_preview, summarize_usage
 from ..schemas.preview import (
     PreviewFullResponse,
     PreviewItem,
 )
 from ...parsers.output_parser import parse as parse_output
+from ...tools.input_builder import COMBINED_TOPIC, DEFAULT_TOPICS, normalize_payload_stream, resolve_prompt_layout
 from ...utils.files import ensure_output_dir
-from ...utils.payloads import decode_payload_bytes
+from ...utils.ingest import spool_upload
 import uuid, json
 from ..errors import as_http_error
 
 router = APIRouter(tags=["Preview"], prefix="/preview")
 
 
-def _parse_max_tokens_override(raw_val: str | None, topics_list: list[str] | None) -> dict | None:
+def _parse_max_tokens_override(raw_val: str | None, topics_list: list[str] | None,
+                               combined: bool = False) -> dict | None:
     if not raw_val:
         return None
     raw_val = raw_val.strip()
-    # Se for só número -> aplicar a todos tópicos
+    # Se for só número -> aplicar a todos tópicos (e à requisição combinada, com combined=true)
+    tlist = [*(topics_list or DEFAULT_TOPICS), *([COMBINED_TOPIC] if combined else [])]
     if raw_val.isdigit():
         val = int(raw_val)
-        tlist = topics_list or ["resumo", "fluxo_execucao", "regras_negocio", "diagram_activity", "diagram_sequence"]
         return {t: val for t in tlist}
     import json as _json
     try:
@@ -31,7 +36,6 @@ def _parse_max_tokens_override(raw_val: str | None, topics_list: list[str] | Non
     except Exception:
         raise HTTPException(status_code=400, detail="max_tokens_override inválido: usar número ou JSON {""topic"":n}")
     if isinstance(parsed, int):
-        tlist = topics_list or ["resumo", "fluxo_execucao", "regras_negocio", "diagram_activity", "diagram_sequence"]
         return {t: parsed for t in tlist}
     if not isinstance(parsed, dict):
         raise HTTPException(status_code=400, detail="max_tokens_override inválido: deve ser objeto JSON ou inteiro")
@@ -42,10 +46,58 @@ def _parse_max_tokens_override(raw_val: str | None, topics_list: list[str] | Non
     return parsed
 
 
+async def _read_preview_form(file: UploadFile, topics: str | None, max_tokens_override: str | None,
+                             layout: str | None, combined: bool = False) -> tuple:
+    """Payload normalizado + opções validadas do form de preview: (payload, topics, max_tokens, layout)."""
+    spool = await spool_upload(file)
+    try:
+        payload = await asyncio.to_thread(normalize_payload_stream, spool)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        spool.close()
+    topics_list = [t.strip() for t in topics.split(",") if t.strip()] if topics else None
+    mto = _parse_max_tokens_override(max_tokens_override, topics_list, combined)
+    try:
+        layout = resolve_prompt_layout(layout)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return payload, topics_list, mto, layout
+
+
+def _write_preview_output(batch_id: str, results: list[dict]) -> str:
+    """Grava outputs/<batch_id>/output.jsonl no formato da Batch API (para o parser); retorna o diretório."""
+    out_dir = ensure_output_dir(batch_id)
+    lines = []
+    for r in results:
+        cid = r.get("custom_id") or "no_custom_id"
+        content = r.get("output_text") or r.get("error") or ""
+        obj = {
+            "id": f"preview_req_{uuid.uuid4().hex[:12]}",
+            "custom_id": cid,
+            "response": {
+                "status_code": 200 if r.get("error") is None else 500,
+                "request_id": uuid.uuid4().hex,
+                "body": {"choices": [{"message": {"content": content}}], "usage": r.get("usage")},
+            },
+            "error": None if r.get("error") is None else {"message": r.get("error")},
+        }
+        lines.append(json.dumps(obj, ensure_ascii=False))
+    (out_dir / "output.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(out_dir)
+
+
 @router.post(
     "/payload-file/full",
     summary="Preview completo via upload de arquivo JSON",
-    description="Upload multipart de payload JSON (arquivo) e simulação completa (gera output.jsonl + parser).",
+    description=(
+        "Upload multipart de payload JSON (arquivo) e simulação completa (gera output.jsonl + parser). "
+        "layout=inline|cache (default env PROMPT_LAYOUT); a resposta traz cached_tokens por item e usage_by_topic. "
+        "combined=true envia o código uma vez numa única requisição com todos os tópicos. "
+        "Os tópicos são executados em paralelo (até PREVIEW_CONCURRENCY simultâneos, cada um limitado a "
+        "PREVIEW_REQUEST_TIMEOUT segundos). Respostas para o mesmo request (modelo, mensagens, limites) vêm do "
+        "cache em disco (cache_hit por item); bypass_cache=true chama a API de novo e atualiza o cache."
+    ),
     response_model=PreviewFullResponse,
 )
 async def preview_payload_file_full(
@@ -53,43 +105,92 @@ async def preview_payload_file_full(
     topics: str | None = Form(default=None),
     max_tokens_override: str | None = Form(default=None),
     do_parse: bool = Form(default=True),
+    layout: str | None = Form(default=None),
+    combined: bool = Form(default=False),
+    bypass_cache: bool = Form(default=False),
 ):
     try:
-        raw = await file.read()
-        try:
-            payload = decode_payload_bytes(raw)
-        except ValueError as exc:
-            raise HTTPException(status_code=400, detail=str(exc))
-        topics_list = [t.strip() for t in topics.split(",") if t.strip()] if topics else None
-        mto = _parse_max_tokens_override(max_tokens_override, topics_list)
-        results = run_preview(payload, topics=topics_list, max_tokens_override=mto)
+        payload, topics_list, mto, layout = await _read_preview_form(file, topics, max_tokens_override, layout,
+                                                                           combined)
+        results = await run_preview(payload, topics=topics_list, max_tokens_override=mto, layout=layout,
+                                    combined=combined, bypass_cache=bypass_cache)
         batch_id = f"preview-{uuid.uuid4().hex[:8]}"
-        out_dir = ensure_output_dir(batch_id)
-        lines = []
-        for r in results:
-            cid = r.get("custom_id") or "no_custom_id"
-            content = r.get("output_text") or r.get("error") or ""
-            obj = {
-                "id": f"preview_req_{uuid.uuid4().hex[:12]}",
-                "custom_id": cid,
-                "response": {
-                    "status_code": 200 if r.get("error") is None else 500,
-                    "request_id": uuid.uuid4().hex,
-                    "body": {"choices": [{"message": {"content": content}}]},
-                },
-                "error": None if r.get("error") is None else {"message": r.get("error")},
-            }
-            lines.append(json.dumps(obj, ensure_ascii=False))
-        (out_dir / "output.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
-        parse_result = parse_output(batch_id, force=True) if do_parse else None
+        out_dir = await asyncio.to_thread(_write_preview_output, batch_id, results)
+        parse_result = await asyncio.to_thread(parse_output, batch_id, force=True) if do_parse else None
         return PreviewFullResponse(
             items=[PreviewItem(**r) for r in results],
             total=len(results),
             batch_id=batch_id,
-            output_dir=str(out_dir),
+            output_dir=out_dir,
+            usage_by_topic=summarize_usage(results),
             parse=parse_result,
         )
     except HTTPException:
         raise
     except Exception as e:
         raise as_http_error(e)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post(
+    "/payload-file/stream",
+    summary="Preview completo em streaming (server-sent events)",
+    description=(
+        "Mesmos campos de /preview/payload-file/full, mas a resposta é text/event-stream e o texto chega "
+        "enquanto o modelo gera (chat completions com stream=true, tópicos em paralelo). Eventos: "
+        "`start` (batch_id e tópicos), `delta` (custom_id, topic, text), `topic_done` (PreviewItem do tópico), "
+        "`done` (PreviewFullResponse, depois de gravar output.jsonl e rodar o parser) e `error` em falha geral. "
+        "Respostas em cache chegam num único `delta`; bypass_cache=true ignora o cache."
+    ),
+)
+async def preview_payload_file_stream(
+    file: UploadFile = File(...),
+    topics: str | None = Form(default=None),
+    max_tokens_override: str | None = Form(default=None),
+    do_parse: bool = Form(default=True),
+    layout: str | None = Form(default=None),
+    combined: bool = Form(default=False),
+    bypass_cache: bool = Form(default=False),
+) -> StreamingResponse:
+    try:
+        payload, topics_list, mto, layout = await _read_preview_form(file, topics, max_tokens_override, layout,
+                                                                           combined)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise as_http_error(e)
+    batch_id = f"preview-{uuid.uuid4().hex[:8]}"
+
+    async def _stream():
+        try:
+            async for kind, data in stream_preview(payload, topics=topics_list, max_tokens_override=mto,
+                                                   layout=layout, combined=combined, bypass_cache=bypass_cache):
+                if kind == "start":
+                    data = {**data, "batch_id": batch_id}
+                elif kind == "topic_done":
+                    data = PreviewItem(**data).model_dump()
+                elif kind == "done":
+                    results = data["items"]
+                    out_dir = await asyncio.to_thread(_write_preview_output, batch_id, results)
+                    parse_result = await asyncio.to_thread(parse_output, batch_id, force=True) if do_parse else None
+                    data = PreviewFullResponse(
+                        items=[PreviewItem(**r) for r in results],
+                        total=len(results),
+                        batch_id=batch_id,
+                        output_dir=out_dir,
+                        usage_by_topic=summarize_usage(results),
+                        parse=parse_result,
+                    ).model_dump()
+                yield _sse(kind, data)
+        except Exception as e:  # a resposta já começou (200): o erro vai como evento
+            err = as_http_error(e)
+            yield _sse("error", {"status_code": err.status_code, "detail": err.detail})
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from pydantic import BaseModel
 
 
@@ -8,6 +8,7 @@ class SubmitRequest(BaseModel):
     input_path: str
     job_name: Optional[str] = None
     completion_window: str = "24h"
+    priority: int = 0
 
 
 class WaitRequest(BaseModel):
@@ -22,18 +23,42 @@ class BatchStatusResponse(BaseModel):
 class SubmitResponse(BaseModel):
     batch_id: str
     output_dir: str
+    batch_ids: List[str] = []
 
 
 class DownloadResponse(BaseModel):
     output_dir: str
     output_file: Optional[str] = None
     error_file: Optional[str] = None
+    output_bytes: Optional[int] = None
+    error_bytes: Optional[int] = None
+    batch_status: Optional[str] = None
 
 
 class RunPayloadFileResponse(BaseModel):
     batch_id: str
+    batch_ids: List[str] = []
     download: DownloadResponse
     parse_docs_dir: Optional[str] = None
     parse_processed: int = 0
     parse_skipped: int = 0
+    parse_failed: int = 0
+    parse_missing: int = 0
     parse_index_file: Optional[str] = None
+    retry_batch_ids: List[str] = []
+
+
+class BatchRecord(BaseModel):
+    batch_id: str
+    job_id: Optional[str] = None
+    input_path: Optional[str] = None
+    input_file_id: Optional[str] = None
+    status: Optional[str] = None
+    stage: str
+    request_counts: Dict[str, Any] = {}
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    data: Dict[str, Any] = {}
+    est_tokens: Optional[int] = None
+    created_at: float
+    updated_at: float
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from typing import Optional, Dict, Any, List
+from pydantic import BaseModel
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    stage: str
+    status_url: str
+    events_url: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    stage: str
+    batch_ids: List[str] = []
+    batch_status: Dict[str, Optional[str]] = {}
+    request_counts: Dict[str, Dict[str, int]] = {}
+    progress: Dict[str, int] = {}
+    timings: Dict[str, float] = {}
+    elapsed: float = 0.0
+    created_at: float
+    updated_at: float
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
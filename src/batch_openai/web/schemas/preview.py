@@ -7,10 +7,15 @@ from pydantic import BaseModel
 
 class PreviewItem(BaseModel):
     custom_id: str
+    topic: Optional[str] = None
     output_text: Optional[str] = None
     error: Optional[str] = None
     request_body: Dict[str, Any]
     usage: Optional[Dict[str, Any]] = None
+    cached_tokens: int = 0
+    latency_ms: Optional[int] = None
+    first_token_ms: Optional[int] = None
+    cache_hit: bool = False
 
 
 class PreviewFullResponse(BaseModel):
@@ -18,4 +23,5 @@ class PreviewFullResponse(BaseModel):
     total: int
     batch_id: str
     output_dir: str
+    usage_by_topic: Dict[str, Dict[str, Any]] = {}
     parse: Optional[Dict[str, Any]] = None
@@ -0,0 +1,62 @@
+"""Regressão da recuperação tolerante de JSON (utils.payloads.decode_payload_bytes)."""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from batch_openai.utils import payloads as pl  # noqa: E402
+
+REGRESSION_CASES = [
+    ('{"a": 1}', {"a": 1}),
+    ('﻿{"a": 1}', {"a": 1}),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+    ('{\n  // comentário\n  "a": 1, /* bloco */ "b": 2\n}', {"a": 1, "b": 2}),
+    ('# cabeçalho\n{"a": 1}', {"a": 1}),
+    ('{"url": "http://x/y", "a": 1,}', {"url": "http://x/y", "a": 1}),
+    ('{"s": "/* não é comentário */", "t": "a // b",}', {"s": "/* não é comentário */", "t": "a // b"}),
+    ('{**"a"**: 1}', {"a": 1}),
+    ('{“a”: “b”}', {"a": "b"}),
+    ('{"a":\x00 1\x07}', {"a": 1}),
+    ('Segue o payload:\n```json\n{"a": {"b": [1, 2]}}\n```\nobrigado', {"a": {"b": [1, 2]}}),
+    ('lixo { sem fim\n{"a": 1}', {"a": 1}),
+    ('texto "com aspas soltas\n{"a": "}"}', {"a": "}"}),
+    ('[1, 2, 3] e depois {"a": 1}', {"a": 1}),
+    ('resposta: [1, 2, 3]', [1, 2, 3]),
+    ('{"a": 1, // vírgula antes de comentário\n}', {"a": 1}),
+    ('["a", {"b":1}, oops]', {"b": 1}),
+    ('{"x": oops, "y": {"b": 1}}', {"b": 1}),
+]
+
+
+@pytest.mark.parametrize("text,expected", REGRESSION_CASES)
+def test_decode_recovers_payload(text, expected):
+    assert pl.decode_payload_bytes(text.encode("utf-8")) == expected
+
+
+def test_decode_rejects_non_json():
+    with pytest.raises(ValueError):
+        pl.decode_payload_bytes("sem json aqui".encode("utf-8"))
+
+
+def _pathological_inputs(target_bytes):
+    """Muitas aberturas sem fechamento, objeto truncado e comentários + vírgulas entre blocos."""
+    yield "{[" * (target_bytes // 2)
+    unit = '{"k": "v", "n": [1, 2, 3], '
+    yield "{" + unit * (target_bytes // len(unit))
+    item = '{"name": "dep", "node_lines": 10, "content": "If x Then Call Y()"}, // comentário\n'
+    yield '/* gerado */ {"deps": [\n' + item * (target_bytes // len(item)) + "],\n}"
+
+
+@pytest.mark.parametrize("text", list(_pathological_inputs(64 * 1024)), ids=["aberturas", "truncado", "comentarios"])
+def test_decode_pathological_inputs_stay_linear(text):
+    # a varredura quadrática levava minutos nesse tamanho; a passada única leva milissegundos
+    # (o json5 opcional, em Python puro, domina o caso com comentários, mas também é linear)
+    t0 = time.perf_counter()
+    try:
+        pl.decode_payload_bytes(text.encode("utf-8"))
+    except ValueError:
+        pass
+    assert time.perf_counter() - t0 < 5.0